@@ -0,0 +1,210 @@
+import argparse
+import copy
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from cache_dati import save_cache, cached_deltas, file_fingerprint, CACHE_DIR
+from dataset import SmartCityData, load_dataset
+from ingestione import read_workbook, COLONNE_FINANZIAMENTI
+from utils import (prepare_city_features, clean_regions, compact_mode, source_files, find_cleaned_output,
+                   FINANZIAMENTI_XLSX, FOGLIO_FINANZIAMENTI, COMPACT_CACHE_DIR, CLEANED_DIR)
+
+
+def read_city_delta(path):
+    """Legge un CSV di nuove città con lo schema di cities.csv."""
+    return pd.read_csv(path)
+
+
+def read_funding_delta(path, foglio=FOGLIO_FINANZIAMENTI):
+    """Legge nuovi finanziamenti da un file Excel (foglio dei finanziamenti), Parquet o CSV."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        return read_workbook(path, {foglio: COLONNE_FINANZIAMENTI})[foglio]
+    if extension == '.parquet':
+        return pd.read_parquet(path, columns=COLONNE_FINANZIAMENTI)
+    return pd.read_csv(path, usecols=COLONNE_FINANZIAMENTI)
+
+
+def _append(existing, new):
+    """
+    Accoda new a existing mantenendo categoriche le colonne che lo sono già.
+    L'indice viene rinumerato da 0, come in un caricamento da zero.
+    """
+    new = new.reindex(columns=existing.columns)
+    for col in existing.columns:
+        if isinstance(existing[col].dtype, pd.CategoricalDtype):
+            categories = existing[col].cat.categories.union(pd.Index(new[col].dropna().unique()))
+            existing = existing.assign(**{col: existing[col].cat.set_categories(categories)})
+            new[col] = pd.Categorical(new[col], categories=categories)
+        elif col in new.columns and existing[col].dtype != new[col].dtype and \
+                pd.api.types.is_numeric_dtype(existing[col]) and pd.api.types.is_numeric_dtype(new[col]):
+            new[col] = new[col].astype(existing[col].dtype)
+    return pd.concat([existing, new], ignore_index=True)
+
+
+def update_cities(data, delta, report):
+    """
+    Normalizza e accoda le nuove città. Lo scaler viene aggiornato con
+    partial_fit; le città esistenti vengono rinormalizzate solo nelle
+    colonne i cui limiti min/max sono cambiati.
+    Restituisce (df, scaler, indice di similarità).
+    """
+    columns = data.numerical_columns
+    delta = prepare_city_features(delta)
+    delta = delta.dropna(subset=columns)
+    known = set(data.df['City'])
+    duplicated = delta['City'].isin(known) | delta['City'].duplicated()
+    report['città scartate (già presenti)'] = int(duplicated.sum())
+    delta = delta[~duplicated]
+    report['città aggiunte'] = len(delta)
+    if delta.empty:
+        report['riutilizzati'] += ['scaler', 'città', 'indice similarità']
+        return data.df, data.scaler, data.similarity_index
+
+    # Copia dello scaler: quello corrente resta valido per le analisi in corso
+    scaler = copy.deepcopy(data.scaler)
+    raw = delta[columns].to_numpy(dtype=np.float64)
+    old_min, old_max = scaler.data_min_.copy(), scaler.data_max_.copy()
+    scaler.partial_fit(raw)
+    changed = [col for j, col in enumerate(columns)
+               if scaler.data_min_[j] != old_min[j] or scaler.data_max_[j] != old_max[j]]
+
+    df = data.df
+    if changed:
+        # x_nuovo = valore_grezzo * scala_nuova + min_nuovo, con valore_grezzo = (x - min_vecchio) / scala_vecchia
+        positions = [columns.index(col) for col in changed]
+        old = data.scaler
+        ratio = scaler.scale_[positions] / old.scale_[positions]
+        shift = scaler.min_[positions] - old.min_[positions] * ratio
+        df = df.copy()
+        values = df[changed].to_numpy(dtype=np.float64) * ratio + shift
+        df[changed] = values.astype(df[changed[0]].dtype)
+        report['ricostruiti'].append(f"normalizzazione città esistenti ({len(changed)} colonne: {', '.join(changed)})")
+    else:
+        report['riutilizzati'].append('normalizzazione città esistenti (limiti min/max invariati)')
+
+    delta = delta.copy()
+    delta[columns] = scaler.transform(raw).astype(data.df[columns[0]].dtype)
+    n_existing = len(df)
+    df = _append(df, delta)
+    similarity_index = data.similarity_index.extended(df, scaler, n_existing, changed)
+    report['ricostruiti'].append(f"indice similarità: {len(delta)} città accodate"
+                                 + (f", {len(changed)} colonne ricalcolate" if changed else ""))
+    return df, scaler, similarity_index
+
+
+def update_funding(data, delta, report):
+    """
+    Accoda i nuovi finanziamenti con la stessa pulizia di load_data e
+    aggiorna l'indice per (provincia, categoria) solo con le righe nuove.
+    Come per le città, i finanziamenti già presenti (stesso
+    Operation_Unique_Identifier) vengono scartati: riapplicare lo stesso
+    file non raddoppia righe e totali.
+    Restituisce (finanziamenti, province, indice dei finanziamenti).
+    """
+    delta = delta[COLONNE_FINANZIAMENTI].copy()
+    # Le righe senza identificativo non si possono confrontare e vengono sempre accodate
+    has_id = delta['Operation_Unique_Identifier'].notna().to_numpy()
+    ids = delta['Operation_Unique_Identifier'].astype(str)
+    known = data.finanziamenti_eu_df['Operation_Unique_Identifier'].dropna().astype(str).unique()
+    duplicated = has_id & (ids.isin(known) | ids.duplicated()).to_numpy()
+    report['finanziamenti scartati (già presenti)'] = int(duplicated.sum())
+    delta = delta[~duplicated]
+    delta['Region3'] = clean_regions(delta['Region3'])
+    report['finanziamenti aggiunti'] = len(delta)
+    if delta.empty:
+        report['riutilizzati'] += ['finanziamenti', 'indice finanziamenti']
+        return data.finanziamenti_eu_df, data.province, data.funding_index
+
+    funding = data.finanziamenti_eu_df
+    n_existing = len(funding)
+    funding = _append(funding, delta)
+    province = sorted(set(data.province) | set(delta['Region3'].astype(str)))
+    new_provinces = len(province) - len(data.province)
+    funding_index = data.funding_index.extended(funding, n_existing)
+    report['ricostruiti'].append(f"indice finanziamenti: {len(delta)} righe accodate, "
+                                 f"{new_provinces} nuove province")
+    return funding, province, funding_index
+
+
+def apply_delta(data, cities_path=None, funding_path=None, save=True, compact=None):
+    """
+    Applica gli aggiornamenti incrementali ai dataset già caricati (SmartCityData)
+    e, se save è vero, alla cache su disco. I dataset e gli indici di data non
+    vengono modificati: viene restituito un nuovo SmartCityData (con una nuova
+    generazione) insieme al resoconto di cosa è stato ricostruito o riutilizzato.
+    """
+    start = time.perf_counter()
+    report = {'ricostruiti': [], 'riutilizzati': []}
+
+    df, scaler, similarity_index = data.df, data.scaler, data.similarity_index
+    if cities_path is not None:
+        df, scaler, similarity_index = update_cities(data, read_city_delta(cities_path), report)
+    else:
+        report['riutilizzati'] += ['scaler', 'città', 'indice similarità']
+
+    funding, province, funding_index = data.finanziamenti_eu_df, data.province, data.funding_index
+    if funding_path is not None:
+        funding, province, funding_index = update_funding(data, read_funding_delta(funding_path), report)
+    else:
+        report['riutilizzati'] += ['finanziamenti', 'indice finanziamenti']
+    report['riutilizzati'] += ['progetti', 'indice progetti', 'categorie']
+
+    updated = SmartCityData(
+        (df, data.progetti_df, funding, data.categorie_df, scaler, data.numerical_columns, province),
+        similarity_index=similarity_index, project_index=data.project_index, funding_index=funding_index
+    )
+
+    if save:
+        cache_dir = COMPACT_CACHE_DIR if compact_mode(compact) else CACHE_DIR
+        deltas = cached_deltas(cache_dir)
+        for path in (cities_path, funding_path):
+            if path is not None:
+                deltas.append({'path': os.path.abspath(path), **file_fingerprint(path),
+                               'applied': time.strftime('%Y-%m-%dT%H:%M:%S')})
+        sources = source_files(find_cleaned_output(FINANZIAMENTI_XLSX, CLEANED_DIR))
+        save_cache(updated.as_tuple(), sources, cache_dir=cache_dir, deltas=deltas)
+        report['ricostruiti'].append(f"cache su disco ({cache_dir})")
+
+    report['secondi'] = time.perf_counter() - start
+    return updated, report
+
+
+def format_delta_report(report):
+    """Resoconto leggibile di apply_delta."""
+    lines = [f"Aggiornamento incrementale completato in {report['secondi']:.2f} s"]
+    for key in ('città aggiunte', 'città scartate (già presenti)', 'finanziamenti aggiunti',
+                'finanziamenti scartati (già presenti)'):
+        if key in report:
+            lines.append(f"- {key.capitalize()}: {report[key]}")
+    lines.append("Ricostruiti:")
+    lines += [f"  - {item}" for item in report['ricostruiti']] or ["  (nessuno)"]
+    lines.append("Riutilizzati:")
+    lines += [f"  - {item}" for item in report['riutilizzati']]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Aggiunge nuove città e finanziamenti ai dataset e alla cache senza ricaricarli da zero"
+    )
+    parser.add_argument('--citta', help="CSV di nuove città (schema di cities.csv)")
+    parser.add_argument('--finanziamenti', help="Nuovi finanziamenti (.xlsx, .parquet o .csv)")
+    parser.add_argument('--compatto', action='store_true', help="Aggiorna la cache della modalità compatta")
+    args = parser.parse_args(argv)
+    if args.citta is None and args.finanziamenti is None:
+        parser.error("indicare almeno --citta o --finanziamenti")
+
+    compact = True if args.compatto else None
+    data = load_dataset(compact=compact)
+    _, report = apply_delta(data, args.citta, args.finanziamenti, save=True, compact=compact)
+    print(format_delta_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+import argparse
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from cache_dati import cached_deltas, CACHE_DIR
+from dataset import SmartCityData, load_dataset
+from indici import FundingIndex, ProjectIndex
+from pesi import active_profile, active_weights, weight_vector
+from registro import get_logger
+from similarita import SimilarityIndex
+from utils import (source_files, find_cleaned_output, compact_mode, FINANZIAMENTI_XLSX, CLEANED_DIR,
+                   COMPACT_CACHE_DIR)
+
+# Cartella e versione del formato dell'archivio mappato in memoria
+STORE_DIR = '.archivio_condiviso'
+STORE_VERSION = 2
+META_FILE = 'meta.json'
+
+# Array salvati come .npy (caricati con mmap in sola lettura)
+ARRAY_FILES = {
+    'features_t': 'features_t.npy',
+    'cities': 'cities.npy',
+    'funding_ids': 'funding_ids.npy',
+    'funding_expenditure': 'funding_expenditure.npy',
+    'funding_budget': 'funding_budget.npy',
+    'funding_region': 'funding_region.npy',
+    'funding_category': 'funding_category.npy',
+    'funding_offsets': 'funding_offsets.npy',
+}
+# Oggetti piccoli, letti per intero da ogni processo
+PICKLE_FILES = {
+    'progetti_df': 'progetti.pkl',
+    'categorie_df': 'categorie.pkl',
+    'scaler': 'scaler.pkl',
+}
+
+log = get_logger(__name__)
+
+
+class MappedFundingTable:
+    """
+    Finanziamenti su array mappati in memoria, con la parte dell'interfaccia
+    di DataFrame usata da FundingIndex e FundingResultSet: colonne come
+    Series senza copie e take() per le sole righe di una pagina.
+    """
+
+    columns = ['Operation_Unique_Identifier', 'Region3', 'Total_Eligible_Expenditure_amount',
+               'Project_EU_Budget', 'Category_Label']
+
+    def __init__(self, arrays, regions, categories):
+        self._ids = arrays['funding_ids']
+        self._numeric = {
+            'Total_Eligible_Expenditure_amount': arrays['funding_expenditure'],
+            'Project_EU_Budget': arrays['funding_budget'],
+        }
+        self._codes = {'Region3': arrays['funding_region'], 'Category_Label': arrays['funding_category']}
+        self._categories = {'Region3': pd.Index(regions, dtype=object),
+                            'Category_Label': pd.Index(categories, dtype=object)}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _column(self, col, positions=None):
+        if col in self._numeric:
+            values = self._numeric[col]
+            return values if positions is None else values[positions]
+        if col in self._codes:
+            codes = self._codes[col] if positions is None else self._codes[col][positions]
+            return pd.Categorical.from_codes(codes, categories=self._categories[col])
+        if col == 'Operation_Unique_Identifier':
+            ids = self._ids if positions is None else self._ids[positions]
+            return np.char.decode(ids, 'utf-8')
+        raise KeyError(col)
+
+    def __getitem__(self, col):
+        return pd.Series(self._column(col), name=col, copy=False)
+
+    def take(self, positions):
+        positions = np.asarray(positions, dtype=np.intp)
+        return pd.DataFrame({col: self._column(col, positions) for col in self.columns})
+
+
+def _fingerprints(sources):
+    """Dimensione e mtime dei file sorgente (senza hash: il controllo deve essere immediato)."""
+    fingerprints = {}
+    for path in sources:
+        stat = os.stat(path)
+        fingerprints[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    return fingerprints
+
+
+def _current_sources():
+    return source_files(find_cleaned_output(FINANZIAMENTI_XLSX, CLEANED_DIR))
+
+
+def _current_deltas(compact=None):
+    """Aggiornamenti incrementali di aggiornamenti.py inclusi nella cache dei dati."""
+    return cached_deltas(COMPACT_CACHE_DIR if compact_mode(compact) else CACHE_DIR)
+
+
+def _codes(column):
+    """Codici interi e categorie (come stringhe) di una colonna di finanziamenti."""
+    categorical = pd.Categorical(column)
+    return categorical.codes.astype(np.int32), [str(c) for c in categorical.categories]
+
+
+def export_store(data, directory=STORE_DIR, sources=None, deltas=None, compact=None):
+    """
+    Scrive in directory la matrice pesata delle caratteristiche (feature ×
+    città, float32), i nomi delle città a larghezza fissa, le colonne dei
+    finanziamenti e i gruppi dell'indice dei finanziamenti come file .npy
+    allineati. La cartella viene sostituita in modo atomico.
+    deltas elenca gli aggiornamenti incrementali inclusi in data (per
+    default quelli della cache dei dati, normale o compatta).
+    """
+    start = time.perf_counter()
+    index = data.similarity_index
+    funding = data.finanziamenti_eu_df
+    sources = _current_sources() if sources is None else sources
+    deltas = _current_deltas(compact) if deltas is None else deltas
+
+    region_codes, regions = _codes(funding['Region3'])
+    category_codes, categories = _codes(funding['Category_Label'])
+    ids = funding['Operation_Unique_Identifier'].astype(str).str.encode('utf-8').to_numpy()
+
+    groups = []
+    offsets = []
+    position = 0
+    for (provincia, category), group in data.funding_index.offsets.items():
+        totals = data.funding_index.totals[(provincia, category)]
+        groups.append([str(provincia), category, position, position + len(group),
+                       {key: (int(value) if key == 'count' else float(value)) for key, value in totals.items()}])
+        offsets.append(group)
+        position += len(group)
+
+    arrays = {
+        'features_t': np.ascontiguousarray(index.features_t, dtype=np.float32),
+        'cities': np.asarray(index.cities, dtype=str),
+        'funding_ids': ids.astype(bytes) if len(ids) else np.empty(0, dtype='S1'),
+        'funding_expenditure': funding['Total_Eligible_Expenditure_amount'].to_numpy(dtype=np.float64),
+        'funding_budget': funding['Project_EU_Budget'].to_numpy(dtype=np.float64),
+        'funding_region': region_codes,
+        'funding_category': category_codes,
+        'funding_offsets': np.concatenate(offsets).astype(np.intp) if offsets else np.empty(0, dtype=np.intp),
+    }
+    objects = {'progetti_df': data.progetti_df, 'categorie_df': data.categorie_df, 'scaler': data.scaler}
+
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.archivio_tmp_', dir=parent)
+    try:
+        for name, filename in ARRAY_FILES.items():
+            np.save(os.path.join(tmp_dir, filename), arrays[name], allow_pickle=False)
+        for name, filename in PICKLE_FILES.items():
+            with open(os.path.join(tmp_dir, filename), 'wb') as f:
+                pickle.dump(objects[name], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        meta = {
+            'version': STORE_VERSION,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'sources': _fingerprints(sources),
+            'deltas': list(deltas),
+            'numerical_columns': list(index.numerical_columns),
+            'weights': index.weights.tolist(),
+            'weights_profile': active_profile(),
+            'province': [str(p) for p in data.province],
+            'regions': regions,
+            'categories': categories,
+            'funding_provinces': sorted(str(p) for p in data.funding_index.provinces),
+            'funding_groups': groups,
+        }
+        with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.replace(tmp_dir, directory)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    size = sum(arr.nbytes for arr in arrays.values()) / 2 ** 20
+    log.info("Archivio mappato scritto in %s: %.1f MB in %.2f s", directory, size, time.perf_counter() - start)
+    return meta
+
+
+def load_store(directory=STORE_DIR, check_sources=True, compact=None):
+    """
+    Carica l'archivio con gli array mappati in memoria in sola lettura: i
+    processi che lo aprono condividono le stesse pagine della page cache.
+    Restituisce un SmartCityData oppure None se l'archivio manca, è di
+    un'altra versione, è stato creato con pesi diversi da quelli del profilo
+    attivo o (con check_sources) i file sorgente sono cambiati o la cache
+    dei dati (normale o compatta, secondo compact) contiene aggiornamenti
+    incrementali diversi da quelli dell'archivio.
+    La tabella delle città non viene ricostruita: data.df vale None e le
+    ricerche usano l'indice di similarità.
+    """
+    try:
+        with open(os.path.join(directory, META_FILE), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        log.info("Archivio mappato assente in %s", directory)
+        return None
+
+    columns = meta['numerical_columns']
+    if meta.get('version') != STORE_VERSION:
+        log.info("Archivio mappato di un'altra versione in %s", directory)
+        return None
+    if not np.allclose(meta['weights'], weight_vector(active_weights(), columns).astype(np.float32)):
+        log.info("Archivio mappato creato con pesi diversi dal profilo attivo (%s)", active_profile())
+        return None
+    if check_sources:
+        try:
+            stale = _fingerprints(_current_sources()) != meta['sources']
+        except OSError:
+            stale = True
+        if stale:
+            log.info("Archivio mappato non aggiornato rispetto ai file sorgente")
+            return None
+        if meta.get('deltas', []) != _current_deltas(compact):
+            log.info("Archivio mappato non aggiornato rispetto agli aggiornamenti incrementali della cache")
+            return None
+
+    arrays = {name: np.load(os.path.join(directory, filename), mmap_mode='r', allow_pickle=False)
+              for name, filename in ARRAY_FILES.items()}
+    objects = {}
+    for name, filename in PICKLE_FILES.items():
+        with open(os.path.join(directory, filename), 'rb') as f:
+            objects[name] = pickle.load(f)
+
+    scaler = objects['scaler']
+    funding = MappedFundingTable(arrays, meta['regions'], meta['categories'])
+    similarity_index = SimilarityIndex.from_arrays(
+        arrays['features_t'], arrays['cities'], scaler, columns, meta['weights']
+    )
+    funding_index = FundingIndex.from_arrays(
+        funding, objects['categorie_df'], meta['funding_provinces'], arrays['funding_offsets'],
+        meta['funding_groups']
+    )
+    return SmartCityData(
+        (None, objects['progetti_df'], funding, objects['categorie_df'], scaler, columns, meta['province']),
+        similarity_index=similarity_index, project_index=ProjectIndex(objects['progetti_df']),
+        funding_index=funding_index
+    )
+
+
+def load_shared_dataset(directory=STORE_DIR, force_rebuild=False, compact=None):
+    """
+    Carica i dati dall'archivio mappato; se manca o non è aggiornato li
+    carica con load_dataset, scrive l'archivio e lo riapre mappato.
+    """
+    if not force_rebuild:
+        data = load_store(directory, compact=compact)
+        if data is not None:
+            return data
+    # Aggiornamenti letti prima dei dati: se ne arriva uno nel frattempo l'archivio risulta non aggiornato
+    deltas = _current_deltas(compact)
+    export_store(load_dataset(force_rebuild=force_rebuild, compact=compact), directory, deltas=deltas)
+    return load_store(directory, check_sources=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Esporta i dataset in un archivio di array mappati in memoria, condiviso tra processi"
+    )
+    parser.add_argument('--uscita', default=STORE_DIR, help="Cartella dell'archivio")
+    parser.add_argument('--ricostruisci-cache', action='store_true', help="Ricostruisce la cache dei dati")
+    parser.add_argument('--compatto', action='store_true', help="Carica i dataset in modalità compatta")
+    args = parser.parse_args(argv)
+
+    compact = True if args.compatto else None
+    data = load_dataset(force_rebuild=args.ricostruisci_cache, compact=compact)
+    meta = export_store(data, args.uscita, compact=compact)
+    start = time.perf_counter()
+    load_store(args.uscita, compact=compact)
+    print(f"Archivio salvato in {args.uscita}: {len(data.similarity_index)} città, "
+          f"{len(data.finanziamenti_eu_df)} finanziamenti, {len(meta['funding_groups'])} gruppi; "
+          f"apertura in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils import prepare_city_features, extract_temperatures, NUMERICAL_COLUMNS
+from dataset import load_dataset
+from archivio import load_store, load_shared_dataset, STORE_DIR
+from pipeline import recommend_batch
+from profilazione import profile_run, configure_profiling, profiling_directory
+from pesi import configure_weights, active_profile
+from metriche import configure_metric, active_metric, active_normalization, METRICHE, NORMALIZZAZIONI
+
+# Colonne richieste oltre a quelle di cities.csv
+REQUEST_COLUMNS = ['smart_city_scope', 'duration', 'provincia', 'budget']
+
+# Dataset condiviso dai processi worker
+_DATA = None
+
+
+def _init_worker(force_rebuild, profile_dir=None, compact=None, weights_profile=None, store=None,
+                 metric=None, normalization=None):
+    """
+    Inizializza un worker senza fork caricando i dataset (dalla cache),
+    oppure mappando l'archivio condiviso già aggiornato dal processo principale.
+    """
+    global _DATA
+    configure_profiling(profile_dir)
+    configure_weights(weights_profile)
+    configure_metric(metric, normalization)
+    if _DATA is None and store is not None:
+        _DATA = load_store(store, check_sources=False)
+    if _DATA is None:
+        _DATA = load_dataset(force_rebuild=force_rebuild, compact=compact)
+
+
+def _process_chunk(chunk, k):
+    """Elabora un blocco di città candidate nel processo worker."""
+    rows, features = chunk
+    valid = [i for i, row in enumerate(rows) if row['error'] is None]
+    results = [None] * len(rows)
+    if valid:
+        with profile_run('batch_blocco', first_city=rows[0]['City'], rows=len(rows), k=k):
+            recommendations = recommend_batch(_DATA, features[valid], [rows[i] for i in valid], k=k)
+        for i, recommendation in zip(valid, recommendations):
+            results[i] = recommendation
+
+    output = []
+    for row, recommendation in zip(rows, results):
+        record = {col: row[col] for col in ['City', *REQUEST_COLUMNS]}
+        record['error'] = row['error']
+        if recommendation is not None:
+            record.update(recommendation)
+        output.append(record)
+    return output
+
+
+def _safe_temperatures(clima):
+    try:
+        return extract_temperatures(str(clima))
+    except ValueError:
+        return np.nan, np.nan
+
+
+def read_candidates(path):
+    """
+    Legge il CSV delle città candidate e converte le caratteristiche nelle
+    colonne numeriche di NUMERICAL_COLUMNS. Le righe non valide vengono
+    segnalate nel campo error invece di interrompere l'elaborazione.
+    """
+    raw = pd.read_csv(path)
+    missing = [col for col in REQUEST_COLUMNS if col not in raw.columns]
+    if missing:
+        raise ValueError(f"Colonne mancanti nel file di input: {missing}")
+    if 'City' not in raw.columns:
+        raw['City'] = [f"Riga {i + 1}" for i in range(len(raw))]
+
+    # Un valore di clima non valido invalida solo la propria riga
+    if 'Temp_Min' not in raw.columns or 'Temp_Max' not in raw.columns:
+        raw[['Temp_Min', 'Temp_Max']] = pd.DataFrame(
+            [_safe_temperatures(clima) for clima in raw['Clima (range annuale)']],
+            columns=['Temp_Min', 'Temp_Max'], index=raw.index
+        )
+    prepared = prepare_city_features(raw)
+    values = prepared[NUMERICAL_COLUMNS].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    # Valori mancanti, infiniti o fuori dal limite di float32 invalidano la riga
+    with np.errstate(over='ignore'):
+        features = values.astype(np.float32)
+    invalid = ~np.isfinite(features).all(axis=1)
+
+    rows = []
+    for i, record in enumerate(raw[['City', *REQUEST_COLUMNS]].to_dict('records')):
+        record = {key: (None if pd.isna(value) else value) for key, value in record.items()}
+        record['City'] = str(record['City'])
+        record['error'] = "Caratteristiche mancanti o non valide" if invalid[i] else None
+        rows.append(record)
+    return rows, np.nan_to_num(features)
+
+
+def _csv_record(record):
+    """Appiattisce un risultato per l'output CSV."""
+    flat = {key: value for key, value in record.items()
+            if key not in ('similar_cities', 'perfect_projects', 'partial_projects')}
+    flat['similar_cities'] = "; ".join(
+        f"{c['city']} ({c['similarity']:.2f}%)" for c in record.get('similar_cities', [])
+    )
+    flat['similarity_explanations'] = "; ".join(
+        f"{c['city']}: " + ", ".join(f"{col} {share:.0%}" for col, share in c['main_differences'].items())
+        for c in record.get('similar_cities', []) if c.get('main_differences')
+    )
+    for key in ('perfect_projects', 'partial_projects'):
+        flat[key] = "; ".join(f"{p['name']} [{p['city']}]" for p in record.get(key, []))
+    return flat
+
+
+CSV_FIELDS = ['City', *REQUEST_COLUMNS, 'error', 'similar_cities', 'similarity_explanations',
+              'perfect_projects', 'partial_projects', 'funding_count', 'funding_eligible_total',
+              'funding_eu_budget_total', 'funding_message']
+
+
+def run_batch(input_path, output_path, output_format='jsonl', workers=None,
+              chunk_size=256, k=5, force_rebuild=False, compact=None, store=None):
+    """
+    Esegue la pipeline completa per tutte le città del file di input.
+    Con store (cartella di archivio.py) i dataset vengono mappati in memoria
+    e condivisi tra i worker invece di essere caricati da ognuno.
+    """
+    # Con il profiling attivo si profila il processo principale e ogni blocco nei worker
+    with profile_run('batch', input=os.path.basename(input_path), workers=workers,
+                     chunk_size=chunk_size, k=k):
+        return _run_batch(input_path, output_path, output_format, workers, chunk_size, k,
+                          force_rebuild, compact, store)
+
+
+def _run_batch(input_path, output_path, output_format, workers, chunk_size, k, force_rebuild, compact,
+               store=None):
+    global _DATA
+    start = time.perf_counter()
+    if store is not None:
+        _DATA = load_shared_dataset(store, force_rebuild=force_rebuild, compact=compact)
+    else:
+        _DATA = load_dataset(force_rebuild=force_rebuild, compact=compact)
+    rows, features = read_candidates(input_path)
+    chunks = [
+        (rows[i:i + chunk_size], features[i:i + chunk_size])
+        for i in range(0, len(rows), chunk_size)
+    ]
+
+    workers = workers or os.cpu_count() or 1
+    # Con fork i worker ereditano i dataset già caricati senza copiarli né rileggerli
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+
+    n_results = 0
+    n_errors = 0
+    with open(output_path, 'w', encoding='utf-8', newline='') as f:
+        writer = None
+        if output_format == 'csv':
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker,
+                                 initargs=(force_rebuild, profiling_directory(), compact,
+                                           active_profile(), store, active_metric(),
+                                           active_normalization())) as executor:
+            for records in executor.map(_process_chunk, chunks, [k] * len(chunks)):
+                for record in records:
+                    if writer is not None:
+                        writer.writerow(_csv_record(record))
+                    else:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    n_results += 1
+                    n_errors += record['error'] is not None
+
+    elapsed = time.perf_counter() - start
+    print(f"Elaborate {n_results} città ({n_errors} con errori) in {elapsed:.2f} s -> {output_path}")
+    return n_results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Raccomandazioni smart city in batch per un CSV di città candidate"
+    )
+    parser.add_argument('input', help="CSV con le colonne di cities.csv più " + ", ".join(REQUEST_COLUMNS))
+    parser.add_argument('output', help="File di output (.csv o .jsonl)")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                        help="Formato di output (default: dedotto dall'estensione)")
+    parser.add_argument('--workers', type=int, default=None, help="Numero di processi (default: CPU disponibili)")
+    parser.add_argument('--chunk-size', type=int, default=256, help="Città per blocco di lavoro")
+    parser.add_argument('--k', type=int, default=5, help="Numero di città simili per candidata")
+    parser.add_argument('--ricostruisci-cache', action='store_true', help="Ricostruisce la cache dei dati")
+    parser.add_argument('--compatto', action='store_true',
+                        help="Carica i dataset in modalità compatta (float32 e colonne categoriche)")
+    parser.add_argument('--profila', metavar='CARTELLA', default=None,
+                        help="Salva profili cProfile e tracemalloc in CARTELLA (come SMARTCITY_PROFILE)")
+    parser.add_argument('--archivio', metavar='CARTELLA', nargs='?', const=STORE_DIR, default=None,
+                        help=f"Condivide i dataset tra i worker con l'archivio mappato in memoria "
+                             f"(default: {STORE_DIR})")
+    parser.add_argument('--pesi', default=None,
+                        help="Profilo di pesi (nome di pesi.py o file JSON, come SMARTCITY_PESI)")
+    parser.add_argument('--metrica', choices=list(METRICHE), default=None,
+                        help="Metrica di similarità (come SMARTCITY_METRICA, default: euclidea)")
+    parser.add_argument('--normalizzazione', choices=list(NORMALIZZAZIONI), default=None,
+                        help="Similarità normalizzate sulla singola ricerca o sul dataset "
+                             "(come SMARTCITY_NORMALIZZAZIONE, default: ricerca)")
+    args = parser.parse_args(argv)
+    if args.profila:
+        configure_profiling(args.profila)
+    if args.pesi:
+        try:
+            configure_weights(args.pesi)
+        except ValueError as e:
+            parser.error(str(e))
+    configure_metric(args.metrica, args.normalizzazione)
+
+    output_format = args.format or ('csv' if args.output.lower().endswith('.csv') else 'jsonl')
+    run_batch(args.input, args.output, output_format, args.workers, args.chunk_size,
+              args.k, args.ricostruisci_cache, True if args.compatto else None, args.archivio)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import utils
+from dati_sintetici import generate_dataset, SCOPES, DURATIONS
+from similarita import SimilarityIndex
+from indici import ProjectIndex, FundingIndex
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+# Soglia di regressione predefinita: +20% rispetto al riferimento
+DEFAULT_THRESHOLD = 0.20
+# Sotto questa durata (secondi) le differenze sono considerate rumore
+NOISE_FLOOR = 0.0005
+# Differenze di memoria di picco sotto questa soglia (MB) sono ignorate
+MEMORY_NOISE_MB = 0.1
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def measure(func, repeat):
+    """Esegue func repeat volte; restituisce i tempi in secondi e il picco di memoria in byte."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    # Il picco di memoria si misura in un'esecuzione separata: tracemalloc rallenta il codice
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return times, peak
+
+
+def benchmark_cases(n_queries, seed):
+    """
+    Casi misurati: (nome, funzione di preparazione). La preparazione riceve
+    i dati caricati e restituisce la funzione da cronometrare.
+    """
+    rng = np.random.default_rng(seed)
+
+    def queries(data):
+        df = data[0]
+        raw = pd.DataFrame(data[4].inverse_transform(df[data[5]]), columns=data[5])
+        rows = rng.integers(0, len(raw), n_queries)
+        return raw.to_numpy()[rows] * rng.normal(1, 0.05, (n_queries, len(data[5])))
+
+    def similar(data, index):
+        qs = queries(data)
+        df, scaler, cols = data[0], data[4], data[5]
+        return lambda: [utils.find_most_similar_cities(q, df, scaler, cols, index=index) for q in qs]
+
+    def best_project(data, index):
+        similar_cities = [utils.find_most_similar_cities(q, data[0], data[4], data[5], index=index)
+                          for q in queries(data)]
+        project_index = ProjectIndex(data[1])
+        requests = [(s, rng.choice(SCOPES), rng.choice(DURATIONS)) for s in similar_cities]
+        return lambda: [utils.find_best_project(s, scope, duration, data[1], project_index=project_index)
+                        for s, scope, duration in requests]
+
+    def funding(data, index):
+        funding_index = FundingIndex(data[2], data[3])
+        provinces = data[6]
+        requests = [(provinces[i], rng.choice(SCOPES)) for i in rng.integers(0, len(provinces), n_queries)]
+        return lambda: [utils.get_available_funding(p, scope, data[2], data[3], funding_index=funding_index)
+                        for p, scope in requests]
+
+    return [
+        ('similarity_index', lambda data, index: lambda: SimilarityIndex(data[0], data[4], data[5])),
+        ('find_most_similar_cities', similar),
+        ('find_best_project', best_project),
+        ('get_available_funding', funding),
+    ]
+
+
+def run_size(size, repeat, n_queries, seed, work_dir):
+    """Genera i dati di una dimensione e misura caricamento e funzioni della pipeline."""
+    directory = os.path.join(work_dir, f"n{size}")
+    start = time.perf_counter()
+    sizes = generate_dataset(directory, size, seed=seed)
+    print(f"[{size}] dati generati in {time.perf_counter() - start:.1f} s: {sizes}")
+
+    results = []
+    previous_dir = os.getcwd()
+    os.chdir(directory)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            load_times, load_peak = measure(lambda: utils.load_data(use_cache=False), repeat)
+            data = utils.load_data(force_rebuild=True)
+            cache_times, cache_peak = measure(utils.load_data, repeat)
+        results.append(_result('load_data', size, load_times, load_peak, repeat=repeat))
+        results.append(_result('load_data_cache', size, cache_times, cache_peak, repeat=repeat))
+
+        index = SimilarityIndex(data[0], data[4], data[5])
+        for name, prepare in benchmark_cases(n_queries, seed):
+            func = prepare(data, index)
+            with contextlib.redirect_stdout(io.StringIO()):
+                times, peak = measure(func, repeat)
+            per_call = 1 if name == 'similarity_index' else n_queries
+            results.append(_result(name, size, [t / per_call for t in times], peak, repeat=repeat))
+    finally:
+        os.chdir(previous_dir)
+
+    for result in results:
+        print(f"[{size}] {result['case']:<26} mediana {result['seconds'] * 1000:10.3f} ms  "
+              f"picco {result['peak_mb']:9.2f} MB")
+    return results
+
+
+def _result(case, size, times, peak, repeat):
+    return {
+        'case': case,
+        'size': size,
+        'seconds': statistics.median(times),
+        'min_seconds': min(times),
+        'repeat': repeat,
+        'peak_mb': peak / 2 ** 20,
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD, noise_floor=NOISE_FLOOR):
+    """
+    Confronta i risultati con un file di riferimento precedente.
+    Restituisce le righe del confronto e le sole regressioni (tempo o
+    memoria oltre la soglia relativa).
+    """
+    reference = {(r['case'], r['size']): r for r in baseline['results']}
+    rows = []
+    regressions = []
+    for result in results:
+        base = reference.get((result['case'], result['size']))
+        if base is None:
+            continue
+        time_ratio = result['seconds'] / base['seconds'] if base['seconds'] > 0 else 1.0
+        memory_ratio = result['peak_mb'] / base['peak_mb'] if base['peak_mb'] > 0 else 1.0
+        row = {'case': result['case'], 'size': result['size'],
+               'time_ratio': time_ratio, 'memory_ratio': memory_ratio}
+        rows.append(row)
+        slower = time_ratio > 1 + threshold and result['seconds'] - base['seconds'] > noise_floor
+        larger = memory_ratio > 1 + threshold and result['peak_mb'] - base['peak_mb'] > MEMORY_NOISE_MB
+        if slower or larger:
+            regressions.append(row)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark della pipeline su dati sintetici")
+    parser.add_argument('--sizes', default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Numero di righe da generare, separati da virgola (da 1000 a 10000000)")
+    parser.add_argument('--repeat', type=int, default=5, help="Ripetizioni per caso (si usa la mediana)")
+    parser.add_argument('--queries', type=int, default=50, help="Query per ripetizione delle funzioni di ricerca")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark.json', help="File JSON dei risultati")
+    parser.add_argument('--baseline', help="Risultati JSON di un commit precedente da confrontare")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Peggioramento relativo oltre il quale si segnala una regressione")
+    parser.add_argument('--work-dir', help="Cartella per i dati generati (default: temporanea)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    with contextlib.ExitStack() as stack:
+        work_dir = args.work_dir or stack.enter_context(tempfile.TemporaryDirectory(prefix='benchmark_'))
+        results = []
+        for size in sizes:
+            results.extend(run_size(size, args.repeat, args.queries, args.seed, work_dir))
+
+    report = {
+        'commit': _git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Risultati salvati in {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline, args.threshold)
+        print(f"\nConfronto con {args.baseline} (commit {baseline.get('commit')}):")
+        for row in rows:
+            flag = "  REGRESSIONE" if row in regressions else ""
+            print(f"- {row['case']:<26} n={row['size']:<9} tempo x{row['time_ratio']:.2f}  "
+                  f"memoria x{row['memory_ratio']:.2f}{flag}")
+        if regressions:
+            print(f"{len(regressions)} regressioni oltre la soglia del {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
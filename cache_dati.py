@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import pandas as pd
+
+# Cartella e versione del formato della cache
+CACHE_DIR = '.cache_dati'
+# (3: scaler NumPy di normalizzazione.py al posto di quello di scikit-learn)
+CACHE_VERSION = 3
+MANIFEST = 'manifest.json'
+
+# Nomi dei file dei DataFrame salvati in cache
+FRAME_FILES = {
+    'df': 'cities.pkl',
+    'progetti_df': 'progetti.pkl',
+    'finanziamenti_eu_df': 'finanziamenti.pkl',
+    'categorie_df': 'categorie.pkl',
+}
+SCALER_FILE = 'scaler.pkl'
+
+# Contatori di hit/miss della sessione corrente
+_statistiche = {'hit': 0, 'miss': 0, 'ricostruzioni': 0, 'ultimo_esito': None}
+
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    """Restituisce dimensione, mtime e hash SHA-256 di un file sorgente."""
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+
+
+def _sources_match(sources, saved):
+    """Verifica che i file sorgente coincidano con quelli registrati nel manifest."""
+    if sorted(sources) != sorted(saved):
+        return False
+    for path in sources:
+        stat = os.stat(path)
+        expected = saved[path]
+        # Dimensione e mtime sono gratuiti: l'hash si calcola solo se coincidono
+        if stat.st_size != expected['size'] or stat.st_mtime_ns != expected['mtime_ns']:
+            return False
+        if file_fingerprint(path)['sha256'] != expected['sha256']:
+            return False
+    return True
+
+
+def _record(esito):
+    _statistiche['ultimo_esito'] = esito
+    if esito == 'hit':
+        _statistiche['hit'] += 1
+    else:
+        _statistiche['miss'] += 1
+
+
+def load_cache(sources, cache_dir=CACHE_DIR, force_rebuild=False):
+    """
+    Carica i dati dalla cache se i file sorgente non sono cambiati.
+    Restituisce la tupla di load_data oppure None in caso di miss.
+    """
+    if force_rebuild:
+        _record('miss: ricostruzione forzata')
+        return None
+
+    manifest_path = os.path.join(cache_dir, MANIFEST)
+    if not os.path.exists(manifest_path):
+        _record('miss: cache assente')
+        return None
+
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        if manifest.get('version') != CACHE_VERSION:
+            _record('miss: versione cache diversa')
+            return None
+
+        if not _sources_match(sources, manifest['sources']):
+            _record('miss: file sorgente modificati')
+            return None
+
+        frames = {
+            name: pd.read_pickle(os.path.join(cache_dir, filename))
+            for name, filename in FRAME_FILES.items()
+        }
+        with open(os.path.join(cache_dir, SCALER_FILE), 'rb') as f:
+            scaler = pickle.load(f)
+
+    except Exception as e:
+        _record(f'miss: cache illeggibile ({e})')
+        return None
+
+    _record('hit')
+    return (frames['df'], frames['progetti_df'], frames['finanziamenti_eu_df'],
+            frames['categorie_df'], scaler, manifest['numerical_columns'], manifest['province'])
+
+
+def save_cache(data, sources, cache_dir=CACHE_DIR, deltas=None):
+    """
+    Scrive la cache in modo atomico: il manifest viene pubblicato per ultimo.
+    deltas elenca gli aggiornamenti incrementali già inclusi nei dati.
+    """
+    df, progetti_df, finanziamenti_eu_df, categorie_df, scaler, numerical_columns, province = data
+    frames = {
+        'df': df,
+        'progetti_df': progetti_df,
+        'finanziamenti_eu_df': finanziamenti_eu_df,
+        'categorie_df': categorie_df,
+    }
+
+    parent = os.path.dirname(os.path.abspath(cache_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.cache_tmp_', dir=parent)
+    try:
+        for name, filename in FRAME_FILES.items():
+            frames[name].to_pickle(os.path.join(tmp_dir, filename))
+        with open(os.path.join(tmp_dir, SCALER_FILE), 'wb') as f:
+            pickle.dump(scaler, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        manifest = {
+            'version': CACHE_VERSION,
+            'sources': {path: file_fingerprint(path) for path in sources},
+            'numerical_columns': list(numerical_columns),
+            'province': [str(p) for p in province],
+            'deltas': list(deltas or []),
+        }
+        with open(os.path.join(tmp_dir, MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        # Sostituisci la cache precedente
+        if os.path.exists(cache_dir):
+            shutil.rmtree(cache_dir)
+        os.replace(tmp_dir, cache_dir)
+        _statistiche['ricostruzioni'] += 1
+
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def cached_deltas(cache_dir=CACHE_DIR):
+    """Aggiornamenti incrementali registrati nel manifest della cache (lista vuota se assente)."""
+    try:
+        with open(os.path.join(cache_dir, MANIFEST), encoding='utf-8') as f:
+            return json.load(f).get('deltas', [])
+    except (OSError, ValueError):
+        return []
+
+
+def clear_cache(cache_dir=CACHE_DIR):
+    """Elimina la cache su disco."""
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def cache_report():
+    """Restituisce i contatori di hit/miss della cache nella sessione corrente."""
+    return dict(_statistiche)
@@ -0,0 +1,171 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from indici import FundingResultSet
+from utils import (find_most_similar_cities, find_best_project, find_available_funding,
+                   SIMILARITY_ERROR, PROJECT_ERROR, FUNDING_ERROR)
+
+
+class LRUCache:
+    """
+    Cache LRU limitata in dimensione con scadenza opzionale (ttl in secondi).
+    Thread-safe: può essere condivisa tra worker dell'interfaccia ed executor.
+    """
+
+    def __init__(self, maxsize=256, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Restituisce (trovato, valore) e aggiorna l'ordine di utilizzo."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl is None or self.clock() - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """
+        Valore in cache, altrimenti calcolato con compute e salvato.
+        Se compute solleva un'eccezione non viene salvato nulla.
+        """
+        found, value = self.get(key)
+        if not found:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
+
+
+class RecommendationCache:
+    """
+    Cache dei risultati per fase: similarità, progetti e finanziamenti.
+    Ogni fase ha chiavi proprie, così cambiando solo ambito o provincia
+    le fasi non interessate vengono riutilizzate. La cache si svuota da
+    sola quando i dataset vengono ricaricati (nuova generazione).
+    quantize, se indicato, arrotonda il vettore normalizzato a quel passo.
+    Le ricerche non riuscite restituiscono i risultati di errore di utils
+    senza salvarli: la richiesta successiva viene ricalcolata.
+    """
+
+    def __init__(self, maxsize=256, ttl=600, quantize=None):
+        self.quantize = quantize
+        self.similarity = LRUCache(maxsize, ttl)
+        self.explained = LRUCache(maxsize, ttl)
+        self.projects = LRUCache(maxsize, ttl)
+        self.funding = LRUCache(maxsize, ttl)
+        self.generation = None
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def bind(self, data):
+        """Svuota la cache se data appartiene a una generazione diversa dei dataset."""
+        with self._lock:
+            if data.generation != self.generation:
+                if self.generation is not None:
+                    self.invalidations += 1
+                for cache in (self.similarity, self.explained, self.projects, self.funding):
+                    cache.clear()
+                self.generation = data.generation
+
+    def feature_key(self, index, features):
+        """Chiave del vettore normalizzato e pesato, eventualmente quantizzato."""
+        weighted = index.transform(features)
+        if self.quantize:
+            weighted = np.round(weighted / self.quantize).astype(np.int64)
+        return weighted.tobytes()
+
+    def similar_cities(self, data, features, k=5):
+        self.bind(data)
+        try:
+            # Anche la chiave valida le caratteristiche: se non sono valide si restituisce l'errore
+            key = (self.feature_key(data.similarity_index, features), k)
+            return self.similarity.get_or_compute(key, lambda: find_most_similar_cities(
+                features, data.df, data.scaler, data.numerical_columns, index=data.similarity_index, k=k,
+                raise_errors=True
+            ))
+        except Exception:
+            return list(SIMILARITY_ERROR)
+
+    def explained_similar_cities(self, data, features, k=5):
+        """Città simili con la matrice dei contributi per feature (k × feature)."""
+        self.bind(data)
+        try:
+            key = (self.feature_key(data.similarity_index, features), k)
+            return self.explained.get_or_compute(key, lambda: find_most_similar_cities(
+                features, data.df, data.scaler, data.numerical_columns, index=data.similarity_index, k=k,
+                explain=True, raise_errors=True
+            ))
+        except Exception:
+            return list(SIMILARITY_ERROR), None
+
+    def project_report(self, data, similar_cities, smart_city_scope, duration):
+        self.bind(data)
+        key = (tuple(similar_cities), smart_city_scope, duration)
+        try:
+            return self.projects.get_or_compute(key, lambda: find_best_project(
+                similar_cities, smart_city_scope, duration, data.progetti_df,
+                project_index=data.project_index, raise_errors=True
+            ))
+        except Exception:
+            return PROJECT_ERROR
+
+    def available_funding(self, data, provincia, smart_city_scope):
+        self.bind(data)
+        key = (provincia, smart_city_scope)
+        try:
+            return self.funding.get_or_compute(key, lambda: find_available_funding(
+                provincia, smart_city_scope, data.funding_index, raise_errors=True
+            ))
+        except Exception:
+            return FundingResultSet(message=FUNDING_ERROR)
+
+    def stats(self):
+        return {
+            'similarity': self.similarity.stats(),
+            'explained': self.explained.stats(),
+            'projects': self.projects.stats(),
+            'funding': self.funding.stats(),
+            'invalidations': self.invalidations,
+        }
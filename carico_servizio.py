@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+
+# Intervalli plausibili per generare città casuali (ordine di NUMERICAL_COLUMNS)
+FEATURE_RANGES = [
+    (100, 10000), (800, 3000), (50, 2000), (-15, 15), (15, 40),
+    (1, 20), (0, 3), (5, 40), (35, 50), (50, 1000),
+    (1, 4), (1, 4), (1, 4), (1, 4), (1, 4),
+]
+SCOPES = ["Smart_Governance", "Smart_Mobility", "Smart_Environment",
+          "Smart_Economy", "Smart_People", "Smart_Living"]
+DURATIONS = ["Breve termine (2 anni)", "Medio termine (5 anni)", "Lungo termine (10 anni)"]
+
+
+def random_request(endpoint, provincia):
+    features = [random.uniform(low, high) for low, high in FEATURE_RANGES]
+    if endpoint == '/similar':
+        return {'features': features, 'k': 5}
+    if endpoint == '/projects':
+        return {'similar_cities': [["Milan", 95.0], ["Turin", 93.0]],
+                'smart_city_scope': random.choice(SCOPES), 'duration': random.choice(DURATIONS)}
+    return {'provincia': provincia, 'smart_city_scope': random.choice(SCOPES)}
+
+
+async def client(host, port, endpoint, provincia, n_requests, latencies, errors):
+    """Invia n_requests richieste su una connessione keep-alive."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(n_requests):
+            body = json.dumps(random_request(endpoint, provincia)).encode('utf-8')
+            start = time.perf_counter()
+            writer.write(
+                f"POST {endpoint} HTTP/1.1\r\nHost: {host}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run(host, port, endpoint, provincia, concurrency, n_requests):
+    latencies = []
+    errors = []
+    per_client = max(1, n_requests // concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        client(host, port, endpoint, provincia, per_client, latencies, errors)
+        for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    print(f"Endpoint {endpoint}: {len(latencies)} richieste, {concurrency} connessioni concorrenti")
+    print(f"- Throughput: {len(latencies) / elapsed:.1f} richieste/s")
+    print(f"- Latenza p50: {np.percentile(latencies_ms, 50):.2f} ms")
+    print(f"- Latenza p99: {np.percentile(latencies_ms, 99):.2f} ms")
+    print(f"- Errori: {len(errors)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test di carico del servizio raccomandazioni")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--endpoint', choices=['/similar', '/projects', '/funding'], default='/similar')
+    parser.add_argument('--provincia', default='Roma', help="Provincia usata per /funding")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args(argv)
+    asyncio.run(run(args.host, args.port, args.endpoint, args.provincia, args.concurrency, args.requests))
+
+
+if __name__ == "__main__":
+    main()
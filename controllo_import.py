@@ -0,0 +1,99 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Moduli dell'API di base (senza interfaccia grafica)
+CORE_MODULES = ['utils', 'dataset', 'pipeline', 'cache_risultati']
+# Dipendenze pesanti che l'API di base non deve importare all'avvio
+FORBIDDEN_MODULES = ['sklearn', 'scipy', 'PyQt5', 'openpyxl']
+# Tempo massimo di importazione a freddo (ms), dipendenze comprese
+DEFAULT_BUDGET_MS = 1000
+# Tempo massimo dei soli moduli del progetto (ms)
+DEFAULT_OWN_BUDGET_MS = 150
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def own_modules():
+    """Nomi dei moduli del progetto (file .py della cartella)."""
+    return {name[:-3] for name in os.listdir(REPO_DIR) if name.endswith('.py')}
+
+
+def measure_import(modules):
+    """
+    Importa modules in un nuovo interprete con -X importtime.
+    Restituisce (record, moduli caricati), con un record
+    {'module', 'self_us', 'cumulative_us', 'depth'} per ogni import.
+    """
+    code = f"import sys\nimport {', '.join(modules)}\nprint(','.join(sorted(sys.modules)))"
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                               capture_output=True, text=True, cwd=REPO_DIR)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importazione non riuscita:\n{completed.stderr[-2000:]}")
+
+    records = []
+    for line in completed.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            records.append({
+                'module': match.group(4),
+                'self_us': int(match.group(1)),
+                'cumulative_us': int(match.group(2)),
+                'depth': (len(match.group(3)) - 1) // 2,
+            })
+    return records, set(completed.stdout.strip().split(','))
+
+
+def summarize(records, loaded, modules):
+    """Tempo totale dei moduli richiesti, tempo dei moduli del progetto e dipendenze vietate."""
+    own = own_modules()
+    total = sum(r['cumulative_us'] for r in records if r['depth'] == 0 and r['module'] in modules)
+    own_time = sum(r['self_us'] for r in records if r['module'].split('.')[0] in own)
+    forbidden = sorted(m for m in FORBIDDEN_MODULES if m in loaded)
+    return {'total_ms': total / 1000, 'own_ms': own_time / 1000, 'forbidden': forbidden}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Controlla il tempo di importazione a freddo dell'API di base con -X importtime"
+    )
+    parser.add_argument('--moduli', default=",".join(CORE_MODULES), help="Moduli da importare")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help="Tempo massimo di importazione, dipendenze comprese")
+    parser.add_argument('--budget-progetto-ms', type=float, default=DEFAULT_OWN_BUDGET_MS,
+                        help="Tempo massimo dei soli moduli del progetto")
+    parser.add_argument('--ripetizioni', type=int, default=3, help="Misure ripetute (si usa la minima)")
+    parser.add_argument('--dettaglio', type=int, default=10, help="Import più lenti da mostrare")
+    args = parser.parse_args(argv)
+
+    modules = [m.strip() for m in args.moduli.split(',') if m.strip()]
+    runs = [measure_import(modules) for _ in range(max(1, args.ripetizioni))]
+    summaries = [summarize(records, loaded, modules) for records, loaded in runs]
+    best = min(range(len(runs)), key=lambda i: summaries[i]['total_ms'])
+    summary = summaries[best]
+    own_ms = min(s['own_ms'] for s in summaries)
+
+    print(f"Importazione di {', '.join(modules)}: {summary['total_ms']:.0f} ms "
+          f"(budget {args.budget_ms:.0f} ms), moduli del progetto {own_ms:.0f} ms "
+          f"(budget {args.budget_progetto_ms:.0f} ms)")
+    slowest = sorted(runs[best][0], key=lambda r: r['cumulative_us'], reverse=True)
+    for record in [r for r in slowest if r['depth'] <= 1][:args.dettaglio]:
+        print(f"  {record['cumulative_us'] / 1000:8.1f} ms  {'  ' * record['depth']}{record['module']}")
+
+    failures = []
+    if summary['total_ms'] > args.budget_ms:
+        failures.append(f"tempo totale oltre il budget ({summary['total_ms']:.0f} > {args.budget_ms:.0f} ms)")
+    if own_ms > args.budget_progetto_ms:
+        failures.append(f"moduli del progetto oltre il budget ({own_ms:.0f} > {args.budget_progetto_ms:.0f} ms)")
+    if summary['forbidden']:
+        failures.append(f"dipendenze pesanti importate all'avvio: {', '.join(summary['forbidden'])}")
+    for failure in failures:
+        print(f"ERRORE: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
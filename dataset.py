@@ -0,0 +1,44 @@
+import itertools
+
+from utils import load_data
+from similarita import SimilarityIndex
+from indici import ProjectIndex, FundingIndex
+
+
+# Contatore delle generazioni dei dataset: cambia a ogni caricamento
+_generations = itertools.count(1)
+
+
+class SmartCityData:
+    """
+    Dataset caricati da load_data e indici costruiti una sola volta,
+    condivisi da interfaccia, elaborazioni batch e servizio HTTP.
+    generation identifica il caricamento, per invalidare le cache dei risultati.
+    Gli indici già pronti (ad esempio aggiornati da aggiornamenti.py) possono
+    essere passati invece di essere ricostruiti.
+    """
+
+    def __init__(self, data, similarity_index=None, project_index=None, funding_index=None):
+        self.generation = next(_generations)
+        (self.df, self.progetti_df, self.finanziamenti_eu_df, self.categorie_df,
+         self.scaler, self.numerical_columns, self.province) = data
+
+        if similarity_index is None:
+            similarity_index = SimilarityIndex(self.df, self.scaler, self.numerical_columns)
+        if project_index is None:
+            project_index = ProjectIndex(self.progetti_df)
+        if funding_index is None:
+            funding_index = FundingIndex(self.finanziamenti_eu_df, self.categorie_df)
+        self.similarity_index = similarity_index
+        self.project_index = project_index
+        self.funding_index = funding_index
+
+    def as_tuple(self):
+        """Restituisce i dataset nello stesso ordine di load_data."""
+        return (self.df, self.progetti_df, self.finanziamenti_eu_df, self.categorie_df,
+                self.scaler, self.numerical_columns, self.province)
+
+
+def load_dataset(force_rebuild=False, progress=None, compact=None):
+    """Carica i dataset (dalla cache se valida) e costruisce gli indici."""
+    return SmartCityData(load_data(force_rebuild=force_rebuild, progress=progress, compact=compact))
@@ -0,0 +1,149 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils import (CITIES_CSV, PROGETTI_CSV, FINANZIAMENTI_XLSX, FOGLIO_FINANZIAMENTI,
+                   FOGLIO_CATEGORIE, IMPORTANCE_MAP, SECTOR_MAP)
+
+# Righe massime di un foglio Excel (intestazione esclusa)
+MAX_EXCEL_ROWS = 1_048_575
+
+SCOPES = ["Smart_Governance", "Smart_Mobility", "Smart_Environment",
+          "Smart_Economy", "Smart_People", "Smart_Living"]
+DURATIONS = ["Breve termine (2 anni)", "Medio termine (5 anni)", "Lungo termine (10 anni)"]
+STATES = ["Attivo", "Non attivo", "Sperimentale"]
+N_CATEGORIES = 120
+N_PROVINCES = 110
+
+# Intestazione di progetti_smart.csv (refusi compresi, come nel file originale)
+PROGETTI_COLUMNS = [
+    'Città', 'Nome progetto 1', 'Nome proggetto 2', 'Ambito progetto 1', 'Costo progetto 1',
+    'Tipo di investimento 1', 'N. Utenti progetto 1', 'Produttore progetto 1',
+    'Attivo / Non attivo progetto 1', 'Descrizione Progetto 1', 'Ambito progetto 2',
+    'Costo progetto 2', 'Tipo di investimento 2', 'N. Utenti progetto 2',
+    'Produttore progetto 2', 'Attivo / Non attivo progetto 2', 'Descrizione progetto 2'
+]
+
+
+def city_names(n):
+    return pd.Series(np.arange(n)).map("Città {:07d}".format)
+
+
+def synthetic_cities(n, rng):
+    """DataFrame con lo schema di cities.csv (valori grezzi, categorie testuali)."""
+    temp_min = rng.integers(-15, 16, n)
+    temp_max = temp_min + rng.integers(10, 25, n)
+    clima = (pd.Series(temp_min).astype(str) + "°C / " + pd.Series(temp_max).astype(str) + "°C")
+    importance = np.array(list(IMPORTANCE_MAP))
+    sectors = np.array(list(SECTOR_MAP))
+    df = pd.DataFrame({
+        'City': city_names(n),
+        'Densità di popolazione (ab/km²)': rng.integers(100, 10000, n),
+        'Costo della vita (€/mese)': rng.integers(800, 3000, n),
+        'Trasporto pubblico (unità totali)': rng.integers(50, 5000, n),
+        'Clima (range annuale)': clima,
+        'Punti di interesse turistici': rng.integers(1, 20, n),
+        'Aeroporti principali': rng.integers(0, 3, n),
+        'Livello di inquinamento (PM2.5)': rng.integers(5, 40, n),
+        'Età media (anni)': rng.integers(30, 50, n),
+        'Media eventi annuali': rng.integers(50, 1200, n),
+        'Importanza amministrativa': importance[rng.integers(0, len(importance), n)],
+    })
+    for col in ['Primario', 'Secondario', 'Terziario', 'Quaternario']:
+        df[col] = sectors[rng.integers(0, len(sectors), n)]
+    return df
+
+
+def synthetic_projects(n, rng):
+    """DataFrame nel formato largo di progetti_smart.csv (due progetti per città)."""
+    scopes = np.array(SCOPES)
+    durations = np.array(DURATIONS)
+    states = np.array(STATES)
+    numbers = pd.Series(np.arange(n)).astype(str)
+    data = {'Città': city_names(n)}
+    for slot in (1, 2):
+        data[f'Nome progetto {slot}'] = "Progetto " + numbers + f"-{slot}"
+        data[f'Ambito progetto {slot}'] = scopes[rng.integers(0, len(scopes), n)]
+        data[f'Costo progetto {slot}'] = "€" + pd.Series(rng.integers(1, 300, n)).astype(str) + ".000.000"
+        data[f'Tipo di investimento {slot}'] = durations[rng.integers(0, len(durations), n)]
+        data[f'N. Utenti progetto {slot}'] = rng.integers(1000, 1000000, n)
+        data[f'Produttore progetto {slot}'] = "Produttore " + numbers
+        data[f'Attivo / Non attivo progetto {slot}'] = states[rng.integers(0, len(states), n)]
+        data[f'Descrizione Progetto {slot}'] = "Descrizione del progetto " + numbers
+    df = pd.DataFrame(data)
+    df.columns = [col.replace('Nome progetto 2', 'Nome proggetto 2')
+                  .replace('Descrizione Progetto 2', 'Descrizione progetto 2') for col in df.columns]
+    return df[PROGETTI_COLUMNS]
+
+
+def write_workbook(path, n_funding, rng):
+    """
+    Scrive in streaming il file Excel con il foglio dei finanziamenti
+    (n_funding righe) e quello delle categorie.
+    """
+    from openpyxl import Workbook
+
+    labels = [f"Categoria intervento {i:03d}" for i in range(N_CATEGORIES)]
+    provinces = [f"Provincia {i:03d}" for i in range(N_PROVINCES)] + [58, None]
+    smart = [scope.replace('_', ' ') for scope in SCOPES]
+
+    workbook = Workbook(write_only=True)
+    funding = workbook.create_sheet(FOGLIO_FINANZIAMENTI)
+    funding.append(['Operation_Unique_Identifier', 'Operation_Name', 'Region3',
+                    'Total_Eligible_Expenditure_amount', 'Project_EU_Budget', 'Category_Label'])
+    block = 100_000
+    for start in range(0, n_funding, block):
+        size = min(block, n_funding - start)
+        province = rng.integers(0, len(provinces), size)
+        category = rng.integers(0, N_CATEGORIES, size)
+        expenditure = np.round(rng.random(size) * 1e7, 2)
+        budget = np.round(expenditure * rng.random(size), 2)
+        for i in range(size):
+            funding.append([
+                f"https://kohesio.ec.europa.eu/projects/{start + i}", f"Operazione {start + i}",
+                provinces[province[i]], float(expenditure[i]), float(budget[i]), labels[category[i]],
+            ])
+
+    categories = workbook.create_sheet(FOGLIO_CATEGORIE)
+    categories.append(['Category_Of_Intervention', 'Category_Label', 'Category_Smart'])
+    for i, label in enumerate(labels):
+        categories.append([f"{i:03d}", label, smart[i % len(smart)]])
+    workbook.save(path)
+
+
+def generate_dataset(directory, n_cities, n_projects=None, n_funding=None, seed=0):
+    """
+    Genera in directory i tre file sorgente con gli stessi schemi dei
+    dati reali. n_projects e n_funding valgono per default n_cities; il
+    foglio Excel è limitato a MAX_EXCEL_ROWS righe.
+    Restituisce le dimensioni effettivamente generate.
+    """
+    n_projects = n_cities if n_projects is None else n_projects
+    n_funding = min(n_cities if n_funding is None else n_funding, MAX_EXCEL_ROWS)
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    synthetic_cities(n_cities, rng).to_csv(os.path.join(directory, CITIES_CSV), index=False)
+    synthetic_projects(n_projects, rng).to_csv(os.path.join(directory, PROGETTI_CSV), index=False)
+    write_workbook(os.path.join(directory, FINANZIAMENTI_XLSX), n_funding, rng)
+    return {'cities': n_cities, 'projects': n_projects, 'funding': n_funding}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera dataset sintetici con lo schema dei file sorgente")
+    parser.add_argument('directory', help="Cartella di destinazione")
+    parser.add_argument('--cities', type=int, default=1000)
+    parser.add_argument('--projects', type=int, default=None, help="Righe di progetti_smart.csv (default: --cities)")
+    parser.add_argument('--funding', type=int, default=None, help="Righe del foglio finanziamenti (default: --cities)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    sizes = generate_dataset(args.directory, args.cities, args.projects, args.funding, args.seed)
+    print(f"Generati in {args.directory}: {sizes['cities']} città, {sizes['projects']} righe progetti, "
+          f"{sizes['funding']} finanziamenti")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+import copy
+import re
+
+import numpy as np
+import pandas as pd
+
+from registro import stage_timer
+
+# Colonne del formato "largo" di progetti_smart.csv, una serie per progetto
+# (il CSV originale contiene refusi come "Nome proggetto 2")
+PROJECT_FIELDS = {
+    'Nome progetto': r'^nome progg?etto (\d+)$',
+    'Ambito progetto': r'^ambito progetto (\d+)$',
+    'Tipo di investimento': r'^tipo di investimento (\d+)$',
+    'Descrizione': r'^descrizione progetto (\d+)$',
+    'Stato': r'^attivo / non attivo progetto (\d+)$',
+    'Costo': r'^costo progetto (\d+)$',
+    'N. Utenti': r'^n\. utenti progetto (\d+)$',
+    'Produttore': r'^produttore progetto (\d+)$',
+}
+
+
+def projects_to_long(progetti_df):
+    """
+    Converte progetti_smart.csv dal formato largo (Nome progetto 1,
+    Nome proggetto 2, ...) a una tabella lunga con un progetto per riga.
+    Ogni città può avere un numero qualsiasi di progetti.
+    """
+    slots = {}
+    for col in progetti_df.columns:
+        for field, pattern in PROJECT_FIELDS.items():
+            match = re.match(pattern, col.strip(), flags=re.IGNORECASE)
+            if match:
+                slots.setdefault(int(match.group(1)), {})[field] = col
+                break
+
+    parts = []
+    for number in sorted(slots):
+        mapping = slots[number]
+        part = pd.DataFrame({'Città': progetti_df['Città'].to_numpy()})
+        part['Numero progetto'] = number
+        for field in PROJECT_FIELDS:
+            part[field] = progetti_df[mapping[field]].to_numpy() if field in mapping else None
+        part['_riga'] = np.arange(len(progetti_df))
+        parts.append(part)
+
+    if not parts:
+        return pd.DataFrame(columns=['Città', 'Numero progetto', *PROJECT_FIELDS])
+
+    long_df = pd.concat(parts, ignore_index=True)
+    # Scarta gli slot vuoti (città con meno progetti delle colonne disponibili)
+    long_df = long_df.dropna(subset=['Nome progetto', 'Ambito progetto'], how='all')
+    long_df = long_df.sort_values(['_riga', 'Numero progetto'], kind='stable')
+    return long_df.drop(columns='_riga').reset_index(drop=True)
+
+
+class ProjectIndex:
+    """
+    Tabella lunga dei progetti smart con indici hash per città,
+    (città, ambito), (città, tipo di investimento) e
+    (città, ambito, tipo di investimento).
+    """
+
+    def __init__(self, progetti_df):
+        self.projects = projects_to_long(progetti_df)
+        self._columns = {col: self.projects[col].to_numpy() for col in self.projects.columns}
+
+        self.by_city = self._group(['Città'])
+        self.by_city_ambito = self._group(['Città', 'Ambito progetto'])
+        self.by_city_tipo = self._group(['Città', 'Tipo di investimento'])
+        self.by_key = self._group(['Città', 'Ambito progetto', 'Tipo di investimento'])
+
+    def _group(self, keys):
+        """
+        Dizionario chiave -> posizioni delle righe, con chiavi scalari per una
+        sola colonna. Le righe con chiavi mancanti vengono escluse come in groupby;
+        un solo passaggio sugli array evita il costo di groupby().indices sulle
+        colonne di stringhe.
+        """
+        valid = np.flatnonzero(self.projects[keys].notna().all(axis=1).to_numpy())
+        values = [self._columns[col][valid] for col in keys]
+        groups = {}
+        for position, key in zip(valid.tolist(), zip(*values) if len(keys) > 1 else values[0]):
+            groups.setdefault(key, []).append(position)
+        return groups
+
+    def __len__(self):
+        return len(self.projects)
+
+    def __contains__(self, city):
+        return city in self.by_city
+
+    def record(self, position):
+        """Restituisce il progetto in posizione position come dizionario."""
+        return {col: values[position] for col, values in self._columns.items()}
+
+    def match(self, city, smart_city_scope, duration):
+        """
+        Restituisce i progetti della città con l'esito del confronto su
+        ambito e durata, oppure None se la città non ha progetti.
+        """
+        positions = self.by_city.get(city)
+        if positions is None:
+            return None
+
+        ambito_matches = set(self.by_city_ambito.get((city, smart_city_scope), ()))
+        durata_matches = set(self.by_city_tipo.get((city, duration), ()))
+        results = []
+        for position in positions:
+            project = self.record(position)
+            project['ambito_match'] = position in ambito_matches
+            project['durata_match'] = position in durata_matches
+            results.append(project)
+        return results
+
+    def perfect_matches(self, city, smart_city_scope, duration):
+        """Progetti della città con ambito e durata richiesti."""
+        return [self.record(p) for p in self.by_key.get((city, smart_city_scope, duration), ())]
+
+
+class FundingIndex:
+    """
+    Indice dei finanziamenti EU per (provincia, categoria smart city).
+    Per ogni coppia conserva le posizioni delle righe in finanziamenti_eu_df
+    e i totali di spesa ammissibile e budget EU, calcolati al caricamento.
+    """
+
+    def __init__(self, finanziamenti_eu_df, categorie_df):
+        self.funding = finanziamenti_eu_df
+        self._set_categories(categorie_df)
+        self.provinces = set()
+        self.offsets = {}
+        self.totals = {}
+        self._add_rows(finanziamenti_eu_df, start=0)
+
+    @classmethod
+    def from_arrays(cls, funding, categorie_df, provinces, offsets, groups):
+        """
+        Indice con gruppi già calcolati, ad esempio mappati in memoria da
+        archivio.py. offsets concatena le posizioni di tutti i gruppi; groups
+        contiene per ogni gruppo (provincia, categoria, inizio, fine, totali).
+        """
+        index = cls.__new__(cls)
+        index.funding = funding
+        index._set_categories(categorie_df)
+        index.provinces = set(provinces)
+        index.offsets = {}
+        index.totals = {}
+        for provincia, category, start, stop, totals in groups:
+            index.offsets[(provincia, category)] = offsets[start:stop]
+            index.totals[(provincia, category)] = dict(totals)
+        return index
+
+    def _set_categories(self, categorie_df):
+        # Valori originali di Category_Smart (con eventuali spazi), per la verifica di presenza
+        self.raw_categories = set(categorie_df['Category_Smart'].dropna())
+        categories = categorie_df[['Category_Label', 'Category_Smart']].dropna()
+        smart = categories['Category_Smart'].astype(str).str.strip()
+        self.labels_by_category = {
+            category: labels.unique()
+            for category, labels in categories['Category_Label'].groupby(smart.to_numpy(), sort=False)
+        }
+
+    def _add_rows(self, rows, start):
+        """
+        Indicizza le righe di rows, che occupano le posizioni da start in
+        poi del DataFrame dei finanziamenti, accodandole ai gruppi esistenti.
+        """
+        codes, provinces = pd.factorize(rows['Region3'])
+        self.provinces.update(provinces)
+        expenditure = rows['Total_Eligible_Expenditure_amount'].to_numpy(dtype=float)
+        budget = rows['Project_EU_Budget'].to_numpy(dtype=float)
+
+        for category, labels in self.labels_by_category.items():
+            positions = np.flatnonzero(rows['Category_Label'].isin(labels).to_numpy())
+            positions = positions[codes[positions] >= 0]
+            # Raggruppa per provincia mantenendo l'ordine originale delle righe
+            positions = positions[np.argsort(codes[positions], kind='stable')]
+            boundaries = np.flatnonzero(np.diff(codes[positions])) + 1
+            for group in np.split(positions, boundaries):
+                if len(group) == 0:
+                    continue
+                key = (provinces[codes[group[0]]], category)
+                totals = self.totals.get(key)
+                if totals is None:
+                    self.offsets[key] = group + start
+                    totals = self.totals[key] = {
+                        'count': 0, 'Total_Eligible_Expenditure_amount': 0.0, 'Project_EU_Budget': 0.0,
+                    }
+                else:
+                    self.offsets[key] = np.concatenate([self.offsets[key], group + start])
+                totals['count'] += len(group)
+                totals['Total_Eligible_Expenditure_amount'] += np.nansum(expenditure[group])
+                totals['Project_EU_Budget'] += np.nansum(budget[group])
+
+    def extended(self, finanziamenti_eu_df, n_existing):
+        """
+        Nuovo indice per finanziamenti_eu_df, in cui le prime n_existing righe
+        sono quelle già indicizzate: solo le righe successive vengono elaborate.
+        L'indice corrente non viene modificato.
+        """
+        other = copy.copy(self)
+        other.funding = finanziamenti_eu_df
+        other.provinces = set(self.provinces)
+        other.offsets = dict(self.offsets)
+        other.totals = {key: dict(totals) for key, totals in self.totals.items()}
+        other._add_rows(finanziamenti_eu_df.iloc[n_existing:], start=n_existing)
+        return other
+
+    def has_category(self, category):
+        return category in self.raw_categories
+
+    def has_province(self, provincia):
+        return provincia in self.provinces
+
+    def lookup(self, provincia, category):
+        """Posizioni delle righe di finanziamento per provincia e categoria."""
+        return self.offsets.get((provincia, category), np.empty(0, dtype=np.intp))
+
+    def rows(self, provincia, category):
+        """Righe di finanziamento per provincia e categoria."""
+        return self.funding.take(self.lookup(provincia, category))
+
+    def summary(self, provincia, category):
+        """Numero di finanziamenti e totali precalcolati per provincia e categoria."""
+        return self.totals.get((provincia, category), {
+            'count': 0,
+            'Total_Eligible_Expenditure_amount': 0.0,
+            'Project_EU_Budget': 0.0,
+        })
+
+
+class FundingResultSet:
+    """
+    Risultato di una ricerca di finanziamenti. Le righe vengono ordinate
+    solo alla prima richiesta e formattate una pagina alla volta.
+    """
+
+    def __init__(self, funding=None, offsets=(), provincia=None, smart_city_scope=None,
+                 totals=None, page_size=20, sort_by='Project_EU_Budget', ascending=False,
+                 message=None):
+        self.funding = funding
+        self.offsets = np.asarray(offsets, dtype=np.intp)
+        self.provincia = provincia
+        self.smart_city_scope = smart_city_scope
+        self.totals = totals
+        self.page_size = max(1, page_size)
+        self.sort_by = sort_by
+        self.ascending = ascending
+        self.message = message
+        self._sorted = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def n_pages(self):
+        return max(1, -(-len(self) // self.page_size))
+
+    def sorted_offsets(self):
+        """Posizioni delle righe nell'ordine richiesto, calcolate una sola volta."""
+        if self._sorted is None:
+            if self.sort_by is None or len(self) == 0:
+                self._sorted = self.offsets
+            else:
+                values = pd.Series(self.funding[self.sort_by].to_numpy()[self.offsets])
+                order = values.sort_values(ascending=self.ascending, kind='stable').index.to_numpy()
+                self._sorted = self.offsets[order]
+        return self._sorted
+
+    def with_page_size(self, page_size):
+        """Stesso risultato con un'altra dimensione di pagina, riusando l'ordinamento."""
+        other = copy.copy(self)
+        other.page_size = max(1, page_size)
+        other._sorted = self.sorted_offsets()
+        return other
+
+    def page_rows(self, number):
+        """DataFrame con le righe della pagina number (a partire da 0)."""
+        start = number * self.page_size
+        return self.funding.take(self.sorted_offsets()[start:start + self.page_size])
+
+    def header(self):
+        """Intestazione del report con i totali precalcolati."""
+        if self.message is not None:
+            return self.message
+        return (
+            f"\nFINANZIAMENTI DISPONIBILI PER LA PROVINCIA {self.provincia}\n"
+            f"CATEGORIA SMART CITY: {self.smart_city_scope}\n"
+            f"Finanziamenti trovati: {self.totals['count']}\n"
+            f"Spesa Totale Ammissibile complessiva: {self.totals['Total_Eligible_Expenditure_amount']:,.2f} €\n"
+            f"Budget EU Stanziato complessivo: {self.totals['Project_EU_Budget']:,.2f} €\n\n"
+        )
+
+    def format_page(self, number):
+        """Testo dei finanziamenti della pagina number."""
+        if self.message is not None or len(self) == 0:
+            return ""
+        with stage_timer('render', page=number):
+            rows = self.page_rows(number)
+            urls = rows['Operation_Unique_Identifier'].astype(str).to_numpy()
+            expenditure = rows['Total_Eligible_Expenditure_amount'].to_numpy(dtype=float)
+            budget = rows['Project_EU_Budget'].to_numpy(dtype=float)
+            return "".join(
+                "=" * 50 + "\n"
+                f"URL Progetto: {url}\n"
+                f"Spesa Totale Ammissibile: {spesa:,.2f} €\n"
+                f"Budget EU Stanziato: {eu:,.2f} €\n"
+                for url, spesa, eu in zip(urls, expenditure, budget)
+            )
+
+    def to_text(self):
+        """Report completo: intestazione e tutte le pagine."""
+        return self.header() + "".join(self.format_page(n) for n in range(self.n_pages))
@@ -0,0 +1,121 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# Colonne necessarie dai due fogli del file dei finanziamenti EU
+COLONNE_FINANZIAMENTI = [
+    'Operation_Unique_Identifier',
+    'Region3',
+    'Total_Eligible_Expenditure_amount',
+    'Project_EU_Budget',
+    'Category_Label'
+]
+COLONNE_CATEGORIE = ['Category_Label', 'Category_Smart']
+
+
+def _timed(timings, stage, func, *args, **kwargs):
+    """Esegue func registrando il tempo impiegato nella fase indicata."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    timings[stage] = time.perf_counter() - start
+    return result
+
+
+def _read_sheet(worksheet, columns, timings, stage):
+    """Legge in streaming solo le colonne richieste di un foglio."""
+    start = time.perf_counter()
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        raise ValueError(f"Il foglio '{worksheet.title}' è vuoto")
+
+    header = [str(h).strip() if h is not None else None for h in header]
+    missing = [col for col in columns if col not in header]
+    if missing:
+        raise ValueError(f"Colonne mancanti nel foglio '{worksheet.title}': {missing}")
+
+    positions = [header.index(col) for col in columns]
+    values = {col: [] for col in columns}
+    for row in rows:
+        # Salta le righe completamente vuote
+        if all(row[pos] is None for pos in positions if pos < len(row)):
+            continue
+        for col, pos in zip(columns, positions):
+            values[col].append(row[pos] if pos < len(row) else None)
+
+    timings[stage] = time.perf_counter() - start
+    return pd.DataFrame(values, columns=columns)
+
+
+def read_workbook(path, sheets, timings=None):
+    """
+    Apre il file Excel una sola volta in sola lettura e legge le colonne
+    richieste da ogni foglio. sheets mappa nome foglio -> lista colonne.
+    """
+    from openpyxl import load_workbook
+
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    timings['excel_apertura'] = time.perf_counter() - start
+    try:
+        return {
+            sheet: _read_sheet(workbook[sheet], columns, timings, f"excel_{sheet}")
+            for sheet, columns in sheets.items()
+        }
+    finally:
+        workbook.close()
+
+
+def read_cleaned(paths, timings=None):
+    """
+    Legge i file Parquet prodotti da pulisci.py al posto dei due fogli
+    Excel. paths contiene i percorsi 'finanziamenti' e 'categorie'.
+    """
+    timings = {} if timings is None else timings
+    finanziamenti = _timed(timings, 'parquet_finanziamenti', pd.read_parquet,
+                           paths['finanziamenti'], columns=COLONNE_FINANZIAMENTI)
+    categorie = _timed(timings, 'parquet_categorie', pd.read_parquet,
+                       paths['categorie'], columns=COLONNE_CATEGORIE)
+    return finanziamenti, categorie
+
+
+def ingest_sources(cities_csv, progetti_csv, excel_path, foglio_finanziamenti, foglio_categorie,
+                   cleaned=None):
+    """
+    Legge i CSV e il file Excel in parallelo su un pool di thread.
+    Se cleaned indica i file Parquet di pulisci.py, questi sostituiscono il file Excel.
+    Restituisce i quattro DataFrame grezzi e i tempi per fase in secondi.
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        # Il file Excel è la fase più lenta: avviala per prima
+        if cleaned is not None:
+            excel_future = executor.submit(read_cleaned, cleaned, timings)
+        else:
+            excel_future = executor.submit(
+                read_workbook, excel_path,
+                {foglio_finanziamenti: COLONNE_FINANZIAMENTI, foglio_categorie: COLONNE_CATEGORIE},
+                timings
+            )
+        cities_future = executor.submit(_timed, timings, 'cities_csv', pd.read_csv, cities_csv)
+        progetti_future = executor.submit(_timed, timings, 'progetti_csv', pd.read_csv, progetti_csv)
+
+        df = cities_future.result()
+        progetti_df = progetti_future.result()
+        if cleaned is not None:
+            finanziamenti_eu_df, categorie_df = excel_future.result()
+        else:
+            sheets = excel_future.result()
+            finanziamenti_eu_df, categorie_df = sheets[foglio_finanziamenti], sheets[foglio_categorie]
+
+    timings['totale'] = time.perf_counter() - start
+    return df, progetti_df, finanziamenti_eu_df, categorie_df, timings
+
+
+def format_timings(timings):
+    """Formatta i tempi per fase in una riga leggibile."""
+    return ", ".join(f"{stage}: {seconds * 1000:.1f} ms" for stage, seconds in timings.items())
@@ -0,0 +1,226 @@
+import os
+
+import numpy as np
+
+# Variabili d'ambiente con la metrica e la normalizzazione attive
+METRICA_ENV = 'SMARTCITY_METRICA'
+NORMALIZZAZIONE_ENV = 'SMARTCITY_NORMALIZZAZIONE'
+METRICA_PREDEFINITA = 'euclidea'
+# Le similarità si normalizzano sulla città più lontana di ogni ricerca
+# ('ricerca', come finora) oppure su una distanza di riferimento fissa,
+# calcolata una volta sul dataset ('dataset'): solo la seconda rende
+# confrontabili i punteggi di ricerche diverse
+NORMALIZZAZIONI = ('ricerca', 'dataset')
+NORMALIZZAZIONE_PREDEFINITA = 'ricerca'
+
+# Colonne ordinali confrontate come categorie dalla metrica di Gower
+CATEGORICAL_COLUMNS = ['Importanza amministrativa', 'Primario', 'Secondario', 'Terziario', 'Quaternario']
+# Tolleranza relativa per riconoscere il livello di una colonna categorica
+LEVEL_TOLERANCE = 1e-3
+# Autovalori della covarianza sotto questa frazione del massimo vengono ignorati
+EIGEN_TOLERANCE = 1e-9
+
+
+class EuclideanMetric:
+    """
+    Distanza euclidea sulle caratteristiche normalizzate e pesate.
+
+    Ogni metrica trasforma le caratteristiche pesate (città × feature) in
+    uno spazio di ricerca in cui la distanza euclidea al quadrato ordina le
+    città come la metrica: fit precalcola una volta lo stato necessario,
+    embed trasforma città e query e distance converte le distanze al
+    quadrato nella distanza della metrica. Così ogni ricerca resta un solo
+    passaggio O(città × feature).
+    block_starts indica, per ogni feature, la prima colonna dello spazio di
+    ricerca che la rappresenta (le colonne di una feature sono contigue):
+    se non è None la distanza è una somma di termini per feature.
+    """
+
+    name = 'euclidea'
+
+    def fit(self, weighted, weights, columns):
+        self.block_starts = np.arange(len(columns))
+        return self
+
+    def embed(self, weighted):
+        return weighted
+
+    def distance(self, squared):
+        return np.sqrt(squared)
+
+    def reference_distance(self, search_t):
+        """
+        Distanza di riferimento fissa del dataset: il doppio della distanza
+        massima di una città dal centro, limite superiore della distanza tra
+        due città qualsiasi.
+        """
+        if search_t.shape[1] == 0:
+            return 0.0
+        center = search_t.mean(axis=1, dtype=np.float64).astype(np.float32)
+        squared = np.zeros(search_t.shape[1], dtype=np.float32)
+        for row, value in zip(search_t, center):
+            diff = row - value
+            squared += diff * diff
+        return float(self.distance(4 * squared.max()))
+
+
+class CosineMetric(EuclideanMetric):
+    """
+    Distanza coseno (1 - coseno) tra le caratteristiche pesate, centrate
+    sulla media del dataset. Città e query sono vettori unitari: la distanza
+    euclidea al quadrato tra due vettori unitari vale 2 × (1 - coseno).
+    """
+
+    name = 'coseno'
+
+    def fit(self, weighted, weights, columns):
+        self.mean = np.asarray(weighted, dtype=np.float64).mean(axis=0).astype(np.float32)
+        self.block_starts = None
+        return self
+
+    def embed(self, weighted):
+        centered = np.asarray(weighted, dtype=np.float32) - self.mean
+        norms = np.sqrt((centered * centered).sum(axis=-1, keepdims=True))
+        return np.divide(centered, norms, out=np.zeros_like(centered), where=norms > 0)
+
+    def distance(self, squared):
+        return squared / 2
+
+    def reference_distance(self, search_t):
+        # Vettori opposti: coseno -1
+        return 2.0
+
+
+class MahalanobisMetric(EuclideanMetric):
+    """
+    Distanza di Mahalanobis: la matrice di sbiancamento (inversa della
+    radice della covarianza delle città) viene calcolata una volta sola e
+    applicata a città e query, poi la distanza è euclidea.
+    Le direzioni a varianza nulla vengono ignorate (pseudo-inversa).
+    La covarianza compensa la scala di ogni colonna: i pesi del profilo non
+    cambiano le distanze.
+    """
+
+    name = 'mahalanobis'
+
+    def fit(self, weighted, weights, columns):
+        weighted = np.asarray(weighted, dtype=np.float64)
+        self.mean = weighted.mean(axis=0)
+        if len(weighted) > 1:
+            covariance = np.cov(weighted, rowvar=False).reshape(len(columns), len(columns))
+        else:
+            covariance = np.zeros((len(columns), len(columns)))
+        values, vectors = np.linalg.eigh(covariance)
+        kept = values > EIGEN_TOLERANCE * max(values.max(initial=0.0), np.finfo(np.float64).tiny)
+        self.whitening = (vectors[:, kept] / np.sqrt(values[kept])).astype(np.float32)
+        self.mean = self.mean.astype(np.float32)
+        self.block_starts = None
+        return self
+
+    def embed(self, weighted):
+        return (np.asarray(weighted, dtype=np.float32) - self.mean) @ self.whitening
+
+
+class GowerMetric(EuclideanMetric):
+    """
+    Distanza mista in stile Gower: le colonne di CATEGORICAL_COLUMNS
+    (importanza amministrativa e settori, codificati come livelli ordinali)
+    contano 0 se uguali e 1 se diverse; le altre la differenza normalizzata
+    al quadrato. I termini sono pesati con i pesi al quadrato e divisi per
+    la loro somma: la distanza è compresa tra 0 e 1 per le città nei limiti
+    del dataset.
+    Ogni colonna categorica diventa un blocco one-hot con un livello in più
+    per i valori assenti dal dataset.
+    """
+
+    name = 'gower'
+
+    def fit(self, weighted, weights, columns):
+        weighted = np.asarray(weighted, dtype=np.float32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.total = float((self.weights.astype(np.float64) ** 2).sum()) or 1.0
+        self.levels = {}
+        starts = []
+        width = 0
+        for j, col in enumerate(columns):
+            starts.append(width)
+            if col in CATEGORICAL_COLUMNS:
+                self.levels[j] = np.unique(weighted[:, j])
+                width += len(self.levels[j]) + 1
+            else:
+                width += 1
+        self.block_starts = np.array(starts)
+        self.width = width
+        return self
+
+    def embed(self, weighted):
+        weighted = np.asarray(weighted, dtype=np.float32)
+        embedded = np.zeros(weighted.shape[:-1] + (self.width,), dtype=np.float32)
+        for j, start in enumerate(self.block_starts):
+            values = weighted[..., j]
+            if j not in self.levels:
+                embedded[..., start] = values
+                continue
+            # Livello più vicino entro la tolleranza, altrimenti il livello "altro"
+            levels = self.levels[j]
+            slot = np.full(values.shape, len(levels), dtype=np.intp)
+            if len(levels):
+                gaps = np.abs(values[..., None] - levels)
+                nearest = gaps.argmin(axis=-1)
+                tolerance = LEVEL_TOLERANCE * max(abs(float(self.weights[j])), np.finfo(np.float32).tiny)
+                matched = np.take_along_axis(gaps, nearest[..., None], axis=-1)[..., 0] <= tolerance
+                slot = np.where(matched, nearest, slot)
+            # Due livelli diversi distano w² = 2 × (w / √2)²
+            np.put_along_axis(embedded, (start + slot)[..., None],
+                              np.float32(self.weights[j] / np.sqrt(2)), axis=-1)
+        return embedded
+
+    def distance(self, squared):
+        return squared / self.total
+
+    def reference_distance(self, search_t):
+        # Tutte le colonne al massimo della differenza
+        return 1.0
+
+
+METRICHE = {
+    'euclidea': EuclideanMetric,
+    'coseno': CosineMetric,
+    'mahalanobis': MahalanobisMetric,
+    'gower': GowerMetric,
+}
+
+_active = os.environ.get(METRICA_ENV) or METRICA_PREDEFINITA
+_normalization = os.environ.get(NORMALIZZAZIONE_ENV) or NORMALIZZAZIONE_PREDEFINITA
+
+
+def make_metric(name):
+    """Nuova metrica (ancora da addestrare con fit) dal nome di METRICHE."""
+    if name not in METRICHE:
+        raise ValueError(f"Metrica sconosciuta: {name} (disponibili: {', '.join(METRICHE)})")
+    return METRICHE[name]()
+
+
+def check_normalization(normalization):
+    if normalization not in NORMALIZZAZIONI:
+        raise ValueError(f"Normalizzazione sconosciuta: {normalization} "
+                         f"(disponibili: {', '.join(NORMALIZZAZIONI)})")
+    return normalization
+
+
+def configure_metric(metric=None, normalization=None):
+    """Attiva metrica e normalizzazione per gli indici costruiti da questo momento."""
+    global _active, _normalization
+    if metric is not None:
+        make_metric(metric)
+        _active = metric
+    if normalization is not None:
+        _normalization = check_normalization(normalization)
+
+
+def active_metric():
+    return _active
+
+
+def active_normalization():
+    return _normalization
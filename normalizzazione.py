@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class MinMaxScaler:
+    """
+    Normalizzazione min-max in NumPy con la stessa interfaccia e gli stessi
+    risultati di sklearn.preprocessing.MinMaxScaler (fit, partial_fit,
+    transform, inverse_transform e attributi data_min_, data_max_, scale_,
+    min_): evita di importare scikit-learn all'avvio.
+    I valori mancanti (NaN) vengono ignorati nel calcolo dei limiti.
+    """
+
+    def __init__(self, feature_range=(0, 1)):
+        self.feature_range = feature_range
+
+    @staticmethod
+    def _as_array(X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2:
+            raise ValueError(f"Attesa una matrice (righe × colonne), ricevuta forma {X.shape}")
+        return X
+
+    def fit(self, X):
+        for attribute in ('data_min_', 'data_max_', 'n_samples_seen_'):
+            self.__dict__.pop(attribute, None)
+        return self.partial_fit(X)
+
+    def partial_fit(self, X):
+        """Aggiorna i limiti min/max con nuove righe."""
+        feature_min, feature_max = self.feature_range
+        if feature_min >= feature_max:
+            raise ValueError(f"Intervallo non valido: {self.feature_range}")
+        X = self._as_array(X)
+
+        with np.errstate(invalid='ignore'):
+            data_min = np.nanmin(X, axis=0) if len(X) else np.full(X.shape[1], np.nan)
+            data_max = np.nanmax(X, axis=0) if len(X) else np.full(X.shape[1], np.nan)
+        if hasattr(self, 'n_samples_seen_'):
+            data_min = np.fmin(self.data_min_, data_min)
+            data_max = np.fmax(self.data_max_, data_max)
+            self.n_samples_seen_ += X.shape[0]
+        else:
+            self.n_samples_seen_ = X.shape[0]
+
+        data_range = data_max - data_min
+        # Le colonne costanti hanno scala 1, come in scikit-learn
+        safe_range = np.where(data_range < 10 * np.finfo(np.float64).eps, 1.0, data_range)
+        self.n_features_in_ = X.shape[1]
+        self.data_min_ = data_min
+        self.data_max_ = data_max
+        self.data_range_ = data_range
+        self.scale_ = (feature_max - feature_min) / safe_range
+        self.min_ = feature_min - data_min * self.scale_
+        return self
+
+    def transform(self, X):
+        X = self._as_array(X).copy()
+        X *= self.scale_
+        X += self.min_
+        return X
+
+    def fit_transform(self, X):
+        return self.fit(X).transform(X)
+
+    def inverse_transform(self, X):
+        X = self._as_array(X).copy()
+        X -= self.min_
+        X /= self.scale_
+        return X
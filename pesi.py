@@ -1,5 +1,34 @@
-# Pesi originali mantenuti
-    weights = {
+import json
+import os
+
+import numpy as np
+
+# Variabile d'ambiente con il profilo di pesi attivo (nome o file JSON)
+PESI_ENV = 'SMARTCITY_PESI'
+PROFILO_PREDEFINITO = 'predefinito'
+
+# Profili di pesi per le caratteristiche delle città
+# (le colonne non elencate hanno peso 1)
+PROFILI = {
+    # Pesi usati finora nella ricerca delle città simili
+    'predefinito': {
+        'Densità di popolazione (ab/km²)': 0.15,
+        'Costo della vita (€/mese)': 0.15,
+        'Trasporto pubblico (unità totali)': 0.10,
+        'Temp_Min': 0.10,
+        'Temp_Max': 0.10,
+        'Punti di interesse turistici': 0.10,
+        'Livello di inquinamento (PM2.5)': 0.05,
+        'Età media (anni)': 0.05,
+        'Media eventi annuali': 0.05,
+        'Importanza amministrativa': 0.05,
+        'Primario': 0.02,
+        'Secondario': 0.03,
+        'Terziario': 0.03,
+        'Quaternario': 0.02
+    },
+    # Pesi originali mantenuti (il peso del clima è diviso tra Temp_Min e Temp_Max)
+    'originale': {
         'Densità di popolazione (ab/km²)': 0.20,
         'Costo della vita (€/mese)': 0.15,
         'Età media (anni)': 0.10,
@@ -9,9 +38,59 @@
         'Terziario': 0.03,
         'Quaternario': 0.03,
         'Livello di inquinamento (PM2.5)': 0.05,
-        'Clima (range annuale)': 0.05,
+        'Temp_Min': 0.025,
+        'Temp_Max': 0.025,
         'Importanza amministrativa': 0.01,
         'Media eventi annuali': 0.04,
         'Trasporto pubblico (unità totali)': 0.10,
         'Aeroporti principali': 0.01
-    }
+    },
+    # Tutte le caratteristiche con lo stesso peso (KNN euclideo semplice)
+    'uniforme': {},
+}
+
+_active = os.environ.get(PESI_ENV) or PROFILO_PREDEFINITO
+
+
+def load_profile(profile):
+    """
+    Restituisce i pesi di un profilo: il nome di un profilo di PROFILI
+    oppure il percorso di un file JSON salvato da taratura.py.
+    """
+    if profile in PROFILI:
+        return dict(PROFILI[profile])
+    if os.path.isfile(profile):
+        with open(profile, encoding='utf-8') as f:
+            saved = json.load(f)
+        weights = saved.get('pesi', saved)
+        return {col: float(value) for col, value in weights.items()}
+    raise ValueError(f"Profilo di pesi sconosciuto: {profile} (disponibili: {', '.join(PROFILI)})")
+
+
+def save_profile(path, weights, **info):
+    """Salva i pesi in un file JSON utilizzabile come profilo (SMARTCITY_PESI=percorso)."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'pesi': {col: float(value) for col, value in weights.items()}, **info},
+                  f, ensure_ascii=False, indent=2)
+
+
+def configure_weights(profile):
+    """Attiva un profilo di pesi per gli indici costruiti da questo momento."""
+    global _active
+    profile = profile or PROFILO_PREDEFINITO
+    load_profile(profile)
+    _active = profile
+
+
+def active_profile():
+    return _active
+
+
+def active_weights():
+    """Pesi del profilo attivo."""
+    return load_profile(_active)
+
+
+def weight_vector(weights, columns):
+    """Vettore dei pesi nell'ordine di columns (peso 1 per le colonne non indicate)."""
+    return np.array([weights.get(col, 1.0) for col in columns], dtype=np.float64)
@@ -0,0 +1,97 @@
+import numpy as np
+
+from registro import stage_timer
+from utils import explain_similarity
+
+
+def match_projects(project_index, similar_cities, smart_city_scope, duration):
+    """
+    Confronta i progetti delle città simili con ambito e durata richiesti.
+    Restituisce (match perfetti, match parziali) come liste di dizionari.
+    """
+    perfect = []
+    partial = []
+    for city, similarity in similar_cities:
+        city_projects = project_index.match(city, smart_city_scope, duration)
+        if city_projects is None:
+            continue
+        for project in city_projects:
+            if not (project['ambito_match'] or project['durata_match']):
+                continue
+            project_info = {
+                'city': str(city),
+                'similarity': float(similarity),
+                'name': str(project['Nome progetto']),
+                'ambito': str(project['Ambito progetto']),
+                'tipo_investimento': str(project['Tipo di investimento']),
+                'stato': str(project['Stato']),
+            }
+            if project['ambito_match'] and project['durata_match']:
+                perfect.append(project_info)
+            else:
+                partial.append(project_info)
+    return perfect, partial
+
+
+def funding_summary(funding_index, provincia, smart_city_scope):
+    """Numero di finanziamenti e totali per provincia e ambito smart city."""
+    category = smart_city_scope.replace('_', ' ')
+    if not funding_index.has_category(category):
+        return {'funding_count': 0, 'funding_eligible_total': 0.0, 'funding_eu_budget_total': 0.0,
+                'funding_message': f"Nessuna corrispondenza trovata per la categoria {smart_city_scope}"}
+    if not funding_index.has_province(provincia):
+        return {'funding_count': 0, 'funding_eligible_total': 0.0, 'funding_eu_budget_total': 0.0,
+                'funding_message': f"Nessun finanziamento trovato per la provincia {provincia}"}
+
+    totals = funding_index.summary(provincia, category)
+    return {
+        'funding_count': int(totals['count']),
+        'funding_eligible_total': float(totals['Total_Eligible_Expenditure_amount']),
+        'funding_eu_budget_total': float(totals['Project_EU_Budget']),
+        'funding_message': None,
+    }
+
+
+def recommend_batch(data, features_matrix, requests, k=5):
+    """
+    Esegue similarità, ricerca progetti e finanziamenti per ogni riga di
+    features_matrix (valori grezzi nell'ordine di numerical_columns).
+    requests contiene, per ogni riga, smart_city_scope, duration e provincia.
+    Ogni città simile riporta le differenze principali e le caratteristiche
+    quasi identiche, dalla matrice dei contributi (N × k × feature).
+    """
+    index = data.similarity_index
+    indices, similarities = index.query_batch(features_matrix, k=k)
+    contributions = index.contributions(features_matrix, indices)
+    cities = index.cities
+
+    results = []
+    for row_indices, row_similarities, row_contributions, request in zip(
+            indices, similarities, contributions, requests):
+        similar_cities = [(str(cities[i]), float(s)) for i, s in zip(row_indices, row_similarities)]
+        explanations = explain_similarity(row_contributions, index.numerical_columns)
+        with stage_timer('match', cities=len(similar_cities)):
+            perfect, partial = match_projects(
+                data.project_index, similar_cities, request['smart_city_scope'], request['duration']
+            )
+        result = {
+            'similar_cities': [
+                {'city': c, 'similarity': s,
+                 'main_differences': {col: round(share, 4) for col, share in explanation['differenze']},
+                 'close_features': explanation['simili']}
+                for (c, s), explanation in zip(similar_cities, explanations)
+            ],
+            'perfect_projects': perfect,
+            'partial_projects': partial,
+        }
+        with stage_timer('funding'):
+            result.update(funding_summary(data.funding_index, request['provincia'], request['smart_city_scope']))
+        results.append(result)
+    return results
+
+
+def recommend(data, features, smart_city_scope, duration, provincia, k=5):
+    """Raccomandazione completa per una sola città."""
+    request = {'smart_city_scope': smart_city_scope, 'duration': duration, 'provincia': provincia}
+    features_matrix = np.asarray(features, dtype=np.float32).reshape(1, -1)
+    return recommend_batch(data, features_matrix, [request], k=k)[0]
@@ -1,21 +1,130 @@
 import sys
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QLabel, QLineEdit, 
                             QPushButton, QVBoxLayout, QHBoxLayout, QWidget, 
-                            QTabWidget, QFormLayout, QComboBox)  # Aggiunto QComboBox
+                            QTabWidget, QFormLayout, QComboBox,  # Aggiunto QComboBox
+                            QProgressBar)
 from PyQt5.QtGui import QFont, QFontDatabase, QPixmap
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, QThreadPool, QRunnable, QObject, pyqtSignal
+import threading
 from stile import applica_stile
 from animazioni import animate_transition
-from utils import (load_data, find_most_similar_cities, find_best_project, 
-                  validate_fields, get_available_funding)
+from utils import validate_fields, format_similarity_explanation, NUMERICAL_COLUMNS
+from dataset import load_dataset
+from cache_risultati import RecommendationCache
+from registro import get_logger, collect_stage_timings, summarize_stage_timings
+from profilazione import profile_run, configure_profiling
+from pesi import configure_weights
+from metriche import configure_metric
 
-# Carica i dataset
-df, progetti_df, finanziamenti_eu_df, categorie_df, scaler, numerical_columns, province = load_data()
+log = get_logger(__name__)
+
+class DataLoader(QThread):
+    """Carica i dataset in background senza bloccare la finestra."""
+    progress = pyqtSignal(int, str)
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, force_rebuild=False, parent=None, compact=None):
+        super().__init__(parent)
+        self.force_rebuild = force_rebuild
+        self.compact = compact
+
+    def run(self):
+        try:
+            data = load_dataset(force_rebuild=self.force_rebuild, progress=self.progress.emit,
+                                compact=self.compact)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.loaded.emit(data)
+
+class AnalysisSignals(QObject):
+    """Segnali emessi da AnalysisWorker verso il thread dell'interfaccia."""
+    progress = pyqtSignal(int, int, str)
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+class AnalysisWorker(QRunnable):
+    """
+    Esegue l'analisi completa (similarità, progetti, finanziamenti) fuori
+    dal thread dell'interfaccia. Ogni fase viene eseguita una sola volta;
+    tra una fase e l'altra il worker si ferma se l'analisi è stata annullata.
+    """
+
+    def __init__(self, run_id, data, cache, new_city, smart_city_scope, duration, provincia):
+        super().__init__()
+        self.run_id = run_id
+        self.data = data
+        self.cache = cache
+        self.new_city = new_city
+        self.smart_city_scope = smart_city_scope
+        self.duration = duration
+        self.provincia = provincia
+        self.cancelled = threading.Event()
+        self.signals = AnalysisSignals()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            # Con il profiling attivo (SMARTCITY_PROFILE o --profila) ogni invio salva un profilo
+            profile = profile_run('invia', smart_city_scope=self.smart_city_scope, duration=self.duration,
+                                  provincia=self.provincia, run_id=self.run_id, features=self.new_city)
+            with profile, collect_stage_timings() as timings:
+                data = self.data
+                self.signals.progress.emit(self.run_id, 10, "Ricerca delle città simili...")
+                similar_cities, contributions = self.cache.explained_similar_cities(data, self.new_city)
+                result_text = "\nCITTÀ PIÙ SIMILI:\n"
+                for city, similarity in similar_cities:
+                    result_text += f"{city}: {similarity:.2f}%\n"
+                result_text += format_similarity_explanation(similar_cities, contributions,
+                                                             data.numerical_columns)
+            
+                # Aggiungi la provincia al testo dei risultati
+                result_text += f"\nProvincia selezionata: {self.provincia}\n"
+                if self.cancelled.is_set():
+                    return
+            
+                # Aggiungi i progetti trovati
+                self.signals.progress.emit(self.run_id, 40, "Ricerca dei progetti...")
+                result_text += "\n" + self.cache.project_report(
+                    data, similar_cities, self.smart_city_scope, self.duration
+                )
+                if self.cancelled.is_set():
+                    return
+            
+                # Aggiungi i finanziamenti disponibili (solo l'intestazione: le righe sono paginate)
+                self.signals.progress.emit(self.run_id, 70, "Ricerca dei finanziamenti...")
+                funding = self.cache.available_funding(data, self.provincia, self.smart_city_scope)
+                result_text += "\n" + funding.header()
+                if self.cancelled.is_set():
+                    return
+            
+            log.info("Analisi %d completata, tempi per fase (ms): %s",
+                     self.run_id, summarize_stage_timings(timings),
+                     extra={'run_id': self.run_id, 'stages': timings})
+            self.signals.progress.emit(self.run_id, 100, "Analisi completata")
+            self.signals.finished.emit(self.run_id, (result_text, funding))
+        except Exception as e:
+            self.signals.failed.emit(self.run_id, str(e))
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         
+        # Dataset (SmartCityData), disponibili al termine del caricamento in background
+        self.data = None
+        self.numerical_columns = list(NUMERICAL_COLUMNS)
+        self.loader = None
+        
+        # Analisi in corso: un nuovo invio annulla quella precedente
+        self.run_id = 0
+        self.current_worker = None
+        
+        # Cache dei risultati: riusa le fasi non cambiate tra un invio e l'altro
+        self.result_cache = RecommendationCache(maxsize=128, ttl=600)
+        
         self.setWindowTitle("Previsione Nuova Città")
         self.setGeometry(100, 100, 800, 600)
         
@@ -139,7 +248,8 @@ class MainWindow(QMainWindow):
         # ComboBox per le province
         self.province_combo = QComboBox()
         self.province_combo.setFont(font)
-        self.province_combo.addItems(province)
+        self.province_combo.addItem("Caricamento dati...")
+        self.province_combo.setEnabled(False)
         self.province_combo.setMaximumWidth(self.width() // 2)
 
         # Assembla il layout
@@ -199,7 +309,7 @@ class MainWindow(QMainWindow):
         self.page_layouts[0].addRow(temp_label, temp_container)
                 
         # Altri campi
-        remaining_features = [f for f in numerical_columns if f not in ['Temp_Min', 'Temp_Max']]
+        remaining_features = [f for f in self.numerical_columns if f not in ['Temp_Min', 'Temp_Max']]
         fields_per_page = (len(remaining_features) + 2) // 3
         
         for i, feature in enumerate(remaining_features):
@@ -241,8 +351,15 @@ class MainWindow(QMainWindow):
         self.submit_button.setFont(font)
         self.submit_button.setFixedWidth(100)
         self.submit_button.clicked.connect(self.submit)
+        self.submit_button.setEnabled(False)
         button_layout.addWidget(self.submit_button)
         
+        # Avanzamento del caricamento dati
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setFont(font)
+        main_layout.addWidget(self.progress_bar)
+        
         # Labels risultato e errore
         self.result_label = QLabel("")
         self.result_label.setFont(font)
@@ -257,6 +374,35 @@ class MainWindow(QMainWindow):
         self.update_buttons()
         self.tab_widget.currentChanged.connect(self.update_buttons)
     
+    def start_loading(self, force_rebuild=False, compact=None):
+        """Avvia il caricamento dei dataset in un thread separato."""
+        self.loader = DataLoader(force_rebuild, self, compact)
+        self.loader.progress.connect(self.on_load_progress)
+        self.loader.loaded.connect(self.on_data_loaded)
+        self.loader.failed.connect(self.on_load_failed)
+        self.loader.start()
+    
+    def on_load_progress(self, percent, message):
+        self.progress_bar.setValue(percent)
+        self.result_label.setText(message)
+    
+    def on_data_loaded(self, data):
+        self.data = data
+        self.numerical_columns = data.numerical_columns
+        
+        # Popola le province e abilita l'invio
+        self.province_combo.clear()
+        self.province_combo.addItems(data.province)
+        self.province_combo.setEnabled(True)
+        self.submit_button.setEnabled(True)
+        self.progress_bar.hide()
+        self.result_label.setText("")
+    
+    def on_load_failed(self, message):
+        self.progress_bar.hide()
+        self.result_label.setText("")
+        self.error_label.setText(f"Errore durante il caricamento dei dati: {message}")
+    
     def next_page(self):
         current_index = self.tab_widget.currentIndex()
         if current_index < self.tab_widget.count() - 1:
@@ -278,58 +424,73 @@ class MainWindow(QMainWindow):
         self.submit_button.setVisible(current_index == self.tab_widget.count() - 1)
     
     def submit(self): 
-        if not validate_fields(self.entries, self.budget_entry):
+        if self.data is None or not validate_fields(self.entries, self.budget_entry):
             return
             
         try:
         # Raccogli i dati della città
             new_city = []
-            for feature in numerical_columns:
+            for feature in self.numerical_columns:
                 value = float(self.entries[feature].text())
                 new_city.append(value)
-            
-            # Ottieni le città simili e crea il testo iniziale
-            similar_cities = find_most_similar_cities(new_city, df, scaler, numerical_columns)
-            result_text = "\nCITTÀ PIÙ SIMILI:\n"
-            for city, similarity in similar_cities:
-                result_text += f"{city}: {similarity:.2f}%\n"
-                
-            # Ottieni i parametri selezionati
-            smart_city_scope = self.smart_city_combo.currentText()
-            duration = self.duration_combo.currentText()
-            provincia = self.province_combo.currentText()
-        
-            # Aggiungi la provincia al testo dei risultati
-            result_text += f"\nProvincia selezionata: {provincia}\n"
-            
-            # Aggiungi i progetti trovati
-            result_text += "\n" + find_best_project(similar_cities, smart_city_scope, duration, progetti_df)
-            
-            # Mostra la finestra dei risultati
-            self.result_window = ResultWindow(result_text, self)
-            self.result_window.show()
-        
-            # Ottieni i parametri selezionati
-            smart_city_scope = self.smart_city_combo.currentText()
-            duration = self.duration_combo.currentText()
-            provincia = self.province_combo.currentText()
-            
-            # Aggiungi i risultati dei progetti simili
-            result_text += "\n" + find_best_project(similar_cities, smart_city_scope, duration, progetti_df)
-            
-            # Aggiungi i finanziamenti disponibili
-            result_text += "\n" + get_available_funding(provincia, smart_city_scope, finanziamenti_eu_df, categorie_df)
-            
-            # Mostra la finestra dei risultati
-            self.result_window = ResultWindow(result_text, self)
-            self.result_window.show()
-        
         except ValueError as e:
             self.result_label.setText("Errore: Inserisci solo valori numerici validi")
+            return
+        
+        # Annulla l'analisi precedente, se ancora in corso
+        if self.current_worker is not None:
+            self.current_worker.cancel()
+        
+        # Ottieni i parametri selezionati
+        self.run_id += 1
+        worker = AnalysisWorker(
+            self.run_id, self.data, self.result_cache, new_city,
+            self.smart_city_combo.currentText(),
+            self.duration_combo.currentText(),
+            self.province_combo.currentText()
+        )
+        worker.signals.progress.connect(self.on_analysis_progress)
+        worker.signals.finished.connect(self.on_analysis_finished)
+        worker.signals.failed.connect(self.on_analysis_failed)
+        self.current_worker = worker
+        
+        self.error_label.setText("")
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        QThreadPool.globalInstance().start(worker)
+    
+    def on_analysis_progress(self, run_id, percent, message):
+        if run_id != self.run_id:
+            return
+        self.progress_bar.setValue(percent)
+        self.result_label.setText(message)
+    
+    def on_analysis_finished(self, run_id, result):
+        # Ignora i risultati di un'analisi superata da un invio successivo
+        if run_id != self.run_id:
+            return
+        self.current_worker = None
+        self.progress_bar.hide()
+        self.result_label.setText("")
+        
+        # Mostra la finestra dei risultati
+        result_text, funding = result
+        self.result_window = ResultWindow(result_text, self, funding=funding)
+        self.result_window.show()
+    
+    def on_analysis_failed(self, run_id, message):
+        if run_id != self.run_id:
+            return
+        self.current_worker = None
+        self.progress_bar.hide()
+        self.result_label.setText("")
+        self.error_label.setText(f"Errore durante l'analisi: {message}")
 
 class ResultWindow(QMainWindow):
-    def __init__(self, result_text, parent=None):
+    def __init__(self, result_text, parent=None, funding=None):
         super().__init__(parent)
+        self.funding = funding
+        self.current_page = 0
         self.setWindowTitle("Risultati Analisi")
         self.setGeometry(150, 150, 800, 600)
         
@@ -350,16 +511,61 @@ class ResultWindow(QMainWindow):
         scroll.setWidgetResizable(True)
         layout.addWidget(scroll)
         
+        # Finanziamenti paginati: viene formattata solo la pagina visibile
+        if funding is not None and len(funding) > 0:
+            self.funding_text_edit = QTextEdit()
+            self.funding_text_edit.setReadOnly(True)
+            self.funding_text_edit.setFont(QFont("Montserrat", 10))
+            self.funding_text_edit.setStyleSheet("border: none;")
+            layout.addWidget(self.funding_text_edit)
+            
+            page_layout = QHBoxLayout()
+            self.previous_page_button = QPushButton("Precedente")
+            self.previous_page_button.setFont(QFont("Montserrat", 10))
+            self.previous_page_button.clicked.connect(lambda: self.show_funding_page(self.current_page - 1))
+            page_layout.addWidget(self.previous_page_button)
+            
+            self.page_label = QLabel("")
+            self.page_label.setFont(QFont("Montserrat", 10))
+            page_layout.addWidget(self.page_label, alignment=Qt.AlignCenter)
+            
+            self.next_page_button = QPushButton("Successiva")
+            self.next_page_button.setFont(QFont("Montserrat", 10))
+            self.next_page_button.clicked.connect(lambda: self.show_funding_page(self.current_page + 1))
+            page_layout.addWidget(self.next_page_button)
+            layout.addLayout(page_layout)
+            
+            self.show_funding_page(0)
+        
         # Bottone indietro
         back_button = QPushButton("Indietro")
         back_button.setFont(QFont("Montserrat", 10))
         back_button.setFixedWidth(100)
         back_button.clicked.connect(self.close)
         layout.addWidget(back_button, alignment=Qt.AlignCenter)
+    
+    def show_funding_page(self, page):
+        """Mostra una pagina dei finanziamenti ordinati per budget EU."""
+        page = max(0, min(page, self.funding.n_pages - 1))
+        self.current_page = page
+        self.funding_text_edit.setPlainText(self.funding.format_page(page))
+        self.page_label.setText(f"Finanziamenti: pagina {page + 1} di {self.funding.n_pages}")
+        self.previous_page_button.setEnabled(page > 0)
+        self.next_page_button.setEnabled(page < self.funding.n_pages - 1)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     applica_stile(app)
     window = MainWindow()
     window.show()
+    if '--profila' in sys.argv[:-1]:
+        configure_profiling(sys.argv[sys.argv.index('--profila') + 1])
+    if '--pesi' in sys.argv[:-1]:
+        configure_weights(sys.argv[sys.argv.index('--pesi') + 1])
+    configure_metric(
+        sys.argv[sys.argv.index('--metrica') + 1] if '--metrica' in sys.argv[:-1] else None,
+        sys.argv[sys.argv.index('--normalizzazione') + 1] if '--normalizzazione' in sys.argv[:-1] else None,
+    )
+    window.start_loading(force_rebuild='--ricostruisci-cache' in sys.argv,
+                         compact=True if '--compatto' in sys.argv else None)
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,122 @@
+import cProfile
+import contextlib
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+from registro import get_logger
+
+# Variabile d'ambiente con la cartella dei profili: se assente il profiling è disattivato
+PROFILE_ENV = 'SMARTCITY_PROFILE'
+# Allocazioni riportate nel riepilogo di tracemalloc
+TOP_ALLOCATIONS = 25
+
+log = get_logger(__name__)
+
+_directory = os.environ.get(PROFILE_ENV) or None
+# cProfile e tracemalloc sono globali: si profila un'esecuzione alla volta
+_lock = threading.Lock()
+_counter = itertools.count(1)
+
+
+def _reset_after_fork():
+    """Nei processi figli il profilo del padre non è attivo: si riparte da zero."""
+    global _lock
+    _lock = threading.Lock()
+    sys.setprofile(None)
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def configure_profiling(directory):
+    """Attiva il profiling nella cartella indicata (None lo disattiva)."""
+    global _directory
+    _directory = directory or None
+
+
+def profiling_directory():
+    return _directory
+
+
+def _slug(tags):
+    """Parte leggibile del nome dei file: solo i parametri scalari (i vettori restano nel .json)."""
+    text = "_".join(str(value) for value in tags.values() if isinstance(value, (str, int, float)))
+    return re.sub(r'[^A-Za-z0-9]+', '-', text)[:80].strip('-')
+
+
+def profile_run(label, **tags):
+    """
+    Contesto che esegue il blocco sotto cProfile e tracemalloc e salva nella
+    cartella dei profili i file .pstats, .alloc.txt (allocazioni principali)
+    e .json (parametri della query, tempo e memoria di picco).
+    Se il profiling è disattivato restituisce un contesto vuoto.
+    """
+    if _directory is None:
+        return contextlib.nullcontext()
+    return _profiled(_directory, label, tags)
+
+
+@contextlib.contextmanager
+def _profiled(directory, label, tags):
+    if not _lock.acquire(blocking=False):
+        log.warning("Profilo di %s non registrato: un'altra esecuzione è già profilata", label)
+        yield
+        return
+
+    started_tracing = not tracemalloc.is_tracing()
+    profiler = cProfile.Profile()
+    try:
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            _write_profile(directory, label, tags, profiler, snapshot, elapsed, peak)
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        _lock.release()
+
+
+def _write_profile(directory, label, tags, profiler, snapshot, elapsed, peak):
+    try:
+        os.makedirs(directory, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}-{next(_counter)}_{label}"
+        slug = _slug(tags)
+        base = os.path.join(directory, f"{name}_{slug}" if slug else name)
+
+        profiler.dump_stats(base + '.pstats')
+
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        with open(base + '.alloc.txt', 'w', encoding='utf-8') as f:
+            f.write(f"{label} {json.dumps(tags, ensure_ascii=False, default=str)}\n")
+            f.write(f"Memoria di picco: {peak / 2 ** 20:.2f} MB\n\n")
+            for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                f.write(f"{stat}\n")
+
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump({'label': label, 'tags': tags, 'seconds': elapsed,
+                       'peak_mb': peak / 2 ** 20, 'pid': os.getpid()},
+                      f, ensure_ascii=False, indent=2, default=str)
+        log.info("Profilo di %s salvato in %s.pstats", label, base)
+    except Exception as e:
+        log.exception("Impossibile salvare il profilo di %s: %s", label, e)
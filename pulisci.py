@@ -1,71 +1,312 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
 import pandas as pd
 
-def clean_excel_file():
+from cache_dati import file_fingerprint
+from ingestione import COLONNE_FINANZIAMENTI
+from registro import get_logger
+
+# Cartella di default dei file puliti letti da load_data
+CLEANED_DIR = 'dati_puliti'
+CLEANED_FILES = {
+    'finanziamenti': 'finanziamenti.parquet',
+    'categorie': 'categorie.parquet',
+}
+MANIFEST = 'manifest.json'
+COLONNE_CATEGORIE_PULITE = ['Category_Of_Intervention', 'Category_Label', 'Category_Smart']
+
+# Righe esaminate per trovare l'intestazione di un foglio
+HEADER_SCAN_ROWS = 50
+# Righe per blocco scritto nel file Parquet
+CHUNK_ROWS = 100_000
+
+# Testi (normalizzati) riconosciuti nelle intestazioni del foglio delle categorie
+CATEGORY_HEADERS = {
+    'Category_Of_Intervention': ['categoryofintervention', 'codiceintervento', 'categoryofinterventioncode'],
+    'Category_Label': ['categorylabel', 'descrizionecategoria', 'label'],
+    'Category_Smart': ['categorysmart', 'smartcategory', 'ambitosmart', 'smart'],
+}
+
+log = get_logger(__name__)
+
+
+def _normalize(value):
+    return re.sub(r'[^a-z0-9]', '', str(value).lower()) if value is not None else ''
+
+
+def _find_header(rows, targets):
+    """
+    Cerca tra le prime righe quella che contiene tutte le intestazioni di
+    targets (nome -> testi normalizzati accettati). Restituisce
+    (numero di riga, {nome: posizione}) oppure (None, None).
+    """
+    for number, row in enumerate(rows):
+        cells = [_normalize(cell) for cell in row]
+        positions = {}
+        for name, accepted in targets.items():
+            # Prima le corrispondenze esatte, poi quelle parziali
+            exact = [i for i, cell in enumerate(cells) if cell in accepted and i not in positions.values()]
+            partial = [i for i, cell in enumerate(cells)
+                       if cell and any(a in cell for a in accepted) and i not in positions.values()]
+            found = exact or partial
+            if found:
+                positions[name] = found[0]
+        if len(positions) == len(targets):
+            return number, positions
+    return None, None
+
+
+def _detect_category_columns_by_content(rows):
+    """
+    Riconosce le colonne del foglio delle categorie dai valori quando
+    l'intestazione manca: codici brevi, testi 'Smart ...' ed etichette.
+    """
+    n_columns = max((len(row) for row in rows), default=0)
+    scores = {'code': [0] * n_columns, 'smart': [0] * n_columns, 'length': [0] * n_columns}
+    for row in rows:
+        for i, cell in enumerate(row):
+            if cell is None:
+                continue
+            text = str(cell).strip()
+            if re.fullmatch(r'\d{1,3}[a-z]?', text, flags=re.IGNORECASE):
+                scores['code'][i] += 1
+            if re.match(r'smart[\s_]+\w+', text, flags=re.IGNORECASE):
+                scores['smart'][i] += 1
+            scores['length'][i] += len(text)
+
+    code = max(range(n_columns), key=lambda i: scores['code'][i], default=None)
+    smart = max((i for i in range(n_columns) if i != code), key=lambda i: scores['smart'][i], default=None)
+    if code is None or smart is None or scores['code'][code] == 0 or scores['smart'][smart] == 0:
+        raise ValueError("Colonne delle categorie non riconosciute né dall'intestazione né dal contenuto")
+    label = max((i for i in range(n_columns) if i not in (code, smart)),
+                key=lambda i: scores['length'][i], default=None)
+    if label is None:
+        raise ValueError("Colonna Category_Label non riconosciuta")
+    return {'Category_Of_Intervention': code, 'Category_Label': label, 'Category_Smart': smart}
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+# Colonne di testo dei finanziamenti: le celle vuote restano None
+FUNDING_TEXT_COLUMNS = ['Operation_Unique_Identifier', 'Region3', 'Category_Label']
+
+
+def _funding_chunk(rows, positions):
+    # Il testo va convertito prima di creare il DataFrame: una colonna str
+    # di pandas trasformerebbe le celle vuote nella stringa 'nan'
+    columns = {}
+    for col, pos in positions.items():
+        values = [row[pos] if pos < len(row) else None for row in rows]
+        if col in FUNDING_TEXT_COLUMNS:
+            values = [_text(value) for value in values]
+        columns[col] = pd.Series(values, dtype=object)
+    chunk = pd.DataFrame(columns)
+    for col in ['Total_Eligible_Expenditure_amount', 'Project_EU_Budget']:
+        chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype('float64')
+    return chunk
+
+
+def clean_funding_sheet(worksheet, path, chunk_size=CHUNK_ROWS):
+    """
+    Copia in streaming le colonne dei finanziamenti in un file Parquet,
+    un blocco di chunk_size righe alla volta. Restituisce le righe scritte.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = worksheet.iter_rows(values_only=True)
+    head = []
+    for row in rows:
+        head.append(row)
+        if len(head) >= HEADER_SCAN_ROWS:
+            break
+    targets = {col: [_normalize(col)] for col in COLONNE_FINANZIAMENTI}
+    header_row, positions = _find_header(head, targets)
+    if header_row is None:
+        raise ValueError(f"Intestazione dei finanziamenti non trovata nel foglio '{worksheet.title}'")
+
+    schema = pa.schema([
+        ('Operation_Unique_Identifier', pa.string()),
+        ('Region3', pa.string()),
+        ('Total_Eligible_Expenditure_amount', pa.float64()),
+        ('Project_EU_Budget', pa.float64()),
+        ('Category_Label', pa.string()),
+    ])
+    written = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        def flush(buffer):
+            table = pa.Table.from_pandas(_funding_chunk(buffer, positions), schema=schema, preserve_index=False)
+            writer.write_table(table)
+            return len(buffer)
+
+        buffer = []
+        pending = head[header_row + 1:]
+        for source in (pending, rows):
+            for row in source:
+                # Salta le righe completamente vuote
+                if all(row[pos] is None for pos in positions.values() if pos < len(row)):
+                    continue
+                buffer.append(row)
+                if len(buffer) >= chunk_size:
+                    written += flush(buffer)
+                    buffer = []
+        if buffer or written == 0:
+            written += flush(buffer)
+    return written
+
+
+def clean_category_sheet(worksheet, path):
+    """
+    Estrae codice, etichetta e ambito smart dal foglio delle categorie,
+    riconoscendo le colonne dall'intestazione o, se manca, dal contenuto.
+    Il foglio è piccolo: viene letto per intero.
+    """
+    rows = list(worksheet.iter_rows(values_only=True))
+    header_row, positions = _find_header(rows[:HEADER_SCAN_ROWS], CATEGORY_HEADERS)
+    if header_row is None:
+        positions = _detect_category_columns_by_content(rows[:HEADER_SCAN_ROWS * 4])
+        data_rows = rows
+    else:
+        data_rows = rows[header_row + 1:]
+
+    categories = pd.DataFrame({
+        col: [_text(row[positions[col]]) if positions[col] < len(row) else None for row in data_rows]
+        for col in COLONNE_CATEGORIE_PULITE
+    })
+    # Pulisci gli spazi e rimuovi righe vuote e duplicate
+    for col in COLONNE_CATEGORIE_PULITE:
+        categories[col] = categories[col].astype('string').str.strip()
+    categories = categories.dropna(subset=['Category_Label', 'Category_Smart'])
+    categories = categories.drop_duplicates().reset_index(drop=True)
+    categories.to_parquet(path, index=False)
+    return len(categories)
+
+
+def find_cleaned_output(source, output_dir=CLEANED_DIR):
+    """
+    Restituisce i percorsi dei file puliti se esistono e corrispondono al
+    file sorgente (stessa dimensione e data di modifica, o sorgente assente),
+    altrimenti None. Anche ogni file Parquet deve corrispondere a quello
+    registrato nel manifest: durante una pubblicazione in corso i file nuovi
+    non vengono mai abbinati al manifest precedente.
+    """
     try:
-        print("Lettura del file Excel...")
-        excel_file = 'projects_2025-02-15_IT_con_codifica.xlsx'
-        
-        # Leggi il primo foglio
-        df1 = pd.read_excel(excel_file, sheet_name='projects_2025-02-15_IT')
-        print("\nColonne nel primo foglio:")
-        print(df1.columns.tolist())
-        
-        # Mantieni solo le colonne necessarie nel primo foglio
-        columns_to_keep = [
-            'Operation_Unique_Identifier',
-            'Region3',
-            'Total_Eligible_Expenditure_amount',
-            'Project_EU_Budget',
-            'Category_Label'
-        ]
-        df1 = df1[columns_to_keep]
-        
-        # Leggi il secondo foglio
-        df2 = pd.read_excel(excel_file, sheet_name='projects_2025-02-15_IT_con codi')
-        print("\nColonne nel secondo foglio:")
-        print(df2.columns.tolist())
-        print("\nPrime righe del secondo foglio:")
-        print(df2.head())
-        
-        # Aspetta input utente per verificare le colonne
-        input("\nPremi Enter dopo aver verificato i nomi delle colonne...")
-        
-        # Crea un nuovo DataFrame con le colonne corrette
-        new_df2 = pd.DataFrame(columns=['Category_Of_Intervention', 'Category_Label', 'Category_Smart'])
-        
-        # Mappatura colonne (da aggiornare dopo aver visto l'output)
-        column_mapping = {
-            'Unnamed: 0': 'Category_Of_Intervention',
-            'Unnamed: 1': 'Category_Label',
-            'Unnamed: 12': 'Category_Smart'
+        with open(os.path.join(output_dir, MANIFEST), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    paths = {name: os.path.join(output_dir, filename) for name, filename in CLEANED_FILES.items()}
+    if not all(os.path.exists(path) for path in paths.values()):
+        return None
+    outputs = manifest.get('outputs', {})
+    for name, path in paths.items():
+        stat = os.stat(path)
+        saved = outputs.get(name, {})
+        if stat.st_size != saved.get('size') or stat.st_mtime_ns != saved.get('mtime_ns'):
+            return None
+    if os.path.exists(source):
+        stat = os.stat(source)
+        saved = manifest.get('source', {})
+        if stat.st_size != saved.get('size') or stat.st_mtime_ns != saved.get('mtime_ns'):
+            return None
+    return paths
+
+
+def clean_workbook(source, output_dir, foglio_finanziamenti, foglio_categorie,
+                   chunk_size=CHUNK_ROWS, force=False):
+    """
+    Converte il file Excel dei finanziamenti nei file Parquet di output_dir.
+    Il file sorgente non viene mai modificato; ogni file di output viene
+    sostituito in modo atomico, con il manifest per ultimo. Il manifest
+    registra l'impronta di ogni file Parquet, così find_cleaned_output
+    scarta i file non ancora (o non più) descritti dal manifest.
+    Restituisce il manifest, oppure None se l'output era già aggiornato.
+    """
+    from openpyxl import load_workbook
+
+    targets = [os.path.realpath(os.path.join(output_dir, name)) for name in [*CLEANED_FILES.values(), MANIFEST]]
+    if os.path.realpath(source) in targets:
+        raise ValueError("Il file sorgente non può essere sovrascritto dall'output")
+    if not force and find_cleaned_output(source, output_dir) is not None:
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.pulisci_tmp_', dir=output_dir)
+    start = time.perf_counter()
+    try:
+        workbook = load_workbook(source, read_only=True, data_only=True)
+        try:
+            n_funding = clean_funding_sheet(
+                workbook[foglio_finanziamenti], os.path.join(tmp_dir, CLEANED_FILES['finanziamenti']), chunk_size
+            )
+            n_categories = clean_category_sheet(
+                workbook[foglio_categorie], os.path.join(tmp_dir, CLEANED_FILES['categorie'])
+            )
+        finally:
+            workbook.close()
+
+        # Lo spostamento con os.replace conserva dimensione e data di modifica
+        outputs = {name: file_fingerprint(os.path.join(tmp_dir, filename))
+                   for name, filename in CLEANED_FILES.items()}
+        manifest = {
+            'source': {'path': os.path.abspath(source), **file_fingerprint(source)},
+            'outputs': outputs,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'rows': {'finanziamenti': n_funding, 'categorie': n_categories},
+            'seconds': round(time.perf_counter() - start, 3),
         }
-        
-        # Rinomina le colonne
-        df2 = df2.rename(columns=column_mapping)
-        
-        # Copia i dati
-        for new_col, old_col in column_mapping.items():
-            new_df2[new_col] = df2[old_col].dropna()
-        
-        # Pulisci gli spazi e rimuovi righe duplicate
-        new_df2 = new_df2.apply(lambda x: x.str.strip() if x.dtype == "object" else x)
-        new_df2 = new_df2.drop_duplicates()
-        
-        print("\nStruttura finale del secondo foglio:")
-        print(new_df2.head())
-        
-        # Salva entrambi i fogli nel file Excel
-        print("\nSalvataggio del file pulito...")
-        with pd.ExcelWriter(excel_file) as writer:
-            df1.to_excel(writer, sheet_name='projects_2025-02-15_IT', index=False)
-            new_df2.to_excel(writer, sheet_name='projects_2025-02-15_IT_con codi', index=False)
-        
-        print("File Excel aggiornato con successo!")
-        
+        for filename in CLEANED_FILES.values():
+            os.replace(os.path.join(tmp_dir, filename), os.path.join(output_dir, filename))
+        with open(os.path.join(tmp_dir, MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(os.path.join(tmp_dir, MANIFEST), os.path.join(output_dir, MANIFEST))
+        return manifest
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    from utils import FINANZIAMENTI_XLSX, FOGLIO_FINANZIAMENTI, FOGLIO_CATEGORIE
+
+    parser = argparse.ArgumentParser(
+        description="Converte il file Excel dei finanziamenti in file Parquet puliti (senza modificarlo)"
+    )
+    parser.add_argument('--sorgente', default=FINANZIAMENTI_XLSX, help="File Excel dei finanziamenti")
+    parser.add_argument('--uscita', default=CLEANED_DIR, help="Cartella dei file Parquet")
+    parser.add_argument('--foglio-finanziamenti', default=FOGLIO_FINANZIAMENTI)
+    parser.add_argument('--foglio-categorie', default=FOGLIO_CATEGORIE)
+    parser.add_argument('--blocco', type=int, default=CHUNK_ROWS, help="Righe per blocco scritto")
+    parser.add_argument('--forza', action='store_true', help="Rigenera anche se l'output è aggiornato")
+    args = parser.parse_args(argv)
+
+    try:
+        manifest = clean_workbook(args.sorgente, args.uscita, args.foglio_finanziamenti,
+                                  args.foglio_categorie, args.blocco, args.forza)
+    except ImportError as e:
+        print(f"Dipendenza mancante ({e}): installare pyarrow per scrivere i file Parquet")
+        return 1
     except Exception as e:
         print(f"Errore durante l'elaborazione del file: {e}")
-        import traceback
-        print(f"Traceback completo:\n{traceback.format_exc()}")
+        log.debug("Traceback completo", exc_info=True)
+        return 1
+
+    if manifest is None:
+        print(f"File puliti già aggiornati in {args.uscita}")
+    else:
+        print(f"File puliti salvati in {args.uscita}: {manifest['rows']['finanziamenti']} finanziamenti, "
+              f"{manifest['rows']['categorie']} categorie in {manifest['seconds']:.1f} s")
+    return 0
+
 
 if __name__ == "__main__":
-    clean_excel_file()
\ No newline at end of file
+    sys.exit(main())
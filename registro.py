@@ -0,0 +1,148 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Variabile d'ambiente che abilita i log per modulo, ad esempio
+#   SMARTCITY_LOG=utils,similarita=INFO,tempi
+# ("*" abilita tutti i moduli; il livello predefinito è DEBUG)
+LOG_ENV = 'SMARTCITY_LOG'
+# "json" stampa un record JSON per riga invece del testo
+LOG_FORMAT_ENV = 'SMARTCITY_LOG_FORMAT'
+
+ROOT_LOGGER = 'smartcity'
+# Logger dei tempi delle fasi della pipeline
+TIMING_LOGGER = 'tempi'
+
+# Campi standard di LogRecord, esclusi dai campi strutturati
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# Raccoglitore attivo dei tempi (vedi collect_stage_timings)
+_collector = contextvars.ContextVar('smartcity_stage_timings', default=None)
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formatta i record come testo o JSON, aggiungendo i campi passati con extra."""
+
+    def __init__(self, as_json=False):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+        self.as_json = as_json
+
+    def format(self, record):
+        fields = {key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS}
+        if self.as_json:
+            payload = {
+                'time': record.created,
+                'level': record.levelname,
+                'logger': record.name,
+                'message': record.getMessage(),
+                **fields,
+            }
+            if record.exc_info:
+                payload['exc_info'] = self.formatException(record.exc_info)
+            return json.dumps(payload, ensure_ascii=False, default=str)
+
+        text = super().format(record)
+        if fields:
+            text += " " + json.dumps(fields, ensure_ascii=False, default=str)
+        return text
+
+
+def _parse_spec(spec):
+    """Converte 'utils,similarita=INFO' in {'utils': DEBUG, 'similarita': INFO}."""
+    levels = {}
+    for entry in spec.split(','):
+        name, _, level = entry.strip().partition('=')
+        if not name:
+            continue
+        levels[name] = logging.getLevelName(level.strip().upper()) if level else logging.DEBUG
+        if not isinstance(levels[name], int):
+            levels[name] = logging.DEBUG
+    return levels
+
+
+def configure_logging(spec=None, as_json=None, stream=None):
+    """
+    Configura i logger dell'applicazione. Senza spec (né SMARTCITY_LOG)
+    vengono mostrati solo avvisi ed errori; i moduli elencati in spec
+    registrano anche i messaggi di dettaglio.
+    """
+    spec = os.environ.get(LOG_ENV, '') if spec is None else spec
+    if as_json is None:
+        as_json = os.environ.get(LOG_FORMAT_ENV, '').lower() == 'json'
+
+    root = logging.getLogger(ROOT_LOGGER)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(StructuredFormatter(as_json))
+    root.addHandler(handler)
+    root.propagate = False
+    root.setLevel(logging.WARNING)
+
+    # Riporta i logger già creati al livello ereditato
+    for name in list(logging.Logger.manager.loggerDict):
+        if name.startswith(ROOT_LOGGER + '.'):
+            logging.getLogger(name).setLevel(logging.NOTSET)
+
+    for name, level in _parse_spec(spec).items():
+        if name in ('*', 'all'):
+            root.setLevel(level)
+        else:
+            logging.getLogger(f"{ROOT_LOGGER}.{name}").setLevel(level)
+
+
+def get_logger(name):
+    """Logger del modulo name (ad esempio __name__) sotto il logger dell'applicazione."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name.rsplit('.', 1)[-1]}")
+
+
+_timing_log = get_logger(TIMING_LOGGER)
+
+
+@contextmanager
+def stage_timer(stage, **fields):
+    """
+    Misura il tempo reale di una fase della pipeline (load, scale, distance,
+    topk, match, funding, render). Il record {'stage', 'ms', ...fields}
+    viene aggiunto al raccoglitore attivo e registrato sul logger 'tempi'.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        records = _collector.get()
+        if records is not None or _timing_log.isEnabledFor(logging.DEBUG):
+            record = {'stage': stage, 'ms': round(elapsed_ms, 3), **fields}
+            if records is not None:
+                records.append(record)
+            _timing_log.debug("fase %s: %.3f ms", stage, elapsed_ms, extra=record)
+
+
+@contextmanager
+def collect_stage_timings():
+    """
+    Raccoglie in una lista i record di stage_timer eseguiti nel blocco
+    (nello stesso thread o task), ad esempio per una singola analisi.
+    """
+    records = []
+    token = _collector.set(records)
+    try:
+        yield records
+    finally:
+        _collector.reset(token)
+
+
+def summarize_stage_timings(records):
+    """Somma i millisecondi per fase: {'distance': 1.2, 'topk': 0.3, ...}."""
+    totals = {}
+    for record in records:
+        totals[record['stage']] = totals.get(record['stage'], 0.0) + record['ms']
+    return totals
+
+
+configure_logging()
@@ -0,0 +1,332 @@
+import argparse
+import csv
+import json
+import string
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils import prepare_city_features, NUMERICAL_COLUMNS
+from dataset import load_dataset
+from archivio import load_shared_dataset, STORE_DIR
+from pipeline import match_projects
+from pesi import configure_weights
+from metriche import configure_metric, METRICHE, NORMALIZZAZIONI
+
+# Etichette degli scenari più frequenti nella mappa testuale (gli altri sono OTHER_LABEL)
+LABELS = string.ascii_uppercase + string.ascii_lowercase + string.digits
+OTHER_LABEL = '.'
+# Righe e colonne massime della mappa testuale (la griglia viene campionata)
+MAP_SIZE = 40
+# Numero massimo di varianti per asse
+MAX_STEPS = 1000
+
+
+def city_vector(data, city):
+    """Vettore grezzo (ordine di numerical_columns) di una città del dataset."""
+    index = data.similarity_index
+    positions = np.flatnonzero(np.asarray(index.cities).astype(str) == city)
+    if not len(positions):
+        raise ValueError(f"Città non trovata: {city}")
+    if data.df is not None:
+        row = data.df.loc[data.df['City'].astype(str) == city, data.numerical_columns].to_numpy(dtype=np.float64)
+        return data.scaler.inverse_transform(row[:1])[0]
+    # Con l'archivio mappato si ricava dalla matrice pesata
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (index.features_t[:, positions[0]] - index._offset) / index._scale
+
+
+def csv_vector(path, row=0):
+    """Vettore grezzo di una riga di un CSV con lo schema di cities.csv."""
+    raw = pd.read_csv(path)
+    if not 0 <= row < len(raw):
+        raise ValueError(f"Riga {row + 1} assente in {path} ({len(raw)} righe)")
+    # Si converte solo la riga scelta: le altre possono avere valori non validi
+    prepared = prepare_city_features(raw.iloc[[row]])
+    values = prepared[NUMERICAL_COLUMNS].iloc[0].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    if np.isnan(values).any():
+        raise ValueError(f"Caratteristiche mancanti o non valide nella riga {row + 1} di {path}")
+    return values
+
+
+def parse_axis(spec):
+    """Legge un asse nel formato "COLONNA=DA:A:PASSI" e restituisce (colonna, da, a, passi)."""
+    col, separator, bounds = spec.rpartition('=')
+    parts = bounds.split(':')
+    if not separator or not col.strip() or len(parts) != 3:
+        raise ValueError(f"Asse non valido: {spec} (atteso COLONNA=DA:A:PASSI)")
+    return col.strip(), parts[0], parts[1], parts[2]
+
+
+def axis_values(base_value, start, stop, steps):
+    """
+    Valori di un asse: start e stop sono numeri assoluti oppure variazioni
+    percentuali rispetto al valore di base (es. "-20%" e "+20%").
+    """
+    steps = int(steps)
+    if not 2 <= steps <= MAX_STEPS:
+        raise ValueError(f"Il numero di passi deve essere tra 2 e {MAX_STEPS}")
+
+    def parse(value):
+        value = str(value).strip()
+        if value.endswith('%'):
+            return base_value * (1 + float(value[:-1]) / 100)
+        return float(value)
+
+    return np.linspace(parse(start), parse(stop), steps)
+
+
+def sweep(data, base, axes, k=5, smart_city_scope=None, duration=None):
+    """
+    Valuta tutte le varianti del vettore grezzo base in cui le feature di
+    axes (lista di (colonna, valori), una o due) assumono i valori indicati.
+    Le varianti con lo stesso insieme di k città simili formano uno
+    scenario; i progetti (con ambito e durata) si cercano una sola volta
+    per scenario. Restituisce un dizionario con la griglia degli scenari
+    (forma n1 oppure n1 × n2), gli indici delle città e le similarità di
+    ogni variante e, per ogni scenario, città entrate e uscite rispetto
+    alla base.
+    """
+    index = data.similarity_index
+    base = np.asarray(base, dtype=np.float64)
+    axes = [(col, np.asarray(values, dtype=np.float64)) for col, values in axes]
+    unknown = [col for col, _ in axes if col not in index.numerical_columns]
+    if unknown:
+        raise ValueError(f"Colonne sconosciute: {unknown}")
+
+    indices, similarities = index.query_grid(base, axes, k=k)
+    base_indices, base_similarities = index.query(base, k=k)
+    shape = indices.shape[:-1]
+    k = indices.shape[-1]
+    flat = indices.reshape(-1, k)
+
+    # Scenari numerati dal più frequente (a parità, dal primo nella griglia)
+    _, first, inverse, counts = np.unique(np.sort(flat, axis=1), axis=0, return_index=True,
+                                          return_inverse=True, return_counts=True)
+    order = np.lexsort((first, -counts))
+    renumber = np.empty_like(order)
+    renumber[order] = np.arange(len(order))
+    scenario = renumber[inverse.ravel()]
+    counts = counts[order]
+
+    cities = np.asarray(index.cities).astype(str)
+    with_projects = smart_city_scope is not None and duration is not None
+
+    def projects(top, top_similarities):
+        similar = [(cities[i], float(s)) for i, s in zip(top, top_similarities)]
+        perfect, partial = match_projects(data.project_index, similar, smart_city_scope, duration)
+        return {'perfect': perfect, 'partial': partial}
+
+    def names(projects_found):
+        return {(p['city'], p['name']) for key in ('perfect', 'partial') for p in projects_found[key]}
+
+    base_cities = [str(cities[i]) for i in base_indices]
+    base_result = {'cities': base_cities, 'similarities': [float(s) for s in base_similarities]}
+    if with_projects:
+        base_result['projects'] = projects(base_indices, base_similarities)
+
+    scenarios = []
+    for number, position in enumerate(first[order]):
+        top = flat[position]
+        scenario_cities = [str(cities[i]) for i in top]
+        entry = {
+            'label': LABELS[number] if number < len(LABELS) else OTHER_LABEL,
+            'cities': scenario_cities,
+            'cells': int(counts[number]),
+            'entered': [c for c in scenario_cities if c not in base_cities],
+            'left': [c for c in base_cities if c not in scenario_cities],
+        }
+        if with_projects:
+            entry['projects'] = projects(top, similarities.reshape(-1, k)[position])
+            entry['projects_changed'] = names(entry['projects']) != names(base_result['projects'])
+        scenarios.append(entry)
+
+    return {
+        'axes': axes,
+        'base_vector': base,
+        'base': base_result,
+        'scenario': scenario.reshape(shape),
+        'indices': indices,
+        'similarities': similarities,
+        'city_names': cities,
+        'scenarios': scenarios,
+        'smart_city_scope': smart_city_scope,
+        'duration': duration,
+    }
+
+
+def _format_value(value):
+    return f"{value:.4g}"
+
+
+def _segments(scenario, values):
+    """Intervalli consecutivi di valori di un asse con lo stesso scenario."""
+    segments = []
+    start = 0
+    for i in range(1, len(scenario) + 1):
+        if i == len(scenario) or scenario[i] != scenario[start]:
+            segments.append((values[start], values[i - 1], scenario[start]))
+            start = i
+    return segments
+
+
+def format_sweep(result, map_size=MAP_SIZE):
+    """Resoconto testuale dello scenario: città di base, mappa degli scenari e legenda."""
+    axes = result['axes']
+    scenario = result['scenario']
+    scenarios = result['scenarios']
+    lines = [
+        "=== SCENARI WHAT-IF ===",
+        "Città simili alla base: " + ", ".join(
+            f"{city} ({s:.2f}%)" for city, s in zip(result['base']['cities'], result['base']['similarities'])
+        ),
+        f"Varianti valutate: {scenario.size}; scenari distinti: {len(scenarios)}",
+        "",
+    ]
+
+    if len(axes) == 1:
+        col, values = axes[0]
+        lines.append(f"{col}:")
+        for low, high, number in _segments(scenario, values):
+            interval = _format_value(low) if low == high else f"{_format_value(low)} – {_format_value(high)}"
+            lines.append(f"  {interval:<24} scenario {scenarios[number]['label']}")
+    else:
+        (col1, values1), (col2, values2) = axes
+        rows = np.unique(np.linspace(0, len(values1) - 1, min(map_size, len(values1))).round().astype(int))
+        columns = np.unique(np.linspace(0, len(values2) - 1, min(map_size, len(values2))).round().astype(int))
+        lines.append(f"Righe: {col1}; colonne: {col2} "
+                     f"({_format_value(values2[columns[0]])} → {_format_value(values2[columns[-1]])})")
+        for i in rows:
+            labels = "".join(scenarios[number]['label'] for number in scenario[i, columns])
+            lines.append(f"  {_format_value(values1[i]):>10} {labels}")
+
+    lines.append("")
+    lines.append("Legenda:")
+    for entry in scenarios[:len(LABELS)]:
+        changes = []
+        if entry['entered']:
+            changes.append("entrano " + ", ".join(entry['entered']))
+        if entry['left']:
+            changes.append("escono " + ", ".join(entry['left']))
+        lines.append(f"  {entry['label']} ({entry['cells']} varianti): " + ", ".join(entry['cities']))
+        lines.append("      " + ("; ".join(changes) if changes else "stesse città della base"))
+        if 'projects' in entry:
+            projects = entry['projects']
+            status = "progetti diversi dalla base" if entry['projects_changed'] else "stessi progetti della base"
+            lines.append(f"      {len(projects['perfect'])} match perfetti, "
+                         f"{len(projects['partial'])} parziali ({status})")
+    others = scenarios[len(LABELS):]
+    if others:
+        lines.append(f"  {OTHER_LABEL} altri {len(others)} scenari in {sum(e['cells'] for e in others)} varianti")
+    return "\n".join(lines)
+
+
+def write_sweep(result, path):
+    """Salva il risultato: CSV con una riga per variante, altrimenti JSON."""
+    axes = result['axes']
+    scenario = result['scenario']
+    indices = result['indices'].reshape(scenario.size, -1)
+    similarities = result['similarities'].reshape(scenario.size, -1)
+    grid = np.stack(np.meshgrid(*[values for _, values in axes], indexing='ij'), axis=-1).reshape(scenario.size, -1)
+    scenarios = result['scenarios']
+
+    if path.lower().endswith('.csv'):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow([col for col, _ in axes] + ['scenario', 'similar_cities'])
+            for values, number, top, top_similarities in zip(grid, scenario.ravel(), indices, similarities):
+                similar = "; ".join(
+                    f"{city} ({s:.2f}%)" for city, s in zip(result['city_names'][top], top_similarities)
+                )
+                writer.writerow([*values, scenarios[number]['label'], similar])
+        return
+
+    payload = {
+        'axes': [{'column': col, 'values': values.tolist()} for col, values in axes],
+        'base_vector': dict(zip(NUMERICAL_COLUMNS, result['base_vector'].tolist())),
+        'base': result['base'],
+        'smart_city_scope': result['smart_city_scope'],
+        'duration': result['duration'],
+        'scenario': scenario.tolist(),
+        'scenarios': scenarios,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Scenari what-if: varia una o due caratteristiche di una città e mostra come "
+                    "cambiano le città simili e i progetti corrispondenti"
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--citta', help="Città del dataset usata come base")
+    source.add_argument('--base', metavar='CSV', help="CSV con lo schema di cities.csv (si usa la prima riga)")
+    parser.add_argument('--riga', type=int, default=1, help="Riga del CSV di base (da 1)")
+    parser.add_argument('--varia', action='append', required=True, metavar='COLONNA=DA:A:PASSI',
+                        help="Caratteristica da variare, con estremi assoluti o percentuali rispetto alla base "
+                             "(es. \"Costo della vita (€/mese)=-20%%:+20%%:100\"); "
+                             "ripetibile una volta per una griglia a due dimensioni")
+    parser.add_argument('--k', type=int, default=5, help="Numero di città simili")
+    parser.add_argument('--ambito', default=None, help="Ambito smart city per il confronto dei progetti")
+    parser.add_argument('--durata', default=None, help="Durata dell'investimento per il confronto dei progetti")
+    parser.add_argument('--uscita', default=None, help="Salva ogni variante (.csv) o gli scenari (.json)")
+    parser.add_argument('--mappa', type=int, default=MAP_SIZE, help="Righe e colonne massime della mappa")
+    parser.add_argument('--ricostruisci-cache', action='store_true', help="Ricostruisce la cache dei dati")
+    parser.add_argument('--compatto', action='store_true', help="Carica i dataset in modalità compatta")
+    parser.add_argument('--archivio', metavar='CARTELLA', nargs='?', const=STORE_DIR, default=None,
+                        help=f"Usa l'archivio mappato in memoria (default: {STORE_DIR})")
+    parser.add_argument('--pesi', default=None,
+                        help="Profilo di pesi (nome di pesi.py o file JSON, come SMARTCITY_PESI)")
+    parser.add_argument('--metrica', choices=list(METRICHE), default=None,
+                        help="Metrica di similarità (come SMARTCITY_METRICA, default: euclidea)")
+    parser.add_argument('--normalizzazione', choices=list(NORMALIZZAZIONI), default=None,
+                        help="Similarità normalizzate sulla singola ricerca o sul dataset "
+                             "(come SMARTCITY_NORMALIZZAZIONE, default: ricerca)")
+    args = parser.parse_args(argv)
+    if len(args.varia) > 2:
+        parser.error("Si possono variare al massimo due caratteristiche")
+    if args.k < 1:
+        parser.error("--k deve essere almeno 1")
+    if (args.ambito is None) != (args.durata is None):
+        parser.error("--ambito e --durata vanno indicati insieme")
+    if args.pesi:
+        try:
+            configure_weights(args.pesi)
+        except ValueError as e:
+            parser.error(str(e))
+    configure_metric(args.metrica, args.normalizzazione)
+
+    compact = True if args.compatto else None
+    if args.archivio:
+        data = load_shared_dataset(args.archivio, force_rebuild=args.ricostruisci_cache, compact=compact)
+    else:
+        data = load_dataset(force_rebuild=args.ricostruisci_cache, compact=compact)
+
+    try:
+        base = city_vector(data, args.citta) if args.citta else csv_vector(args.base, args.riga - 1)
+        axes = []
+        for col, start, stop, steps in map(parse_axis, args.varia):
+            if col not in data.numerical_columns:
+                raise ValueError(f"Colonna sconosciuta: {col} (disponibili: {', '.join(data.numerical_columns)})")
+            if any(col == other for other, _ in axes):
+                raise ValueError(f"La colonna {col} è indicata due volte in --varia")
+            axes.append((col, axis_values(base[data.numerical_columns.index(col)], start, stop, steps)))
+
+        start = time.perf_counter()
+        result = sweep(data, base, axes, k=args.k, smart_city_scope=args.ambito, duration=args.durata)
+        elapsed = time.perf_counter() - start
+    except (ValueError, IndexError) as e:
+        parser.error(str(e))
+    print(format_sweep(result, args.mappa))
+    print(f"\n{result['scenario'].size} varianti valutate in {elapsed * 1000:.1f} ms")
+    if args.uscita:
+        write_sweep(result, args.uscita)
+        print(f"Risultati salvati in {args.uscita}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,319 @@
+import argparse
+import asyncio
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import numpy as np
+
+from utils import NUMERICAL_COLUMNS
+from dataset import load_dataset
+from archivio import load_shared_dataset, STORE_DIR
+from cache_risultati import RecommendationCache
+from pesi import configure_weights
+from metriche import configure_metric, METRICHE, NORMALIZZAZIONI
+
+# Dimensione massima del corpo di una richiesta
+MAX_BODY_SIZE = 1 << 20
+
+
+class RequestError(Exception):
+    """Richiesta non valida: viene restituita al client con stato 400."""
+
+
+class SimilarityBatcher:
+    """
+    Raccoglie le richieste di similarità concorrenti e le esegue insieme
+    con una sola chiamata vettorizzata a query_batch nell'executor.
+    """
+
+    def __init__(self, index, executor, max_batch=256, max_wait=0.002):
+        self.index = index
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.queries = 0
+
+    async def query(self, features, k):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((features, k, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Una sola ricerca con il k massimo: ogni richiesta prende i suoi primi k
+            k_max = max(k for _, k, _ in batch)
+            matrix = np.array([features for features, _, _ in batch], dtype=np.float32)
+            try:
+                indices, similarities = await loop.run_in_executor(
+                    self.executor, self.index.query_batch, matrix, k_max
+                )
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.queries += len(batch)
+            for row, (_, k, future) in enumerate(batch):
+                if not future.done():
+                    future.set_result([
+                        {'city': str(self.index.cities[i]), 'similarity': float(s)}
+                        for i, s in zip(indices[row, :k], similarities[row, :k])
+                    ])
+
+
+def parse_features(payload):
+    """Accetta le caratteristiche come lista ordinata o come dizionario per colonna."""
+    features = payload.get('features')
+    if isinstance(features, dict):
+        missing = [col for col in NUMERICAL_COLUMNS if col not in features]
+        if missing:
+            raise RequestError(f"Caratteristiche mancanti: {missing}")
+        features = [features[col] for col in NUMERICAL_COLUMNS]
+    if not isinstance(features, list) or len(features) != len(NUMERICAL_COLUMNS):
+        raise RequestError(f"'features' deve contenere {len(NUMERICAL_COLUMNS)} valori")
+    try:
+        values = [float(value) for value in features]
+    except (TypeError, ValueError):
+        raise RequestError("'features' deve contenere solo valori numerici")
+    # float() accetta anche "NaN" e "Infinity"
+    if not all(math.isfinite(value) for value in values):
+        raise RequestError("'features' deve contenere solo valori finiti")
+    return values
+
+
+def parse_int(payload, key, default, minimum):
+    """Intero opzionale del payload, almeno minimum (anche come stringa, es. "5")."""
+    value = payload.get(key, default)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise RequestError(f"'{key}' deve essere un numero intero")
+    try:
+        value = int(value)
+    except ValueError:
+        raise RequestError(f"'{key}' deve essere un numero intero")
+    if value < minimum:
+        raise RequestError(f"'{key}' deve essere almeno {minimum}")
+    return value
+
+
+def require(payload, *keys):
+    missing = [key for key in keys if key not in payload]
+    if missing:
+        raise RequestError(f"Campi mancanti: {missing}")
+    return [payload[key] for key in keys]
+
+
+class RecommendationService:
+    """Endpoint JSON sopra un'unica copia in memoria dei dataset."""
+
+    def __init__(self, data, workers=4, max_batch=256, max_wait=0.002, cache_size=1024, cache_ttl=600):
+        self.data = data
+        self.cache = RecommendationCache(maxsize=cache_size, ttl=cache_ttl)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.batcher = SimilarityBatcher(data.similarity_index, self.executor, max_batch, max_wait)
+        self.routes = {
+            ('GET', '/health'): self.health,
+            ('POST', '/similar'): self.similar,
+            ('POST', '/projects'): self.projects,
+            ('POST', '/funding'): self.funding,
+        }
+
+    async def health(self, payload):
+        return {
+            'status': 'ok',
+            'cities': len(self.data.similarity_index),
+            'metric': self.data.similarity_index.metric.name,
+            'normalization': self.data.similarity_index.normalization,
+            'batches': self.batcher.batches,
+            'queries': self.batcher.queries,
+            'cache': self.cache.stats(),
+        }
+
+    async def similar(self, payload):
+        features = parse_features(payload)
+        k = parse_int(payload, 'k', 5, minimum=1)
+        # Le richieste già viste non passano dal micro-batch
+        self.cache.bind(self.data)
+        key = ('http', self.cache.feature_key(self.data.similarity_index, features), k)
+        found, similar_cities = self.cache.similarity.get(key)
+        if not found:
+            similar_cities = await self.batcher.query(features, k)
+            self.cache.similarity.put(key, similar_cities)
+        return {'similar_cities': similar_cities}
+
+    async def projects(self, payload):
+        similar_cities, smart_city_scope, duration = require(
+            payload, 'similar_cities', 'smart_city_scope', 'duration'
+        )
+        try:
+            similar_cities = [(str(city), float(similarity)) for city, similarity in similar_cities]
+        except (TypeError, ValueError):
+            raise RequestError("'similar_cities' deve essere una lista di coppie [città, similarità]")
+
+        report = await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.cache.project_report, self.data, similar_cities,
+            str(smart_city_scope), str(duration)
+        )
+        return {'report': report}
+
+    async def funding(self, payload):
+        provincia, smart_city_scope = require(payload, 'provincia', 'smart_city_scope')
+        page = parse_int(payload, 'page', 0, minimum=0)
+        page_size = parse_int(payload, 'page_size', 20, minimum=1)
+
+        def lookup():
+            results = self.cache.available_funding(self.data, str(provincia), str(smart_city_scope))
+            results = results.with_page_size(page_size)
+            # Un risultato vuoto ha comunque la pagina 0
+            if page >= results.n_pages:
+                raise RequestError(f"'page' deve essere minore di {results.n_pages}")
+            return {
+                'header': results.header(),
+                'count': len(results),
+                'n_pages': results.n_pages,
+                'page': page,
+                'page_text': results.format_page(page),
+            }
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, lookup)
+
+    async def handle(self, method, path, body):
+        """Instrada una richiesta e restituisce (stato, corpo JSON)."""
+        route = self.routes.get((method, path))
+        if route is None:
+            return HTTPStatus.NOT_FOUND, {'error': f"Endpoint non trovato: {method} {path}"}
+        try:
+            payload = json.loads(body) if body else {}
+            if not isinstance(payload, dict):
+                raise RequestError("Il corpo della richiesta deve essere un oggetto JSON")
+            return HTTPStatus.OK, await route(payload)
+        except (RequestError, json.JSONDecodeError, ValueError) as e:
+            return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"Errore interno: {e}"}
+
+    async def handle_connection(self, reader, writer):
+        """Gestisce una connessione HTTP/1.1 con keep-alive."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    # Senza una lunghezza valida il corpo non si può separare dalla richiesta successiva
+                    status, response = HTTPStatus.BAD_REQUEST, {'error': "Content-Length non valido"}
+                    keep_alive = False
+                elif length > MAX_BODY_SIZE:
+                    status, response = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': "Richiesta troppo grande"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    status, response = await self.handle(method.upper(), target.split('?')[0], body)
+                    keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+                data = json.dumps(response, ensure_ascii=False).encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        batcher_task = asyncio.create_task(self.batcher.run())
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Servizio raccomandazioni in ascolto su http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher_task.cancel()
+            self.executor.shutdown(wait=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servizio HTTP delle raccomandazioni smart city")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=4, help="Thread dell'executor per il calcolo")
+    parser.add_argument('--max-batch', type=int, default=256, help="Query di similarità per micro-batch")
+    parser.add_argument('--max-wait-ms', type=float, default=2.0, help="Attesa massima per riempire un micro-batch")
+    parser.add_argument('--cache-size', type=int, default=1024, help="Risultati in cache per fase")
+    parser.add_argument('--compatto', action='store_true',
+                        help="Carica i dataset in modalità compatta (float32 e colonne categoriche)")
+    parser.add_argument('--cache-ttl', type=float, default=600, help="Durata dei risultati in cache (secondi)")
+    parser.add_argument('--archivio', metavar='CARTELLA', nargs='?', const=STORE_DIR, default=None,
+                        help=f"Mappa i dataset dall'archivio condiviso tra più istanze (default: {STORE_DIR})")
+    parser.add_argument('--pesi', default=None,
+                        help="Profilo di pesi (nome di pesi.py o file JSON, come SMARTCITY_PESI)")
+    parser.add_argument('--metrica', choices=list(METRICHE), default=None,
+                        help="Metrica di similarità (come SMARTCITY_METRICA, default: euclidea)")
+    parser.add_argument('--normalizzazione', choices=list(NORMALIZZAZIONI), default=None,
+                        help="Similarità normalizzate sulla singola ricerca o sul dataset "
+                             "(come SMARTCITY_NORMALIZZAZIONE, default: ricerca)")
+    args = parser.parse_args(argv)
+    if args.pesi:
+        try:
+            configure_weights(args.pesi)
+        except ValueError as e:
+            parser.error(str(e))
+    configure_metric(args.metrica, args.normalizzazione)
+
+    compact = True if args.compatto else None
+    if args.archivio:
+        data = load_shared_dataset(args.archivio, compact=compact)
+    else:
+        data = load_dataset(compact=compact)
+    service = RecommendationService(data, args.workers, args.max_batch, args.max_wait_ms / 1000,
+                                    args.cache_size, args.cache_ttl)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,511 @@
+import copy
+import time
+
+import numpy as np
+
+from metriche import make_metric, check_normalization, active_metric, active_normalization
+from pesi import PROFILI, PROFILO_PREDEFINITO, active_weights
+from registro import stage_timer
+
+# Pesi del profilo predefinito (vedi pesi.py per gli altri profili)
+WEIGHTS = PROFILI[PROFILO_PREDEFINITO]
+
+
+# Numero massimo di distanze (query × città) calcolate per blocco
+MAX_CHUNK_ELEMENTS = 4_000_000
+# Lato dei riquadri di varianti in cui query_grid divide le griglie grandi
+GRID_TILE = 5
+
+
+class SimilarityIndex:
+    """
+    Indice precalcolato per la ricerca delle città più simili.
+    Contiene la matrice delle caratteristiche già normalizzate e pesate
+    in float32, i nomi delle città e lo scaler usato in load_data.
+    Se weights non è indicato si usano i pesi del profilo attivo (pesi.py),
+    se metric e normalization non sono indicate quelle attive (metriche.py).
+    Lo stato della metrica (spazio di ricerca e distanza di riferimento)
+    viene calcolato una sola volta alla costruzione.
+    """
+
+    def __init__(self, df, scaler, numerical_columns, weights=None, metric=None, normalization=None):
+        if weights is None:
+            weights = active_weights()
+        self.numerical_columns = list(numerical_columns)
+        self.scaler = scaler
+        self.weights = np.array(
+            [weights.get(col, 1.0) for col in self.numerical_columns], dtype=np.float32
+        )
+
+        # Matrice pesata memorizzata come (feature × città): ogni feature è
+        # contigua, così il calcolo delle distanze scorre la memoria in ordine
+        features = df[self.numerical_columns].to_numpy(dtype=np.float32) * self.weights
+        self.features_t = np.ascontiguousarray(features.T)
+        self.cities = df['City'].to_numpy()
+
+        # Normalizzazione min-max e pesi combinati in una sola scala + offset
+        self._scale = (scaler.scale_ * self.weights).astype(np.float32)
+        self._offset = (scaler.min_ * self.weights).astype(np.float32)
+        self._fit_metric(metric, normalization)
+
+    @classmethod
+    def from_arrays(cls, features_t, cities, scaler, numerical_columns, weights,
+                    metric=None, normalization=None):
+        """
+        Indice su array già normalizzati e pesati (feature × città), ad esempio
+        mappati in memoria da archivio.py: gli array vengono usati senza copie
+        (con la metrica euclidea anche come spazio di ricerca).
+        weights è il vettore dei pesi nell'ordine di numerical_columns.
+        """
+        index = cls.__new__(cls)
+        index.numerical_columns = list(numerical_columns)
+        index.scaler = scaler
+        index.weights = np.asarray(weights, dtype=np.float32)
+        index.features_t = features_t
+        index.cities = cities
+        index._scale = (scaler.scale_ * index.weights).astype(np.float32)
+        index._offset = (scaler.min_ * index.weights).astype(np.float32)
+        index._fit_metric(metric, normalization)
+        return index
+
+    def _fit_metric(self, metric=None, normalization=None):
+        """
+        Addestra la metrica sulla matrice pesata e prepara lo spazio di
+        ricerca (search_t, feature dello spazio × città) e la distanza di
+        riferimento per la normalizzazione sul dataset.
+        """
+        self.metric = make_metric(metric or active_metric())
+        self.normalization = check_normalization(normalization or active_normalization())
+        self.metric.fit(self.features, self.weights, self.numerical_columns)
+        embedded = self.metric.embed(self.features)
+        # Con la metrica euclidea lo spazio di ricerca è la matrice pesata stessa
+        self.search_t = self.features_t if embedded is self.features else np.ascontiguousarray(embedded.T)
+        self.reference_distance = self.metric.reference_distance(self.search_t)
+
+    def __len__(self):
+        return self.features_t.shape[1]
+
+    def extended(self, df, scaler, n_existing, changed_columns=()):
+        """
+        Nuovo indice per df, già normalizzato con scaler, le cui prime
+        n_existing città sono quelle di questo indice. Vengono ricalcolate
+        solo le colonne in changed_columns (limiti min/max cambiati) e
+        aggiunte le città nuove; l'indice corrente non viene modificato.
+        """
+        other = copy.copy(self)
+        other.scaler = scaler
+        other._scale = (scaler.scale_ * self.weights).astype(np.float32)
+        other._offset = (scaler.min_ * self.weights).astype(np.float32)
+
+        features_t = np.empty((len(self.numerical_columns), len(df)), dtype=np.float32)
+        features_t[:, :n_existing] = self.features_t[:, :n_existing]
+        for col in changed_columns:
+            j = self.numerical_columns.index(col)
+            features_t[j, :n_existing] = df[col].to_numpy(dtype=np.float32)[:n_existing] * self.weights[j]
+        new_rows = df[self.numerical_columns].to_numpy(dtype=np.float32)[n_existing:] * self.weights
+        features_t[:, n_existing:] = new_rows.T
+        other.features_t = features_t
+        other.cities = df['City'].to_numpy()
+        # Lo stato della metrica (ad esempio la covarianza) dipende da tutte le città
+        other._fit_metric(self.metric.name, self.normalization)
+        return other
+
+    @property
+    def features(self):
+        """Vista (città × feature) della matrice pesata, senza copie."""
+        return self.features_t.T
+
+    def transform(self, features):
+        """
+        Normalizza e pesa uno o più vettori grezzi nell'ordine di numerical_columns.
+        Valori NaN o infiniti (anche oltre il limite di float32) sollevano ValueError.
+        """
+        with np.errstate(over='ignore'):
+            features = np.asarray(features, dtype=np.float32)
+        if not np.isfinite(features).all():
+            raise ValueError("Le caratteristiche devono essere valori numerici finiti")
+        return features * self._scale + self._offset
+
+    def embed(self, features):
+        """Porta uno o più vettori grezzi nello spazio di ricerca della metrica."""
+        return self.metric.embed(self.transform(features))
+
+    def contributions(self, features, indices):
+        """
+        Contributo di ogni feature alla distanza tra i vettori grezzi features
+        e le città in indices, di forma (query × k × feature), oppure
+        (k × feature) per un solo vettore. Con le metriche somma di termini
+        per feature (euclidea, Gower) la somma sull'ultimo asse è la distanza
+        al quadrato della ricerca; con coseno e Mahalanobis i contributi sono
+        le differenze pesate al quadrato, indicative delle caratteristiche
+        più diverse. Si leggono solo le colonne delle k città indicate.
+        """
+        single = np.ndim(features) == 1
+        weighted = self.transform(np.atleast_2d(features))
+        indices = np.asarray(indices, dtype=np.intp).reshape(len(weighted), -1)
+        block_starts = self.metric.block_starts
+        if block_starts is None:
+            diff = self.features_t[:, indices] - weighted.T[:, :, None]
+            contributions = np.moveaxis(diff * diff, 0, -1)
+        else:
+            embedded = self.metric.embed(weighted)
+            diff = self.search_t[:, indices] - embedded.T[:, :, None]
+            contributions = np.moveaxis(np.add.reduceat(diff * diff, block_starts, axis=0), 0, -1)
+        return contributions[0] if single else contributions
+
+    def _squared_distances(self, weighted_queries, features_t=None):
+        """
+        Distanze euclidee al quadrato tra le query (m × d) già nello spazio di
+        ricerca e le città di features_t (d × n), per default tutte quelle
+        dell'indice.
+        """
+        features_t = self.search_t if features_t is None else features_t
+        m = weighted_queries.shape[0]
+        squared = np.zeros((m, features_t.shape[1]), dtype=np.float32)
+        diff = np.empty_like(squared)
+        for j, column in enumerate(features_t):
+            np.subtract(column, weighted_queries[:, j:j + 1], out=diff)
+            np.multiply(diff, diff, out=diff)
+            squared += diff
+        return squared
+
+    def query(self, features, k=5):
+        """
+        Restituisce gli indici delle k città più simili al vettore grezzo
+        features e le rispettive similarità percentuali.
+        """
+        with stage_timer('scale'):
+            weighted = self.embed(features).reshape(1, -1)
+        with stage_timer('distance', cities=len(self)):
+            squared = self._squared_distances(weighted)
+        with stage_timer('topk', k=k):
+            top, similarities = self._top_k(squared, k)
+        return top[0], similarities[0]
+
+    def query_batch(self, features, k=5, chunk_size=None):
+        """
+        Ricerca vettorizzata per una matrice (N × feature) di città candidate.
+        Le righe vengono elaborate a blocchi per limitare la memoria usata;
+        i risultati coincidono con quelli di query riga per riga.
+        """
+        # I valori fuori dal limite di float32 diventano infiniti e vengono rifiutati da transform
+        with np.errstate(over='ignore'):
+            features = np.asarray(features, dtype=np.float32)
+        if features.ndim != 2 or features.shape[1] != len(self.numerical_columns):
+            raise ValueError(
+                f"Attesa una matrice con {len(self.numerical_columns)} colonne, "
+                f"ricevuta forma {features.shape}"
+            )
+
+        if chunk_size is None:
+            chunk_size = max(1, MAX_CHUNK_ELEMENTS // max(len(self), 1))
+
+        n_queries = features.shape[0]
+        k = min(k, len(self))
+        indices = np.empty((n_queries, k), dtype=np.intp)
+        similarities = np.empty((n_queries, k), dtype=np.float32)
+        for start in range(0, n_queries, chunk_size):
+            stop = min(start + chunk_size, n_queries)
+            with stage_timer('scale', queries=stop - start):
+                weighted = self.embed(features[start:stop])
+            with stage_timer('distance', queries=stop - start, cities=len(self)):
+                squared = self._squared_distances(weighted)
+            with stage_timer('topk', queries=stop - start, k=k):
+                indices[start:stop], similarities[start:stop] = self._top_k(squared, k)
+        return indices, similarities
+
+    def query_grid(self, base, axes, k=5, tile=GRID_TILE):
+        """
+        Ricerca per una griglia di varianti del vettore grezzo base in cui
+        cambiano una o due feature: axes è una lista di (colonna, valori grezzi).
+        Con le metriche somma di termini per feature (euclidea, Gower) la
+        distanza al quadrato si scompone in una parte fissa (feature non
+        variate) più un termine per asse (valori × città), sommati per
+        broadcasting senza costruire i vettori della griglia; con le altre
+        metriche le varianti vengono cercate con query_batch esatta.
+        Le griglie grandi si elaborano a riquadri di tile × tile varianti:
+        per ogni riquadro si scartano le città che non possono entrare tra le
+        k più vicine né essere la più lontana (da cui dipende la similarità
+        normalizzata sulla ricerca), usando i limiti inferiore e superiore
+        della loro distanza nel riquadro. Il risultato è esatto su tutte le città.
+        Restituisce indici e similarità di forma (n1 × k) oppure (n1 × n2 × k).
+        """
+        if not 1 <= len(axes) <= 2:
+            raise ValueError("Indicare una o due feature da variare")
+        positions = [self.numerical_columns.index(col) for col, _ in axes]
+        if len(set(positions)) != len(positions):
+            raise ValueError("Le feature da variare devono essere diverse")
+
+        n_cities = len(self)
+        k = min(k, n_cities)
+        base = np.asarray(base, dtype=np.float32)
+        shape = tuple(len(values) for _, values in axes)
+        block_starts = self.metric.block_starts
+        if block_starts is None:
+            grid = np.stack(np.meshgrid(*[values for _, values in axes], indexing='ij'), axis=-1)
+            variants = np.tile(base, (grid[..., 0].size, 1))
+            variants[:, positions] = grid.reshape(-1, len(axes))
+            indices, similarities = SimilarityIndex.query_batch(self, variants, k=k)
+            return indices.reshape(*shape, k), similarities.reshape(*shape, k)
+
+        # Colonne dello spazio di ricerca di ogni feature variata
+        block_stops = np.append(block_starts[1:], len(self.search_t))
+        blocks = [np.arange(block_starts[j], block_stops[j]) for j in positions]
+        with stage_timer('distance', cities=n_cities, axes=len(axes)):
+            embedded_base = self.embed(base)
+            fixed = np.setdiff1d(np.arange(len(self.search_t)), np.concatenate(blocks))
+            diff = self.search_t[fixed] - embedded_base[fixed, None]
+            fixed_squared = (diff * diff).sum(axis=0)
+            terms = []
+            for j, block, (_, values) in zip(positions, blocks, axes):
+                variants = np.tile(base, (len(values), 1))
+                variants[:, j] = values
+                embedded = self.embed(variants)
+                term = np.zeros((len(values), n_cities), dtype=np.float32)
+                for d in block:
+                    diff = self.search_t[d][None, :] - embedded[:, d][:, None]
+                    term += diff * diff
+                terms.append(term)
+
+        # Con un solo asse il secondo termine è una riga di zeri
+        second = terms[1] if len(terms) == 2 else np.zeros((1, n_cities), dtype=np.float32)
+        n_first, n_second = len(terms[0]), len(second)
+
+        # Se tutta la griglia rientra in un blocco si calcola in una volta sola
+        if n_first * n_second * n_cities <= MAX_CHUNK_ELEMENTS:
+            tile = max(n_first, n_second)
+        # Minimi e massimi dei termini per gruppi di valori consecutivi
+        first_starts = np.arange(0, n_first, tile)
+        second_starts = np.arange(0, n_second, tile)
+        first_low = np.minimum.reduceat(terms[0], first_starts, axis=0)
+        first_high = np.maximum.reduceat(terms[0], first_starts, axis=0)
+        second_low = np.minimum.reduceat(second, second_starts, axis=0)
+        second_high = np.maximum.reduceat(second, second_starts, axis=0)
+
+        indices = np.empty((n_first, n_second, k), dtype=np.intp)
+        similarities = np.empty((n_first, n_second, k), dtype=np.float32)
+        for a, start1 in enumerate(first_starts):
+            stop1 = min(start1 + tile, n_first)
+            partial_low = fixed_squared + first_low[a]
+            partial_high = fixed_squared + first_high[a]
+            for b, start2 in enumerate(second_starts):
+                stop2 = min(start2 + tile, n_second)
+                n_tile = (stop1 - start1) * (stop2 - start2)
+                with stage_timer('distance', queries=n_tile, cities=n_cities):
+                    # Limiti della distanza di ogni città nel riquadro: ogni
+                    # variante ha almeno k città entro la k-esima distanza
+                    # massima e la più lontana oltre la massima distanza
+                    # minima, le altre città non servono
+                    lower = partial_low + second_low[b]
+                    upper = partial_high + second_high[b]
+                    kth_upper = np.partition(upper, k - 1)[k - 1]
+                    if self.normalization == 'ricerca':
+                        kept = np.flatnonzero((lower <= kth_upper) | (upper >= lower.max()))
+                    else:
+                        kept = np.flatnonzero(lower <= kth_upper)
+                    squared = (fixed_squared[kept] + terms[0][start1:stop1, None, kept]
+                               + second[None, start2:stop2, kept])
+                with stage_timer('topk', queries=n_tile, k=k):
+                    top, top_similarities = self._top_k(squared.reshape(n_tile, len(kept)), k)
+                indices[start1:stop1, start2:stop2] = kept[top].reshape(stop1 - start1, stop2 - start2, k)
+                similarities[start1:stop1, start2:stop2] = top_similarities.reshape(
+                    stop1 - start1, stop2 - start2, k)
+        return indices.reshape(*shape, k), similarities.reshape(*shape, k)
+
+    def _top_k(self, squared, k, max_distance=None):
+        """
+        Seleziona per ogni riga le k distanze minori e le converte in similarità.
+        max_distance (m × 1) normalizza le similarità; per default è la
+        distanza massima di ogni riga oppure, con la normalizzazione sul
+        dataset, la distanza di riferimento fissa (similarità limitate a 0-100).
+        """
+        k = min(k, squared.shape[1])
+        top = np.argpartition(squared, k - 1, axis=1)[:, :k]
+        top_squared = np.take_along_axis(squared, top, axis=1)
+        order = np.argsort(top_squared, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_squared = np.take_along_axis(top_squared, order, axis=1)
+
+        # La distanza della metrica serve solo per i k migliori e per la massima
+        if self.normalization == 'dataset':
+            max_distance = np.float32(self.reference_distance)
+        elif max_distance is None:
+            max_distance = self.metric.distance(squared.max(axis=1, keepdims=True))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            similarities = np.where(
+                max_distance > 0, 100 * (1 - self.metric.distance(top_squared) / max_distance), 100
+            ).astype(np.float32)
+        if self.normalization == 'dataset':
+            np.clip(similarities, 0, 100, out=similarities)
+        return top, similarities
+
+
+class IVFSimilarityIndex(SimilarityIndex):
+    """
+    Indice approssimato a liste invertite (IVF) per cataloghi molto grandi.
+    Le città vengono raggruppate con KMeans nello spazio pesato e ogni
+    ricerca esamina solo i n_probe cluster con il centroide più vicino.
+    Aumentare n_probe migliora il recall a scapito della latenza.
+    """
+
+    def __init__(self, df, scaler, numerical_columns, weights=None, metric=None, normalization=None,
+                 n_clusters=None, n_probe=8, points_per_cluster=64, random_state=0):
+        # scikit-learn serve solo per l'indice approssimato: viene importato qui
+        from sklearn.cluster import KMeans
+
+        super().__init__(df, scaler, numerical_columns, weights, metric, normalization)
+        n_cities = len(self)
+        if n_clusters is None:
+            n_clusters = int(np.sqrt(n_cities))
+        n_clusters = max(1, min(n_clusters, n_cities))
+        self.n_probe = n_probe
+
+        # KMeans viene addestrato su un campione, nello spazio di ricerca della
+        # metrica: le liste si assegnano poi a tutte le città
+        features = self.search_t.T
+        train_size = n_clusters * points_per_cluster
+        if n_cities > train_size:
+            rng = np.random.default_rng(random_state)
+            sample = np.sort(rng.choice(n_cities, train_size, replace=False))
+            kmeans = KMeans(n_clusters=n_clusters, n_init=1, random_state=random_state)
+            kmeans.fit(features[sample])
+            labels = kmeans.predict(features)
+        else:
+            kmeans = KMeans(n_clusters=n_clusters, n_init=1, random_state=random_state)
+            labels = kmeans.fit_predict(features)
+        self.centroids = kmeans.cluster_centers_.astype(np.float32)
+
+        # Liste invertite: città ordinate per cluster con gli offset di ogni lista
+        self._order = np.argsort(labels, kind='stable')
+        self._offsets = np.searchsorted(labels[self._order], np.arange(n_clusters + 1))
+        self._clustered_t = np.ascontiguousarray(self.search_t[:, self._order])
+
+        # Raggio di ogni cluster, per stimare la distanza massima senza scansione completa
+        centroid_t = np.ascontiguousarray(self.centroids.T)
+        self._radius = np.zeros(n_clusters, dtype=np.float32)
+        for c in range(n_clusters):
+            start, stop = self._offsets[c], self._offsets[c + 1]
+            if stop > start:
+                diff = self._clustered_t[:, start:stop] - centroid_t[:, c:c + 1]
+                self._radius[c] = np.sqrt((diff * diff).sum(axis=0).max())
+        self._centroids_t = centroid_t
+
+    @property
+    def n_clusters(self):
+        return len(self.centroids)
+
+    def extended(self, df, scaler, n_existing, changed_columns=()):
+        """Le liste invertite dipendono dai centroidi: l'indice viene ricostruito su df."""
+        weights = dict(zip(self.numerical_columns, self.weights.tolist()))
+        return IVFSimilarityIndex(df, scaler, self.numerical_columns, weights, self.metric.name,
+                                  self.normalization, n_clusters=self.n_clusters, n_probe=self.n_probe)
+
+    def query(self, features, k=5, n_probe=None):
+        """
+        Ricerca approssimata delle k città più simili. Con la normalizzazione
+        sulla ricerca le similarità sono normalizzate su un limite superiore
+        della distanza massima (distanza dal centroide + raggio del cluster).
+        """
+        n_probe = min(self.n_probe if n_probe is None else n_probe, self.n_clusters)
+        with stage_timer('scale'):
+            weighted = self.embed(features).reshape(1, -1)
+
+        with stage_timer('distance', n_probe=n_probe):
+            centroid_squared, candidates, squared = self._probe(weighted, k, n_probe)
+        bound = (np.sqrt(centroid_squared) + self._radius).max().reshape(1, 1)
+        max_distance = self.metric.distance(bound * bound)
+        with stage_timer('topk', k=k, candidates=len(candidates)):
+            top, similarities = self._top_k(squared, k, max_distance)
+        return self._order[candidates[top[0]]], similarities[0]
+
+    def _probe(self, weighted, k, n_probe):
+        """Distanze dai centroidi, città candidate dei cluster esaminati e loro distanze."""
+        centroid_squared = self._squared_distances(weighted, self._centroids_t)[0]
+        nearest = np.argsort(centroid_squared)
+        # Se i cluster esaminati contengono meno di k città se ne aggiungono altri
+        sizes = np.cumsum(np.diff(self._offsets)[nearest])
+        n_probe = max(n_probe, int(np.searchsorted(sizes, min(k, len(self)))) + 1)
+        probe = nearest[:n_probe]
+        candidates = np.concatenate([
+            np.arange(self._offsets[c], self._offsets[c + 1]) for c in probe
+        ])
+
+        squared = self._squared_distances(weighted, self._clustered_t[:, candidates])
+        return centroid_squared, candidates, squared
+
+    def query_batch(self, features, k=5, chunk_size=None, n_probe=None):
+        """Ricerca approssimata per una matrice di città candidate (una query per riga)."""
+        features = np.asarray(features, dtype=np.float32)
+        if features.ndim != 2 or features.shape[1] != len(self.numerical_columns):
+            raise ValueError(
+                f"Attesa una matrice con {len(self.numerical_columns)} colonne, "
+                f"ricevuta forma {features.shape}"
+            )
+        results = [self.query(row, k, n_probe) for row in features]
+        k = min(k, len(self))
+        indices = np.array([r[0] for r in results], dtype=np.intp).reshape(-1, k)
+        similarities = np.array([r[1] for r in results], dtype=np.float32).reshape(-1, k)
+        return indices, similarities
+
+    def sample_queries(self, n_queries=200, noise=0.02, random_state=0):
+        """Genera query grezze perturbando città esistenti, per le misure di recall."""
+        rng = np.random.default_rng(random_state)
+        rows = rng.integers(0, len(self), n_queries)
+        weighted = self.features[rows] + rng.normal(0, noise, (n_queries, self.features.shape[1]))
+        return (weighted - self._offset) / self._scale
+
+    def recall_report(self, queries=None, k=5, n_probe_values=(1, 2, 4, 8, 16, 32)):
+        """
+        Confronta la ricerca approssimata con quella esatta per vari n_probe.
+        Restituisce una lista di dizionari con recall@k e latenza media.
+        """
+        if queries is None:
+            queries = self.sample_queries()
+        queries = np.asarray(queries, dtype=np.float32)
+
+        start = time.perf_counter()
+        exact, _ = SimilarityIndex.query_batch(self, queries, k=k)
+        exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        report = []
+        for n_probe in n_probe_values:
+            if n_probe > self.n_clusters:
+                break
+            start = time.perf_counter()
+            approx, _ = self.query_batch(queries, k=k, n_probe=n_probe)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            hits = sum(len(np.intersect1d(a, e)) for a, e in zip(approx, exact))
+            report.append({
+                'n_probe': n_probe,
+                'recall': hits / exact.size,
+                'ms_per_query': elapsed_ms,
+                'exact_ms_per_query': exact_ms,
+            })
+        return report
+
+
+def build_similarity_index(df, scaler, numerical_columns, mode='exact', **options):
+    """Costruisce l'indice di similarità esatto ('exact') o approssimato ('ivf')."""
+    if mode == 'exact':
+        return SimilarityIndex(df, scaler, numerical_columns, **options)
+    if mode == 'ivf':
+        return IVFSimilarityIndex(df, scaler, numerical_columns, **options)
+    raise ValueError(f"Modalità di similarità sconosciuta: {mode}")
+
+
+if __name__ == "__main__":
+    import argparse
+    from utils import load_data
+
+    parser = argparse.ArgumentParser(description="Recall e latenza della ricerca IVF rispetto a quella esatta")
+    parser.add_argument('--n-clusters', type=int, default=None)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    df, _, _, _, scaler, numerical_columns, _ = load_data()
+    index = IVFSimilarityIndex(df, scaler, numerical_columns, n_clusters=args.n_clusters)
+    print(f"\nIVF: {len(index)} città in {index.n_clusters} cluster")
+    for row in index.recall_report(index.sample_queries(args.queries), k=args.k):
+        print(f"n_probe={row['n_probe']:>3}  recall@{args.k}={row['recall']:.3f}  "
+              f"{row['ms_per_query']:.3f} ms/query (esatta {row['exact_ms_per_query']:.3f} ms)")
@@ -0,0 +1,245 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from indici import projects_to_long
+from normalizzazione import MinMaxScaler
+from pesi import PROFILI, load_profile, save_profile, weight_vector
+from utils import prepare_city_features, CITIES_CSV, PROGETTI_CSV, NUMERICAL_COLUMNS
+
+# Numero massimo di elementi (città × città × feature o vettori) per blocco di righe
+MAX_CHUNK_ELEMENTS = 8_000_000
+# Vettori di pesi valutati per ogni compito inviato ai worker
+BLOCK_SIZE = 256
+# Limite dei vettori generati da una ricerca a griglia
+MAX_GRID = 200_000
+
+
+def load_evaluation_data(cities_csv=CITIES_CSV, progetti_csv=PROGETTI_CSV):
+    """
+    Legge i due CSV e normalizza le caratteristiche delle città come
+    load_data (il file Excel dei finanziamenti non serve).
+    """
+    df = prepare_city_features(pd.read_csv(cities_csv))
+    numerical_columns = list(NUMERICAL_COLUMNS)
+    df = df.dropna(subset=numerical_columns)
+    df[numerical_columns] = MinMaxScaler().fit_transform(df[numerical_columns].to_numpy(dtype=np.float64))
+    return evaluation_data(df, pd.read_csv(progetti_csv), numerical_columns)
+
+
+def evaluation_data(df, progetti_df, numerical_columns):
+    """
+    Prepara i dati della valutazione leave-one-out: caratteristiche
+    normalizzate (città × feature) delle sole città con progetti, matrice
+    booleana città × ambito, nomi delle città, colonne e ambiti.
+    """
+    projects = projects_to_long(progetti_df)[['Città', 'Ambito progetto']].dropna()
+    projects = projects.astype(str).apply(lambda col: col.str.strip())
+    ambiti = sorted(projects['Ambito progetto'].unique())
+
+    cities = df[df['City'].astype(str).isin(set(projects['Città']))].drop_duplicates('City')
+    names = cities['City'].astype(str).to_numpy()
+    position = {name: i for i, name in enumerate(names)}
+    labels = np.zeros((len(names), len(ambiti)), dtype=bool)
+    for city, ambito in projects.itertuples(index=False):
+        if city in position:
+            labels[position[city], ambiti.index(ambito)] = True
+
+    features = cities[numerical_columns].to_numpy(dtype=np.float64)
+    return features, labels, names, list(numerical_columns), ambiti
+
+
+def evaluate_weights(features, labels, weights, k=1, chunk_size=None):
+    """
+    Valuta con leave-one-out molti vettori di pesi insieme: per ogni città si
+    cercano le k città più vicine tra le altre e si controlla se condividono
+    almeno un ambito di progetto. weights ha forma (vettori × feature).
+
+    Le distanze al quadrato di tutti i vettori si ottengono con un solo
+    prodotto matriciale: (x_i - x_j)² (blocco × città × feature) @ pesi².
+    Restituisce due array (uno per vettore): accuratezza del vicino più
+    vicino e precisione media dei k vicini.
+    """
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    n, n_features = features.shape
+    k = max(1, min(k, n - 1))
+    squared_weights = (weights ** 2).T
+    # Coppie di città con almeno un ambito in comune
+    shared = (labels.astype(np.float32) @ labels.T.astype(np.float32)) > 0
+
+    if chunk_size is None:
+        chunk_size = max(1, MAX_CHUNK_ELEMENTS // max(1, n * max(n_features, len(weights))))
+    hits = np.zeros(len(weights))
+    precision = np.zeros(len(weights))
+    for start in range(0, n, chunk_size):
+        rows = np.arange(start, min(start + chunk_size, n))
+        diff = features[rows, None, :] - features[None, :, :]
+        distances = (diff * diff) @ squared_weights
+        # Leave-one-out: la città non può essere la vicina di se stessa
+        distances[np.arange(len(rows)), rows, :] = np.inf
+
+        nearest = distances.argmin(axis=1)
+        hits += shared[rows[:, None], nearest].sum(axis=0)
+        if k > 1:
+            top = np.argpartition(distances, k - 1, axis=1)[:, :k, :]
+            precision += shared[rows[:, None, None], top].mean(axis=1).sum(axis=0)
+        else:
+            precision += shared[rows[:, None], nearest].sum(axis=0)
+    return hits / n, precision / n
+
+
+def chance_level(labels):
+    """Probabilità che due città diverse scelte a caso condividano un ambito."""
+    shared = (labels.astype(np.float32) @ labels.T.astype(np.float32)) > 0
+    n = len(labels)
+    return (shared.sum() - np.trace(shared)) / max(1, n * (n - 1))
+
+
+def random_candidates(n, n_features, seed=0):
+    """n vettori di pesi casuali (distribuzione di Dirichlet, somma 1)."""
+    rng = np.random.default_rng(seed)
+    return rng.dirichlet(np.ones(n_features), n)
+
+
+def grid_candidates(base, columns, varied, values):
+    """
+    Tutte le combinazioni di values per le colonne in varied; le altre
+    colonne mantengono i pesi di base (dizionario colonna -> peso).
+    """
+    unknown = [col for col in varied if col not in columns]
+    if unknown:
+        raise ValueError(f"Colonne sconosciute nella griglia: {unknown}")
+    n_grid = len(values) ** len(varied)
+    if n_grid > MAX_GRID:
+        raise ValueError(f"Griglia troppo grande: {n_grid} combinazioni (massimo {MAX_GRID})")
+
+    base_vector = weight_vector(base, columns)
+    positions = [columns.index(col) for col in varied]
+    candidates = np.tile(base_vector, (n_grid, 1))
+    candidates[:, positions] = np.array(list(itertools.product(values, repeat=len(varied))))
+    return candidates
+
+
+# Dati della valutazione condivisi dai processi worker
+_EVALUATION = None
+
+
+def _init_worker(features, labels, k):
+    global _EVALUATION
+    _EVALUATION = (features, labels, k)
+
+
+def _evaluate_block(weights):
+    features, labels, k = _EVALUATION
+    return evaluate_weights(features, labels, weights, k=k)
+
+
+def search(features, labels, candidates, k=1, workers=None, block_size=BLOCK_SIZE):
+    """
+    Valuta tutti i vettori candidati, divisi in blocchi su un pool di
+    processi. Restituisce accuratezza e precisione per ogni candidato.
+    """
+    blocks = [candidates[i:i + block_size] for i in range(0, len(candidates), block_size)]
+    workers = min(workers or os.cpu_count() or 1, len(blocks))
+    if workers <= 1:
+        results = [evaluate_weights(features, labels, block, k=k) for block in blocks]
+    else:
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing.get_context()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(features, labels, k)) as executor:
+            results = list(executor.map(_evaluate_block, blocks))
+    accuracy = np.concatenate([r[0] for r in results])
+    precision = np.concatenate([r[1] for r in results])
+    return accuracy, precision
+
+
+def rank(accuracy, precision, top=10):
+    """Posizioni dei migliori candidati: prima l'accuratezza, poi la precisione."""
+    order = np.lexsort((-precision, -accuracy))
+    return order[:top]
+
+
+def format_weights(vector, columns, digits=3):
+    total = vector.sum() or 1.0
+    return ", ".join(f"{col}={value / total:.{digits}f}" for col, value in zip(columns, vector))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Valuta e ottimizza i profili di pesi con leave-one-out su cities.csv e progetti_smart.csv"
+    )
+    parser.add_argument('--profili', default=",".join(PROFILI),
+                        help="Profili da valutare (nomi di pesi.py o file JSON), separati da virgola")
+    parser.add_argument('--k', type=int, default=1, help="Vicini considerati per la precisione")
+    parser.add_argument('--casuali', type=int, default=0, help="Numero di vettori di pesi casuali da provare")
+    parser.add_argument('--griglia', default=None,
+                        help="Colonne da variare nella ricerca a griglia, separate da virgola")
+    parser.add_argument('--valori', default="0,0.02,0.05,0.1,0.15,0.2",
+                        help="Valori dei pesi per la ricerca a griglia")
+    parser.add_argument('--base', default='predefinito',
+                        help="Profilo per le colonne non variate dalla griglia")
+    parser.add_argument('--workers', type=int, default=None, help="Numero di processi (default: CPU disponibili)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--migliori', type=int, default=10, help="Candidati migliori da mostrare")
+    parser.add_argument('--salva', metavar='FILE', default=None,
+                        help="Salva il miglior candidato come profilo JSON (SMARTCITY_PESI=FILE)")
+    parser.add_argument('--citta', default=CITIES_CSV, help="CSV delle città")
+    parser.add_argument('--progetti', default=PROGETTI_CSV, help="CSV dei progetti smart")
+    args = parser.parse_args(argv)
+
+    features, labels, names, columns, ambiti = load_evaluation_data(args.citta, args.progetti)
+    if len(names) < 2:
+        print("Servono almeno due città con progetti per la valutazione")
+        return 1
+    print(f"Valutazione leave-one-out su {len(names)} città con progetti, {len(ambiti)} ambiti; "
+          f"probabilità casuale di un ambito in comune: {chance_level(labels):.1%}")
+
+    profiles = [name.strip() for name in args.profili.split(',') if name.strip()]
+    vectors = np.array([weight_vector(load_profile(name), columns) for name in profiles])
+    accuracy, precision = evaluate_weights(features, labels, vectors, k=args.k)
+    print("\nProfili:")
+    for name, acc, prec in zip(profiles, accuracy, precision):
+        print(f"- {name:<14} accuratezza {acc:.1%}  precisione@{args.k} {prec:.1%}")
+
+    candidates = []
+    if args.casuali:
+        candidates.append(random_candidates(args.casuali, len(columns), args.seed))
+    if args.griglia:
+        values = [float(value) for value in args.valori.split(',')]
+        varied = [col.strip() for col in args.griglia.split(',') if col.strip()]
+        candidates.append(grid_candidates(load_profile(args.base), columns, varied, values))
+    if not candidates:
+        return 0
+
+    candidates = np.concatenate(candidates)
+    start = time.perf_counter()
+    accuracy, precision = search(features, labels, candidates, k=args.k, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"\n{len(candidates)} candidati valutati in {elapsed:.2f} s; migliori:")
+    best = rank(accuracy, precision, args.migliori)
+    for position, i in enumerate(best, 1):
+        print(f"{position:>3}. accuratezza {accuracy[i]:.1%}  precisione@{args.k} {precision[i]:.1%}\n"
+              f"     {format_weights(candidates[i], columns)}")
+
+    if args.salva:
+        i = best[0]
+        total = candidates[i].sum() or 1.0
+        save_profile(args.salva, dict(zip(columns, candidates[i] / total)),
+                     accuratezza=float(accuracy[i]), precisione=float(precision[i]), k=args.k,
+                     citta=len(names), creato=time.strftime('%Y-%m-%dT%H:%M:%S'))
+        print(f"\nMiglior profilo salvato in {args.salva}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+
+# I moduli del progetto sono nella cartella principale, non in un pacchetto
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from dati_sintetici import generate_dataset  # noqa: E402
+
+# Dimensioni del dataset sintetico usato dai test
+N_CITIES = 60
+N_PROJECTS = 40
+N_FUNDING = 600
+
+
+@pytest.fixture(scope='session')
+def dataset_dir(tmp_path_factory):
+    """Cartella con i tre file sorgente sintetici, generata una volta per sessione."""
+    directory = tmp_path_factory.mktemp('dataset')
+    generate_dataset(str(directory), N_CITIES, N_PROJECTS, N_FUNDING, seed=1)
+    return directory
+
+
+@pytest.fixture
+def workspace(dataset_dir, tmp_path, monkeypatch):
+    """
+    Cartella di lavoro con una copia dei file sorgente: load_data legge i
+    file e scrive cache e file puliti nella cartella corrente.
+    """
+    for name in os.listdir(dataset_dir):
+        (tmp_path / name).write_bytes((dataset_dir / name).read_bytes())
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def data(workspace):
+    """Dataset caricato dai file sorgente, senza cache."""
+    from utils import load_data
+    return load_data(use_cache=False)
+
+
+@pytest.fixture
+def smart_data(data):
+    """Dataset con gli indici costruiti, come in interfaccia, batch e servizio."""
+    from dataset import SmartCityData
+    return SmartCityData(data)
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+from aggiornamenti import apply_delta
+from dataset import SmartCityData
+from utils import CITIES_CSV, FINANZIAMENTI_XLSX, FOGLIO_FINANZIAMENTI, load_data
+
+N_BASE_CITIES = 45
+N_BASE_FUNDING = 400
+
+
+def _split_sources(directory):
+    """
+    Divide i file sorgente in una parte iniziale (nei file originali) e un
+    aggiornamento (città in CSV, finanziamenti in CSV); restituisce i
+    contenuti completi da ripristinare per il caricamento da zero.
+    Una città iniziale senza età media viene scartata: l'indice dei dati
+    caricati non è più contiguo.
+    """
+    full = pd.read_csv(directory / CITIES_CSV)
+    full.loc[3, 'Età media (anni)'] = None
+    full.to_csv(directory / CITIES_CSV, index=False)
+    cities = (directory / CITIES_CSV).read_bytes()
+    full.iloc[:N_BASE_CITIES].to_csv(directory / CITIES_CSV, index=False)
+    full.iloc[N_BASE_CITIES:].to_csv(directory / 'nuove_citta.csv', index=False)
+
+    workbook = (directory / FINANZIAMENTI_XLSX).read_bytes()
+    source = load_workbook(directory / FINANZIAMENTI_XLSX, read_only=True)
+    sheets = {name: [list(row) for row in source[name].iter_rows(values_only=True)]
+              for name in source.sheetnames}
+    source.close()
+    funding = sheets[FOGLIO_FINANZIAMENTI]
+    sheets[FOGLIO_FINANZIAMENTI] = funding[:N_BASE_FUNDING + 1]
+    pd.DataFrame(funding[N_BASE_FUNDING + 1:], columns=funding[0]).to_csv(
+        directory / 'nuovi_finanziamenti.csv', index=False)
+    base = Workbook(write_only=True)
+    for name, rows in sheets.items():
+        sheet = base.create_sheet(name)
+        for row in rows:
+            sheet.append(row)
+    base.save(directory / FINANZIAMENTI_XLSX)
+    return {CITIES_CSV: cities, FINANZIAMENTI_XLSX: workbook}
+
+
+def test_delta_matches_full_rebuild(workspace):
+    full_sources = _split_sources(workspace)
+    base = SmartCityData(load_data(use_cache=False))
+    updated, report = apply_delta(base, 'nuove_citta.csv', 'nuovi_finanziamenti.csv', save=False)
+    assert report['città aggiunte'] == len(updated.df) - (N_BASE_CITIES - 1)
+
+    for name, content in full_sources.items():
+        (workspace / name).write_bytes(content)
+    rebuilt = SmartCityData(load_data(use_cache=False))
+
+    # Stesse città, nello stesso ordine e con lo stesso indice
+    pd.testing.assert_index_equal(updated.df.index, rebuilt.df.index)
+    pd.testing.assert_frame_equal(updated.df, rebuilt.df, check_exact=False, rtol=1e-6, atol=1e-9)
+    np.testing.assert_allclose(updated.scaler.data_min_, rebuilt.scaler.data_min_)
+    np.testing.assert_allclose(updated.scaler.data_max_, rebuilt.scaler.data_max_)
+
+    # Stessi finanziamenti e province
+    assert updated.province == rebuilt.province
+    pd.testing.assert_index_equal(updated.finanziamenti_eu_df.index, rebuilt.finanziamenti_eu_df.index)
+    for col in updated.finanziamenti_eu_df.columns:
+        pd.testing.assert_series_equal(updated.finanziamenti_eu_df[col].astype(object),
+                                       rebuilt.finanziamenti_eu_df[col].astype(object), check_exact=False)
+
+    # Stessi risultati dagli indici aggiornati e da quelli ricostruiti
+    queries = rebuilt.scaler.inverse_transform(rebuilt.df[rebuilt.numerical_columns].to_numpy()[::7])
+    updated_indices, updated_similarities = updated.similarity_index.query_batch(queries, k=5)
+    rebuilt_indices, rebuilt_similarities = rebuilt.similarity_index.query_batch(queries, k=5)
+    np.testing.assert_array_equal(updated_indices, rebuilt_indices)
+    np.testing.assert_allclose(updated_similarities, rebuilt_similarities, rtol=1e-4, atol=1e-3)
+    for provincia in rebuilt.province:
+        for scope in ['Smart Mobility', 'Smart Environment', 'Smart Governance']:
+            assert sorted(updated.funding_index.lookup(provincia, scope)) == \
+                sorted(rebuilt.funding_index.lookup(provincia, scope))
+
+
+def test_same_delta_applied_twice_adds_nothing(workspace):
+    _split_sources(workspace)
+    base = SmartCityData(load_data(use_cache=False))
+    once, _ = apply_delta(base, 'nuove_citta.csv', 'nuovi_finanziamenti.csv', save=False)
+    twice, report = apply_delta(once, 'nuove_citta.csv', 'nuovi_finanziamenti.csv', save=False)
+
+    assert report['città aggiunte'] == 0 and report['finanziamenti aggiunti'] == 0
+    assert report['finanziamenti scartati (già presenti)'] == len(once.finanziamenti_eu_df) - N_BASE_FUNDING
+    assert len(twice.df) == len(once.df)
+    assert len(twice.finanziamenti_eu_df) == len(once.finanziamenti_eu_df)
+    assert twice.funding_index.totals == once.funding_index.totals
+    for key, offsets in once.funding_index.offsets.items():
+        assert sorted(twice.funding_index.lookup(*key)) == sorted(offsets)
+
+    # Righe ripetute nello stesso file: accodate una sola volta
+    delta = pd.read_csv('nuovi_finanziamenti.csv')
+    pd.concat([delta.head(3), delta.head(3)]).to_csv('ripetuti.csv', index=False)
+    base_updated, report = apply_delta(base, funding_path='ripetuti.csv', save=False)
+    assert report['finanziamenti aggiunti'] == 3
+    assert len(base_updated.finanziamenti_eu_df) == N_BASE_FUNDING + 3
@@ -0,0 +1,24 @@
+import pandas as pd
+
+from aggiornamenti import apply_delta
+from archivio import STORE_DIR, load_shared_dataset, load_store
+from dataset import load_dataset
+from utils import CITIES_CSV
+
+
+def test_store_follows_incremental_updates(workspace):
+    store = load_shared_dataset(STORE_DIR)
+    n_cities = len(store.similarity_index)
+    assert load_store(STORE_DIR) is not None
+
+    # Nuove città con lo schema di cities.csv, aggiunte alla cache con aggiornamenti.py
+    new = pd.read_csv(CITIES_CSV).head(4).copy()
+    new['City'] = [f"Nuova città {i}" for i in range(len(new))]
+    new.to_csv('nuove_citta.csv', index=False)
+    apply_delta(load_dataset(), cities_path='nuove_citta.csv')
+
+    assert load_store(STORE_DIR) is None
+    updated = load_shared_dataset(STORE_DIR)
+    assert len(updated.similarity_index) == n_cities + 4
+    assert 'Nuova città 3' in set(updated.similarity_index.cities)
+    assert load_store(STORE_DIR) is not None
@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from batch import read_candidates, run_batch
+from dataset import load_dataset
+from pipeline import recommend
+from utils import CITIES_CSV, find_most_similar_cities
+
+SCOPES = ['Smart_Mobility', 'Smart_Environment', 'Smart_Living']
+
+
+@pytest.fixture
+def candidates(workspace):
+    """CSV di città candidate con lo schema di cities.csv, due righe non valide."""
+    raw = pd.read_csv(CITIES_CSV).head(23).copy()
+    raw['City'] = [f"Candidata {i}" for i in range(len(raw))]
+    raw['smart_city_scope'] = [SCOPES[i % len(SCOPES)] for i in range(len(raw))]
+    raw['duration'] = 'Medio termine (5 anni)'
+    raw['provincia'] = 'Provincia 001'
+    raw['budget'] = 1_000_000
+    raw.loc[5, 'Clima (range annuale)'] = 'sconosciuto'
+    raw['Età media (anni)'] = raw['Età media (anni)'].astype(float)
+    raw.loc[9, 'Età media (anni)'] = np.inf
+    raw.to_csv('candidate.csv', index=False)
+    return 'candidate.csv'
+
+
+def test_batch_matches_single_queries(candidates):
+    assert run_batch(candidates, 'risultati.jsonl', workers=2, chunk_size=4, k=5) == 23
+    with open('risultati.jsonl', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+
+    data = load_dataset()
+    rows, features = read_candidates(candidates)
+    assert [record['City'] for record in records] == [row['City'] for row in rows]
+    for record, row, vector in zip(records, rows, features):
+        if row['error'] is not None:
+            assert record['error'] == row['error'] and 'similar_cities' not in record
+            continue
+        single = recommend(data, vector, row['smart_city_scope'], row['duration'], row['provincia'])
+        assert json.loads(json.dumps(single)) == {key: record[key] for key in single}
+
+        # Stesse città e similarità della ricerca singola di utils
+        similar = find_most_similar_cities(vector, None, None, None, index=data.similarity_index)
+        assert [c['city'] for c in record['similar_cities']] == [str(city) for city, _ in similar]
+        np.testing.assert_allclose([c['similarity'] for c in record['similar_cities']],
+                                   [s for _, s in similar], atol=1e-3)
+    assert [i for i, record in enumerate(records) if record['error'] is not None] == [5, 9]
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from cache_dati import CACHE_DIR
+from utils import CITIES_CSV, load_data
+
+
+def _assert_same_data(first, second):
+    for a, b in zip(first[:4], second[:4]):
+        pd.testing.assert_frame_equal(a, b)
+    np.testing.assert_array_equal(first[4].data_min_, second[4].data_min_)
+    np.testing.assert_array_equal(first[4].data_max_, second[4].data_max_)
+    assert first[5:] == second[5:]
+
+
+def test_cache_returns_source_data_and_follows_sources(workspace, capsys):
+    from_sources = load_data()
+    assert (workspace / CACHE_DIR).is_dir()
+    from_cache = load_data()
+    assert "Dati caricati dalla cache" in capsys.readouterr().out
+    _assert_same_data(from_sources, from_cache)
+
+    # Una modifica a un file sorgente invalida la cache
+    cities = pd.read_csv(CITIES_CSV)
+    cities.iloc[:-1].to_csv(CITIES_CSV, index=False)
+    reloaded = load_data()
+    assert "Dati caricati dalla cache" not in capsys.readouterr().out
+    assert len(reloaded[0]) == len(from_sources[0]) - 1
+    _assert_same_data(reloaded, load_data(use_cache=False))
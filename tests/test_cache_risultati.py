@@ -0,0 +1,102 @@
+import pytest
+
+from cache_risultati import LRUCache, RecommendationCache
+from dataset import SmartCityData
+from utils import SIMILARITY_ERROR, PROJECT_ERROR, FUNDING_ERROR
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == (True, 1)
+    cache.put('c', 3)
+    assert cache.get('b') == (False, None)
+    assert cache.get('a') == (True, 1)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_lru_expires_entries():
+    clock = FakeClock()
+    cache = LRUCache(maxsize=4, ttl=10, clock=clock)
+    cache.put('a', 1)
+    clock.now = 10
+    assert cache.get('a') == (True, 1)
+    clock.now = 20.5
+    assert cache.get('a') == (False, None)
+    assert cache.stats()['expirations'] == 1
+
+
+def test_get_or_compute_does_not_store_exceptions():
+    cache = LRUCache()
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise RuntimeError("errore")
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            cache.get_or_compute('a', failing)
+    assert len(calls) == 2 and len(cache) == 0
+    assert cache.get_or_compute('a', lambda: 5) == 5
+    assert cache.get_or_compute('a', failing) == 5
+
+
+def test_new_generation_invalidates_results(data, smart_data):
+    cache = RecommendationCache()
+    features = smart_data.df[smart_data.numerical_columns].iloc[0].tolist()
+    first = cache.similar_cities(smart_data, features)
+    assert cache.similar_cities(smart_data, features) == first
+    assert cache.similarity.hits == 1
+
+    reloaded = SmartCityData(data)
+    assert cache.similar_cities(reloaded, features) == first
+    assert cache.invalidations == 1
+    assert cache.similarity.hits == 1
+
+
+def test_error_results_are_not_cached(smart_data, monkeypatch):
+    cache = RecommendationCache()
+    features = smart_data.df[smart_data.numerical_columns].iloc[0].tolist()
+    index = smart_data.similarity_index
+    project_index = smart_data.project_index
+    funding_index = smart_data.funding_index
+    scope = 'Smart_Mobility'
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("indice non disponibile")
+
+    monkeypatch.setattr(index, 'query', broken)
+    monkeypatch.setattr(project_index, 'match', broken)
+    monkeypatch.setattr(funding_index, 'lookup', broken)
+    monkeypatch.setattr(funding_index, 'has_category', lambda label: True)
+    monkeypatch.setattr(funding_index, 'has_province', lambda provincia: True)
+    assert cache.similar_cities(smart_data, features) == SIMILARITY_ERROR
+    assert cache.explained_similar_cities(smart_data, features) == (SIMILARITY_ERROR, None)
+    assert cache.project_report(smart_data, [('Città', 90.0)], scope, 'Breve termine (2 anni)') == PROJECT_ERROR
+    assert cache.available_funding(smart_data, smart_data.province[0], scope).header() == FUNDING_ERROR
+    assert all(len(stage) == 0 for stage in (cache.similarity, cache.explained, cache.projects, cache.funding))
+
+    # Risolto l'errore, la stessa richiesta viene ricalcolata
+    monkeypatch.undo()
+    similar = cache.similar_cities(smart_data, features)
+    assert similar != SIMILARITY_ERROR
+    assert similar[0][0] in set(index.cities)
+    assert len(cache.similarity) == 1
+
+
+@pytest.mark.parametrize('features', [['molti'] * 15, [1.0] * 3, [float('nan')] * 15, None])
+def test_invalid_features_return_error_result(smart_data, features):
+    cache = RecommendationCache()
+    assert cache.similar_cities(smart_data, features) == SIMILARITY_ERROR
+    assert cache.explained_similar_cities(smart_data, features) == (SIMILARITY_ERROR, None)
+    assert len(cache.similarity) == 0 and len(cache.explained) == 0
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indici import FundingIndex, ProjectIndex
+from pesi import active_weights, weight_vector
+from similarita import SimilarityIndex
+from utils import SIMILARITY_ERROR, find_most_similar_cities
+
+
+def _raw_queries(data, n=20, seed=0):
+    """Vettori grezzi vicini alle città del dataset, con un po' di rumore."""
+    df, scaler, columns = data[0], data[4], data[5]
+    rng = np.random.default_rng(seed)
+    scaled = df[columns].to_numpy(dtype=np.float64)[rng.integers(0, len(df), n)]
+    return scaler.inverse_transform(scaled + rng.normal(0, 0.05, scaled.shape))
+
+
+def _brute_force(data, queries, k):
+    """Ricerca esatta come nella versione originale: distanza euclidea pesata su tutte le città."""
+    df, scaler, columns = data[0], data[4], data[5]
+    weights = weight_vector(active_weights(), columns)
+    cities = df[columns].to_numpy(dtype=np.float64) * weights
+    weighted = scaler.transform(queries) * weights
+    distances = np.sqrt(((weighted[:, None, :] - cities[None, :, :]) ** 2).sum(axis=-1))
+    similarities = 100 * (1 - distances / distances.max(axis=1, keepdims=True))
+    top = np.argsort(distances, axis=1, kind='stable')[:, :k]
+    return top, np.take_along_axis(similarities, top, axis=1)
+
+
+def test_similarity_index_matches_brute_force(data):
+    queries = _raw_queries(data)
+    index = SimilarityIndex(data[0], data[4], data[5], metric='euclidea', normalization='ricerca')
+    expected_top, expected_similarities = _brute_force(data, queries, k=5)
+
+    top, similarities = index.query_batch(queries, k=5)
+    np.testing.assert_array_equal(top, expected_top)
+    np.testing.assert_allclose(similarities, expected_similarities, atol=1e-3)
+    for query, row in zip(queries[:5], expected_top):
+        np.testing.assert_array_equal(index.query(query, k=5)[0], row)
+    # Blocchi piccoli: stesso risultato
+    np.testing.assert_array_equal(index.query_batch(queries, k=5, chunk_size=3)[0], expected_top)
+
+
+@pytest.mark.parametrize('value', [np.nan, np.inf, -np.inf, 1e300])
+def test_non_finite_features_are_rejected(data, value):
+    index = SimilarityIndex(data[0], data[4], data[5])
+    queries = _raw_queries(data, n=3)
+    queries[1, 2] = value
+    with pytest.raises(ValueError):
+        index.query(queries[1])
+    with pytest.raises(ValueError):
+        index.query_batch(queries)
+    # Come prima dell'indice, l'interfaccia riceve il risultato di errore
+    assert find_most_similar_cities(queries[1], None, None, None, index=index) == SIMILARITY_ERROR
+
+
+def test_ivf_with_all_clusters_is_exact(data):
+    pytest.importorskip('sklearn')
+    from similarita import IVFSimilarityIndex
+
+    queries = _raw_queries(data, seed=1)
+    for normalization in ['ricerca', 'dataset']:
+        exact = SimilarityIndex(data[0], data[4], data[5], metric='euclidea', normalization=normalization)
+        ivf = IVFSimilarityIndex(data[0], data[4], data[5], metric='euclidea', normalization=normalization,
+                                 n_clusters=6)
+        top, similarities = ivf.query_batch(queries, k=5, n_probe=ivf.n_clusters)
+        expected_top, expected_similarities = exact.query_batch(queries, k=5)
+        np.testing.assert_array_equal(top, expected_top)
+        if normalization == 'dataset':
+            np.testing.assert_allclose(similarities, expected_similarities, atol=1e-3)
+        else:
+            # Normalizzate su un limite superiore della distanza massima: mai inferiori
+            assert (similarities >= expected_similarities - 1e-3).all()
+
+
+def test_funding_index_matches_dataframe_filter(data):
+    funding, categorie = data[2], data[3]
+    index = FundingIndex(funding, categorie)
+    labels = categorie.dropna(subset=['Category_Label', 'Category_Smart'])
+    for provincia in data[6][:10]:
+        for category in labels['Category_Smart'].str.strip().unique():
+            category_labels = labels.loc[labels['Category_Smart'].str.strip() == category, 'Category_Label']
+            mask = (funding['Region3'] == provincia) & funding['Category_Label'].isin(category_labels)
+            expected = np.flatnonzero(mask.to_numpy())
+            np.testing.assert_array_equal(np.sort(index.lookup(provincia, category)), expected)
+            summary = index.summary(provincia, category)
+            assert summary['count'] == len(expected)
+            assert summary['Project_EU_Budget'] == pytest.approx(funding.loc[mask, 'Project_EU_Budget'].sum())
+
+
+def test_project_index_matches_wide_table(data):
+    progetti = data[1]
+    index = ProjectIndex(progetti)
+    scope, duration = 'Smart_Mobility', 'Breve termine (2 anni)'
+    for _, row in progetti.head(15).iterrows():
+        matches = index.match(row['Città'], scope, duration)
+        names = [row['Nome progetto 1'], row['Nome proggetto 2']]
+        scopes = [row['Ambito progetto 1'], row['Ambito progetto 2']]
+        kinds = [row['Tipo di investimento 1'], row['Tipo di investimento 2']]
+        expected = [(name, s == scope, t == duration)
+                    for name, s, t in zip(names, scopes, kinds) if not (pd.isna(name) and pd.isna(s))]
+        assert [(m['Nome progetto'], m['ambito_match'], m['durata_match']) for m in matches] == expected
+    assert index.match('Città inesistente', scope, duration) is None
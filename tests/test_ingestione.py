@@ -0,0 +1,32 @@
+import pandas as pd
+
+from ingestione import COLONNE_CATEGORIE, COLONNE_FINANZIAMENTI, ingest_sources, read_workbook
+from utils import CITIES_CSV, FINANZIAMENTI_XLSX, FOGLIO_CATEGORIE, FOGLIO_FINANZIAMENTI, PROGETTI_CSV
+
+
+def _values(series):
+    """Valori della colonna con None per le celle vuote (NaN o None)."""
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def test_single_pass_matches_read_excel(workspace):
+    sheets = read_workbook(FINANZIAMENTI_XLSX, {FOGLIO_FINANZIAMENTI: COLONNE_FINANZIAMENTI,
+                                                FOGLIO_CATEGORIE: COLONNE_CATEGORIE})
+    for sheet, columns in [(FOGLIO_FINANZIAMENTI, COLONNE_FINANZIAMENTI), (FOGLIO_CATEGORIE, COLONNE_CATEGORIE)]:
+        expected = pd.read_excel(FINANZIAMENTI_XLSX, sheet_name=sheet, usecols=columns)[columns]
+        expected = expected.dropna(how='all').reset_index(drop=True)
+        for col in columns:
+            assert _values(sheets[sheet][col]) == _values(expected[col]), (sheet, col)
+
+
+def test_parallel_ingestion_matches_sequential_reads(workspace):
+    df, progetti_df, funding, categorie, timings = ingest_sources(
+        CITIES_CSV, PROGETTI_CSV, FINANZIAMENTI_XLSX, FOGLIO_FINANZIAMENTI, FOGLIO_CATEGORIE
+    )
+    pd.testing.assert_frame_equal(df, pd.read_csv(CITIES_CSV))
+    pd.testing.assert_frame_equal(progetti_df, pd.read_csv(PROGETTI_CSV))
+    sheets = read_workbook(FINANZIAMENTI_XLSX, {FOGLIO_FINANZIAMENTI: COLONNE_FINANZIAMENTI,
+                                                FOGLIO_CATEGORIE: COLONNE_CATEGORIE})
+    pd.testing.assert_frame_equal(funding, sheets[FOGLIO_FINANZIAMENTI])
+    pd.testing.assert_frame_equal(categorie, sheets[FOGLIO_CATEGORIE])
+    assert {'cities_csv', 'progetti_csv', 'excel_apertura', 'totale'} <= set(timings)
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from metriche import CATEGORICAL_COLUMNS, METRICHE, NORMALIZZAZIONI, make_metric, check_normalization
+from similarita import SimilarityIndex
+
+
+def _queries(data, n=20, seed=1):
+    """Città del dataset con le feature continue variate e quelle categoriche di un'altra città."""
+    df, scaler, columns = data[0], data[4], data[5]
+    raw = scaler.inverse_transform(df[columns].to_numpy(dtype=np.float64))
+    rng = np.random.default_rng(seed)
+    queries = raw[rng.integers(0, len(raw), n)] * rng.uniform(0.8, 1.2, (n, len(columns)))
+    categorical = [j for j, col in enumerate(columns) if col in CATEGORICAL_COLUMNS]
+    queries[:, categorical] = raw[rng.integers(0, len(raw), n)][:, categorical]
+    return queries
+
+
+def _distances(metric, index, queries):
+    """Distanze della metrica calcolate direttamente dalla definizione (query × città)."""
+    cities = index.features.astype(np.float64)
+    weighted = index.transform(queries).astype(np.float64)
+    diff = weighted[:, None, :] - cities[None, :, :]
+    if metric == 'euclidea':
+        return np.sqrt((diff ** 2).sum(axis=-1))
+    if metric == 'coseno':
+        mean = cities.mean(axis=0)
+        a, b = weighted - mean, cities - mean
+        return 1 - (a @ b.T) / np.linalg.norm(a, axis=1)[:, None] / np.linalg.norm(b, axis=1)[None, :]
+    if metric == 'mahalanobis':
+        precision = np.linalg.pinv(np.cov(cities, rowvar=False))
+        return np.sqrt(np.einsum('qnd,de,qne->qn', diff, precision, diff))
+    weights = index.weights.astype(np.float64)
+    terms = diff ** 2
+    for j, col in enumerate(index.numerical_columns):
+        if col in CATEGORICAL_COLUMNS:
+            terms[:, :, j] = (np.abs(diff[:, :, j]) > 1e-4 * weights[j]) * weights[j] ** 2
+    return terms.sum(axis=-1) / (weights ** 2).sum()
+
+
+@pytest.mark.parametrize('normalization', NORMALIZZAZIONI)
+@pytest.mark.parametrize('metric', list(METRICHE))
+def test_metric_matches_definition(data, metric, normalization):
+    queries = _queries(data)
+    index = SimilarityIndex(data[0], data[4], data[5], metric=metric, normalization=normalization)
+    distances = _distances(metric, index, queries)
+    top, similarities = index.query_batch(queries, k=5)
+
+    # Le k città trovate sono le più vicine secondo la definizione della metrica
+    found = np.sort(np.take_along_axis(distances, top, axis=1), axis=1)
+    expected = np.sort(distances, axis=1)[:, :5]
+    np.testing.assert_allclose(found, expected, atol=1e-4)
+
+    if normalization == 'ricerca':
+        expected_similarities = 100 * (1 - np.take_along_axis(distances, top, axis=1)
+                                       / distances.max(axis=1, keepdims=True))
+    else:
+        expected_similarities = np.clip(
+            100 * (1 - np.take_along_axis(distances, top, axis=1) / index.reference_distance), 0, 100)
+    np.testing.assert_allclose(similarities, expected_similarities, atol=0.05)
+
+
+@pytest.mark.parametrize('metric', list(METRICHE))
+def test_dataset_normalization_is_comparable_across_queries(data, metric):
+    queries = _queries(data)
+    index = SimilarityIndex(data[0], data[4], data[5], metric=metric, normalization='dataset')
+    distances = _distances(metric, index, queries)
+    # La distanza di riferimento è fissa e non inferiore a nessuna distanza tra città del dataset
+    cities = data[4].inverse_transform(data[0][data[5]].to_numpy(dtype=np.float64))
+    pairwise = _distances(metric, index, cities)
+    assert pairwise.max() <= index.reference_distance + 1e-4
+    # Stessa distanza, stessa similarità in ricerche diverse
+    top, similarities = index.query_batch(queries, k=5)
+    found = np.take_along_axis(distances, top, axis=1)
+    np.testing.assert_allclose(similarities, np.clip(100 * (1 - found / index.reference_distance), 0, 100),
+                               atol=0.05)
+
+
+def test_separable_contributions_sum_to_distance(data):
+    queries = _queries(data)
+    for metric in METRICHE:
+        index = SimilarityIndex(data[0], data[4], data[5], metric=metric)
+        if index.metric.block_starts is None:
+            continue
+        top, _ = index.query_batch(queries, k=5)
+        contributions = index.contributions(queries, top)
+        distances = np.take_along_axis(_distances(metric, index, queries), top, axis=1)
+        np.testing.assert_allclose(index.metric.distance(contributions.sum(axis=-1)), distances, atol=1e-4)
+
+
+def test_unknown_metric_or_normalization():
+    with pytest.raises(ValueError):
+        make_metric('manhattan')
+    with pytest.raises(ValueError):
+        check_normalization('globale')
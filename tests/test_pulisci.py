@@ -0,0 +1,74 @@
+import os
+
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+from pulisci import CLEANED_DIR, _funding_chunk, clean_workbook, find_cleaned_output
+from utils import FINANZIAMENTI_XLSX, FOGLIO_CATEGORIE, FOGLIO_FINANZIAMENTI, load_data
+
+POSITIONS = {'Operation_Unique_Identifier': 0, 'Region3': 1, 'Total_Eligible_Expenditure_amount': 2,
+             'Project_EU_Budget': 3, 'Category_Label': 4}
+
+
+def test_funding_chunk_keeps_missing_text():
+    rows = [('a', 'Milano', 10, 5, 'Trasporti'), ('b', None, '3,5', None, None), ('c', 58, 1.5, 2)]
+    chunk = _funding_chunk(rows, POSITIONS)
+    assert chunk['Region3'].tolist() == ['Milano', None, '58']
+    assert chunk['Category_Label'].tolist() == ['Trasporti', None, None]
+    assert 'nan' not in chunk['Region3'].tolist()
+    assert chunk['Project_EU_Budget'].isna().tolist() == [False, True, False]
+
+
+def _blank_text_cells(path):
+    """
+    Riscrive il foglio dei finanziamenti con province solo testuali e
+    alcune province ed etichette mancanti: le colonne di testo senza
+    numeri sono quelle che pandas legge come str.
+    """
+    source = load_workbook(path, read_only=True)
+    sheets = {name: [list(row) for row in source[name].iter_rows(values_only=True)]
+              for name in source.sheetnames}
+    source.close()
+    header = sheets[FOGLIO_FINANZIAMENTI][0]
+    region, label = header.index('Region3'), header.index('Category_Label')
+    for i, row in enumerate(sheets[FOGLIO_FINANZIAMENTI][1:]):
+        row[region] = None if i % 7 == 0 else str(row[region] or 'Provincia 000')
+        if i % 11 == 0:
+            row[label] = None
+
+    workbook = Workbook(write_only=True)
+    for name, rows in sheets.items():
+        sheet = workbook.create_sheet(name)
+        for row in rows:
+            sheet.append(row)
+    workbook.save(path)
+
+
+def test_parquet_load_matches_excel(workspace):
+    _blank_text_cells(FINANZIAMENTI_XLSX)
+    excel = load_data(use_cache=False)
+    clean_workbook(FINANZIAMENTI_XLSX, CLEANED_DIR, FOGLIO_FINANZIAMENTI, FOGLIO_CATEGORIE, chunk_size=128)
+    assert find_cleaned_output(FINANZIAMENTI_XLSX, CLEANED_DIR) is not None
+    parquet = load_data(use_cache=False)
+
+    # Stesse province (la provincia mancante è 'Non specificata', mai 'nan')
+    assert parquet[6] == excel[6]
+    assert 'nan' not in parquet[6]
+    for col in ['Region3', 'Category_Label']:
+        pd.testing.assert_series_equal(parquet[2][col].astype(object), excel[2][col].astype(object))
+    for col in ['Total_Eligible_Expenditure_amount', 'Project_EU_Budget']:
+        pd.testing.assert_series_equal(parquet[2][col], excel[2][col].astype('float64'))
+
+
+def test_cleaned_output_rejects_files_newer_than_manifest(workspace):
+    clean_workbook(FINANZIAMENTI_XLSX, CLEANED_DIR, FOGLIO_FINANZIAMENTI, FOGLIO_CATEGORIE)
+    paths = find_cleaned_output(FINANZIAMENTI_XLSX, CLEANED_DIR)
+    assert paths is not None
+
+    # Pubblicazione interrotta dopo i file Parquet e prima del manifest
+    clean_workbook(FINANZIAMENTI_XLSX, 'nuovi', FOGLIO_FINANZIAMENTI, FOGLIO_CATEGORIE, chunk_size=50)
+    os.replace(os.path.join('nuovi', 'finanziamenti.parquet'), paths['finanziamenti'])
+    assert find_cleaned_output(FINANZIAMENTI_XLSX, CLEANED_DIR) is None
+
+    assert clean_workbook(FINANZIAMENTI_XLSX, CLEANED_DIR, FOGLIO_FINANZIAMENTI, FOGLIO_CATEGORIE) is not None
+    assert find_cleaned_output(FINANZIAMENTI_XLSX, CLEANED_DIR) is not None
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+import scenari
+from utils import find_most_similar_cities_batch
+
+COLUMN = 'Età media (anni)'
+
+
+def test_duplicate_axis_is_a_usage_error(workspace, smart_data, capsys):
+    city = str(smart_data.df['City'].iloc[0])
+    with pytest.raises(SystemExit) as exit_info:
+        scenari.main(['--citta', city, '--varia', f"{COLUMN}=-10%:+10%:5", '--varia', f"{COLUMN}=30:40:5"])
+    assert exit_info.value.code == 2
+    assert "due volte" in capsys.readouterr().err
+
+
+def test_sweep_matches_batch_query(smart_data):
+    city = str(smart_data.df['City'].iloc[0])
+    base = scenari.city_vector(smart_data, city)
+    column = smart_data.numerical_columns.index(COLUMN)
+    axes = [(COLUMN, scenari.axis_values(base[column], '-30%', '+30%', 7))]
+    result = scenari.sweep(smart_data, base, axes, k=3)
+
+    variants = np.tile(np.asarray(base, dtype=np.float64), (7, 1))
+    variants[:, column] = axes[0][1]
+    indices, similarities = find_most_similar_cities_batch(
+        variants, None, None, None, index=smart_data.similarity_index, k=3
+    )
+    np.testing.assert_array_equal(result['indices'].reshape(7, 3), indices)
+    np.testing.assert_allclose(result['similarities'].reshape(7, 3), similarities, rtol=1e-5, atol=1e-4)
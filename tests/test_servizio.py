@@ -0,0 +1,103 @@
+import asyncio
+import json
+from http import HTTPStatus
+
+import pytest
+
+from servizio import RecommendationService, RequestError, parse_int
+
+
+def _request(service, path, payload):
+    """Esegue una richiesta POST sul servizio, con il micro-batch attivo."""
+    async def run():
+        batcher = asyncio.create_task(service.batcher.run())
+        try:
+            return await service.handle('POST', path, json.dumps(payload).encode('utf-8'))
+        finally:
+            batcher.cancel()
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('value, expected', [(None, 5), (3, 3), ('4', 4), (2.0, 2)])
+def test_parse_int_accepts_integers(value, expected):
+    payload = {} if value is None else {'k': value}
+    assert parse_int(payload, 'k', 5, minimum=1) == expected
+
+
+@pytest.mark.parametrize('value', [None, [3], {'k': 3}, True, 'tre', 2.5, 0, -1])
+def test_parse_int_rejects_invalid_values(value):
+    with pytest.raises(RequestError):
+        parse_int({'k': value}, 'k', 5, minimum=1)
+
+
+@pytest.fixture
+def service(smart_data):
+    service = RecommendationService(smart_data, workers=2)
+    yield service
+    service.executor.shutdown(wait=True)
+
+
+def test_similar_validates_k(service, smart_data):
+    features = smart_data.df[smart_data.numerical_columns].iloc[0].tolist()
+    status, body = _request(service, '/similar', {'features': features, 'k': 3})
+    assert status == HTTPStatus.OK
+    assert len(body['similar_cities']) == 3
+    for k in [None, [3], 0, -2, 'molti']:
+        status, body = _request(service, '/similar', {'features': features, 'k': k})
+        assert status == HTTPStatus.BAD_REQUEST, k
+        assert "'k'" in body['error']
+
+
+@pytest.mark.parametrize('value', ['NaN', 'Infinity', '-inf', float('nan'), float('inf')])
+def test_similar_rejects_non_finite_features(service, smart_data, value):
+    features = smart_data.df[smart_data.numerical_columns].iloc[0].tolist()
+    features[3] = value
+    status, body = _request(service, '/similar', {'features': features})
+    assert status == HTTPStatus.BAD_REQUEST
+    assert "'features'" in body['error']
+    assert len(service.cache.similarity) == 0
+
+
+def test_funding_validates_paging(service, smart_data):
+    # Provincia e ambito con più finanziamenti, per avere più pagine
+    offsets = smart_data.funding_index.offsets
+    provincia, category = max(offsets, key=lambda key: len(offsets[key]))
+    payload = {'provincia': provincia, 'smart_city_scope': category.replace(' ', '_'), 'page_size': 2}
+    status, body = _request(service, '/funding', payload)
+    assert status == HTTPStatus.OK
+    assert body['count'] > 2
+    last = body['n_pages'] - 1
+    status, body = _request(service, '/funding', {**payload, 'page': last})
+    assert status == HTTPStatus.OK
+    assert body['page'] == last and body['page_text']
+    for key, value in [('page', -1), ('page', None), ('page', last + 1), ('page', 999),
+                       ('page_size', 0), ('page_size', -5), ('page_size', [20])]:
+        status, body = _request(service, '/funding', {**payload, key: value})
+        assert status == HTTPStatus.BAD_REQUEST, (key, value)
+        assert f"'{key}'" in body['error']
+
+
+def test_empty_funding_result_has_page_zero(service):
+    payload = {'provincia': 'Provincia inesistente', 'smart_city_scope': 'Smart_Mobility'}
+    status, body = _request(service, '/funding', payload)
+    assert status == HTTPStatus.OK
+    assert body['count'] == 0 and body['n_pages'] == 1
+    status, body = _request(service, '/funding', {**payload, 'page': 1})
+    assert status == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.parametrize('length', ['-1', 'dieci', '1e3'])
+def test_invalid_content_length_gets_400(service, length):
+    async def run():
+        server = await asyncio.start_server(service.handle_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f"GET /health HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode('latin-1'))
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), timeout=5)
+            writer.close()
+            return response
+    response = asyncio.run(run())
+    assert response.startswith(b"HTTP/1.1 400 ")
+    assert "Content-Length".encode() in response
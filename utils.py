@@ -1,102 +1,285 @@
+import logging
+import os
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import MinMaxScaler
-from sklearn.cluster import KMeans
-from sklearn.metrics import pairwise_distances
+from normalizzazione import MinMaxScaler
+from cache_dati import load_cache, save_cache, cache_report, cached_deltas, CACHE_DIR
+from ingestione import ingest_sources, format_timings
+from pulisci import find_cleaned_output, CLEANED_DIR
+from similarita import SimilarityIndex
+from indici import ProjectIndex, FundingIndex, FundingResultSet
+from registro import get_logger, stage_timer
 
-def load_data():
-    """Carica e preprocessa i dati delle città e dei progetti."""
-    try:
-        # Carica dataset principale città
-        df = pd.read_csv('cities.csv')
-        
-        # Carica dataset progetti smart
-        progetti_df = pd.read_csv('progetti_smart.csv')
+log = get_logger(__name__)
 
-        # Estrai temperature dal campo clima
-        def extract_temperatures(clima):
-            min_temp, max_temp = map(float, clima.replace('°C', '').split(' / '))
-            return min_temp, max_temp
+# File sorgente dei dataset
+CITIES_CSV = 'cities.csv'
+PROGETTI_CSV = 'progetti_smart.csv'
+FINANZIAMENTI_XLSX = 'projects_2025-02-15_IT_con_codifica.xlsx'
+FOGLIO_FINANZIAMENTI = 'projects_2025-02-15_IT'
+FOGLIO_CATEGORIE = 'projects_2025-02-15_IT_con codi'
+SOURCE_FILES = [CITIES_CSV, PROGETTI_CSV, FINANZIAMENTI_XLSX]
 
-        df[['Temp_Min', 'Temp_Max']] = pd.DataFrame(
-            df['Clima (range annuale)'].apply(extract_temperatures).tolist(),
-            columns=['Temp_Min', 'Temp_Max']
-        )
-        
-        # Carica dataset finanziamenti EU (solo colonne necessarie)
-        finanziamenti_eu_df = pd.read_excel(
-            'projects_2025-02-15_IT_con_codifica.xlsx',
-            sheet_name='projects_2025-02-15_IT',
-            usecols=[
-                'Operation_Unique_Identifier',
-                'Region3',
-                'Total_Eligible_Expenditure_amount',
-                'Project_EU_Budget',
-                'Category_Label'
-            ]
-        )
-        categorie_df = pd.read_excel(
-            'projects_2025-02-15_IT_con_codifica.xlsx',
-            sheet_name='projects_2025-02-15_IT_con codi'
+# Colonne numeriche usate per l'analisi di similarità
+NUMERICAL_COLUMNS = [
+    'Densità di popolazione (ab/km²)',
+    'Costo della vita (€/mese)',
+    'Trasporto pubblico (unità totali)',
+    'Temp_Min', 'Temp_Max',
+    'Punti di interesse turistici',
+    'Aeroporti principali',
+    'Livello di inquinamento (PM2.5)',
+    'Età media (anni)',
+    'Media eventi annuali',
+    'Importanza amministrativa',
+    'Primario', 'Secondario',
+    'Terziario', 'Quaternario'
+]
+
+# Mappature per conversione dati categorici
+SECTOR_COLUMNS = ['Primario', 'Secondario', 'Terziario', 'Quaternario']
+SECTOR_MAP = {
+    'Limitato': 1,
+    'Moderato': 2,
+    'Forte': 3,
+    'Dominante': 4
+}
+
+IMPORTANCE_MAP = {
+    'Capitale nazionale': 4,
+    'Capitale regionale': 3,
+    'Hub economico': 3,
+    'Centro regionale': 2,
+    'Città satellite': 1
+}
+
+# Modalità compatta (float32 e colonne categoriche): load_data(compact=True)
+# oppure SMARTCITY_COMPACT=1; usa una cache separata
+COMPACT_ENV = 'SMARTCITY_COMPACT'
+COMPACT_CACHE_DIR = CACHE_DIR + '_compatta'
+# Colonne testuali con meno valori distinti di questa frazione delle righe diventano categoriche
+CATEGORY_MAX_RATIO = 0.5
+
+# Spiegazione delle similarità: differenze principali mostrate e quota
+# della distanza sotto la quale una caratteristica è considerata quasi identica
+EXPLANATION_TOP = 3
+CLOSE_SHARE = 0.01
+# Distanza al quadrato sotto la quale due città sono identiche (errore di arrotondamento float32)
+IDENTICAL_DISTANCE = 1e-10
+
+# Risultati mostrati al posto di quelli di una ricerca non riuscita
+SIMILARITY_ERROR = [("Errore nell'analisi", 0)]
+PROJECT_ERROR = "⚠ Errore durante la ricerca dei progetti"
+FUNDING_ERROR = "Errore nell'analisi dei finanziamenti disponibili"
+
+def compact_mode(compact=None):
+    """Risolve il parametro compact, leggendo SMARTCITY_COMPACT se non indicato."""
+    if compact is None:
+        return os.environ.get(COMPACT_ENV, '').lower() in ('1', 'true', 'si', 'sì', 'yes')
+    return bool(compact)
+
+def load_data(force_rebuild=False, use_cache=True, progress=None, compact=None):
+    """
+    Carica i dati delle città e dei progetti, usando la cache su disco
+    se i file sorgente non sono cambiati dall'ultimo caricamento.
+    progress, se indicato, riceve (percentuale, messaggio) a ogni fase.
+    compact riduce la memoria occupata (vedi compact_datasets).
+    Se pulisci.py ha prodotto file Parquet aggiornati, vengono letti al
+    posto del file Excel.
+    """
+    def report(percent, message):
+        if progress is not None:
+            progress(percent, message)
+
+    compact = compact_mode(compact)
+    cache_dir = COMPACT_CACHE_DIR if compact else CACHE_DIR
+    cleaned = find_cleaned_output(FINANZIAMENTI_XLSX, CLEANED_DIR)
+    sources = source_files(cleaned)
+    if use_cache:
+        report(5, "Verifica cache dei dati...")
+        with stage_timer('load', source='cache'):
+            data = load_cache(sources, cache_dir=cache_dir, force_rebuild=force_rebuild)
+        if data is not None:
+            print_load_summary(data, "Dati caricati dalla cache:")
+            print_cache_report()
+            report(100, "Dati caricati")
+            return data
+
+    # Gli aggiornamenti incrementali della cache precedente non fanno parte dei file sorgente
+    lost_deltas = cached_deltas(cache_dir) if use_cache else []
+    if lost_deltas:
+        print(f"Attenzione: {len(lost_deltas)} aggiornamenti incrementali non sono inclusi nei file "
+              f"sorgente e vanno riapplicati con aggiornamenti.py: "
+              + ", ".join(delta['path'] for delta in lost_deltas))
+
+    report(15, "Lettura dei file sorgente...")
+    with stage_timer('load', source='sorgenti'):
+        data = _load_sources(compact=compact, cleaned=cleaned)
+    print_load_summary(data, "Dati caricati con successo:")
+
+    if use_cache:
+        report(85, "Salvataggio cache dei dati...")
+        try:
+            save_cache(data, sources, cache_dir=cache_dir)
+        except Exception as e:
+            print(f"Impossibile salvare la cache dei dati: {e}")
+
+        print_cache_report()
+
+    report(100, "Dati caricati")
+    return data
+
+def source_files(cleaned=None):
+    """File sorgente effettivamente letti: i Parquet puliti sostituiscono il file Excel."""
+    if cleaned is None:
+        return list(SOURCE_FILES)
+    return [CITIES_CSV, PROGETTI_CSV, *cleaned.values()]
+
+def print_cache_report():
+    """Stampa i contatori di hit/miss della cache dei dati."""
+    report = cache_report()
+    print(f"- Cache: {report['hit']} hit, {report['miss']} miss ({report['ultimo_esito']})")
+
+def print_load_summary(data, title):
+    """Stampa il riepilogo dei dataset caricati."""
+    df, progetti_df, finanziamenti_eu_df, _, _, _, province = data
+    print(title)
+    print(f"- Città analizzate: {len(df)}")
+    print(f"- Progetti smart: {len(progetti_df)}")
+    print(f"- Finanziamenti EU: {len(finanziamenti_eu_df)}")
+    print(f"- Province disponibili: {len(province)}")
+
+def memory_usage_mb(frames):
+    """Memoria occupata (MB, stringhe comprese) da ogni DataFrame di frames."""
+    return {name: frame.memory_usage(deep=True).sum() / 2 ** 20 for name, frame in frames.items()}
+
+def print_memory_report(before, after):
+    """Stampa la memoria dei dataset prima e dopo la conversione compatta."""
+    print("- Memoria dei dataset (MB):")
+    for name in before:
+        print(f"  {name}: {before[name]:.2f} -> {after[name]:.2f}")
+    print(f"  totale: {sum(before.values()):.2f} -> {sum(after.values()):.2f}")
+
+def extract_temperatures(clima):
+    """Estrae temperatura minima e massima da un valore come '-7°C / 22°C'."""
+    min_temp, max_temp = map(float, clima.replace('°C', '').split(' / '))
+    return min_temp, max_temp
+
+def parse_temperatures(clima):
+    """
+    Versione vettorizzata di extract_temperatures per una Series.
+    Restituisce un DataFrame con Temp_Min e Temp_Max; un valore non nel
+    formato '-7°C / 22°C' solleva ValueError come extract_temperatures.
+    """
+    parts = clima.astype(str).str.replace('°C', '', regex=False).str.split(' / ', expand=True)
+    if parts.shape[1] != 2 or parts.isna().any().any():
+        raise ValueError("Formato del clima non valido: atteso '-7°C / 22°C'")
+    return pd.DataFrame({
+        'Temp_Min': pd.to_numeric(parts[0], errors='raise').astype(float),
+        'Temp_Max': pd.to_numeric(parts[1], errors='raise').astype(float),
+    }, index=clima.index)
+
+def clean_regions(region):
+    """
+    Pulisce Region3 in una colonna categorica con categorie ordinate:
+    valori mancanti come 'Non specificata' e codici numerici senza '.0'.
+    La pulizia avviene sui soli valori distinti, non riga per riga.
+    """
+    codes, uniques = pd.factorize(region.fillna('Non specificata'))
+    labels = pd.Series(np.asarray(uniques, dtype=object)).astype(str)
+    labels = labels.where(~labels.str.endswith('.0'), labels.str.replace('.0', '', regex=False))
+    categories, remap = np.unique(labels.to_numpy(dtype=object).astype(str), return_inverse=True)
+    return pd.Series(
+        pd.Categorical.from_codes(remap[codes], categories=categories.tolist()),
+        index=region.index, name=region.name
+    )
+
+def _categorize(frame, columns=None, max_ratio=CATEGORY_MAX_RATIO):
+    """Converte in categoriche le colonne testuali con pochi valori distinti."""
+    for col in frame.columns if columns is None else columns:
+        values = frame[col]
+        if isinstance(values.dtype, pd.CategoricalDtype) or pd.api.types.is_numeric_dtype(values):
+            continue
+        if values.nunique(dropna=True) <= max_ratio * max(len(values), 1):
+            frame[col] = values.astype('category')
+    return frame
+
+def compact_datasets(df, progetti_df, finanziamenti_eu_df, categorie_df, numerical_columns):
+    """
+    Riduce la memoria dei dataset grezzi: caratteristiche delle città in
+    float32 e colonne testuali ripetute (ambito, tipo di investimento,
+    stato, categorie, province) come categoriche. Gli importi dei
+    finanziamenti restano float64 per non perdere precisione nei totali.
+    """
+    df = df.copy()
+    df[numerical_columns] = df[numerical_columns].astype(np.float32)
+    df = _categorize(df, [col for col in df.columns if col not in numerical_columns and col != 'City'])
+    progetti_df = _categorize(progetti_df.copy(), [col for col in progetti_df.columns if col != 'Città'])
+    finanziamenti_eu_df = _categorize(finanziamenti_eu_df.copy(), ['Region3', 'Category_Label'])
+    categorie_df = _categorize(categorie_df.copy())
+    for col in progetti_df.select_dtypes('integer').columns:
+        progetti_df[col] = pd.to_numeric(progetti_df[col], downcast='integer')
+    return df, progetti_df, finanziamenti_eu_df, categorie_df
+
+def prepare_city_features(df):
+    """
+    Converte le colonne grezze nel formato di cities.csv nelle colonne
+    numeriche di NUMERICAL_COLUMNS (non ancora normalizzate).
+    Temp_Min/Temp_Max e campi già numerici vengono mantenuti.
+    """
+    df = df.copy()
+    if 'Temp_Min' not in df.columns or 'Temp_Max' not in df.columns:
+        df[['Temp_Min', 'Temp_Max']] = parse_temperatures(df['Clima (range annuale)'])
+
+    # Converti campi categorici in numerici
+    if not pd.api.types.is_numeric_dtype(df['Importanza amministrativa']):
+        df['Importanza amministrativa'] = df['Importanza amministrativa'].map(IMPORTANCE_MAP)
+    for col in SECTOR_COLUMNS:
+        if not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].map(SECTOR_MAP)
+    return df
+
+def _load_sources(compact=False, cleaned=None):
+    """Carica e preprocessa i dati delle città e dei progetti dai file sorgente."""
+    try:
+        # Legge CSV e file Excel (una sola apertura) o Parquet puliti in parallelo
+        df, progetti_df, finanziamenti_eu_df, categorie_df, timings = ingest_sources(
+            CITIES_CSV, PROGETTI_CSV, FINANZIAMENTI_XLSX,
+            FOGLIO_FINANZIAMENTI, FOGLIO_CATEGORIE, cleaned=cleaned
         )
+        print(f"- Tempi di lettura: {format_timings(timings)}")
+
+        # Estrai temperature e converti campi categorici in numerici
+        df = prepare_city_features(df)
         
-        # Pulizia e ordinamento province
-        finanziamenti_eu_df['Region3'] = finanziamenti_eu_df['Region3'].fillna('Non specificata')
-        # Converti tutti i valori in stringa
-        finanziamenti_eu_df['Region3'] = finanziamenti_eu_df['Region3'].astype(str)
-        # Rimuovi eventuali .0 dai numeri convertiti in stringa
-        finanziamenti_eu_df['Region3'] = finanziamenti_eu_df['Region3'].apply(lambda x: x.replace('.0', '') if x.endswith('.0') else x)
-        province = sorted(finanziamenti_eu_df['Region3'].unique())
-
-        # Mappature per conversione dati categorici
-        sector_map = {
-            'Limitato': 1,
-            'Moderato': 2,
-            'Forte': 3,
-            'Dominante': 4
-        }
-        
-        importance_map = {
-            'Capitale nazionale': 4,
-            'Capitale regionale': 3,
-            'Hub economico': 3,
-            'Centro regionale': 2,
-            'Città satellite': 1
-        }
-
-        # Converti campi categorici in numerici
-        df['Importanza amministrativa'] = df['Importanza amministrativa'].map(importance_map)
-        for col in ['Primario', 'Secondario', 'Terziario', 'Quaternario']:
-            df[col] = df[col].map(sector_map)
+        # Pulizia e ordinamento province (stringhe senza '.0', come categoriche)
+        finanziamenti_eu_df['Region3'] = clean_regions(finanziamenti_eu_df['Region3'])
+        province = list(finanziamenti_eu_df['Region3'].cat.categories)
+
+        # Colonne ripetute come categoriche: occupano una frazione della memoria
+        finanziamenti_eu_df['Category_Label'] = finanziamenti_eu_df['Category_Label'].astype('category')
 
         # Definizione colonne numeriche per analisi
-        numerical_columns = [
-            'Densità di popolazione (ab/km²)',
-            'Costo della vita (€/mese)',
-            'Trasporto pubblico (unità totali)',
-            'Temp_Min', 'Temp_Max',
-            'Punti di interesse turistici',
-            'Aeroporti principali',
-            'Livello di inquinamento (PM2.5)',
-            'Età media (anni)',
-            'Media eventi annuali',
-            'Importanza amministrativa',
-            'Primario', 'Secondario',
-            'Terziario', 'Quaternario'
-        ]
-
-        # Rimozione righe con dati mancanti
-        df = df.dropna(subset=numerical_columns)
+        numerical_columns = list(NUMERICAL_COLUMNS)
+
+        if compact:
+            frames = {'cities': df, 'progetti': progetti_df,
+                      'finanziamenti': finanziamenti_eu_df, 'categorie': categorie_df}
+            before = memory_usage_mb(frames)
+            df, progetti_df, finanziamenti_eu_df, categorie_df = compact_datasets(
+                df, progetti_df, finanziamenti_eu_df, categorie_df, numerical_columns
+            )
+            after = memory_usage_mb({'cities': df, 'progetti': progetti_df,
+                                     'finanziamenti': finanziamenti_eu_df, 'categorie': categorie_df})
+            print_memory_report(before, after)
+
+        # Rimozione righe con dati mancanti (indice rinumerato, come dopo un aggiornamento incrementale)
+        df = df.dropna(subset=numerical_columns).reset_index(drop=True)
         
-        # Normalizzazione dei dati numerici
+        # Normalizzazione dei dati numerici (calcolata in float64 anche in modalità compatta)
         scaler = MinMaxScaler()
-        df[numerical_columns] = scaler.fit_transform(df[numerical_columns])
-
-        print("Dati caricati con successo:")
-        print(f"- Città analizzate: {len(df)}")
-        print(f"- Progetti smart: {len(progetti_df)}")
-        print(f"- Finanziamenti EU: {len(finanziamenti_eu_df)}")
-        print(f"- Province disponibili: {len(province)}")
+        scaled = scaler.fit_transform(df[numerical_columns].to_numpy(dtype=np.float64))
+        df[numerical_columns] = scaled.astype(np.float32) if compact else scaled
 
         return df, progetti_df, finanziamenti_eu_df, categorie_df, scaler, numerical_columns, province
 
@@ -104,277 +287,274 @@ def load_data():
         print(f"Errore durante il caricamento dei dati: {e}")
         raise
 
-def find_most_similar_cities(new_city_features, df, scaler, numerical_columns):
-    """Trova le città più simili con similarità migliorate."""
+def find_most_similar_cities(new_city_features, df, scaler, numerical_columns, index=None, k=5,
+                             explain=False, metric=None, normalization=None, raise_errors=False):
+    """
+    Trova le k città più simili con similarità migliorate.
+    Se index (SimilarityIndex) è indicato, df e scaler non vengono usati;
+    altrimenti l'indice usa metric e normalization (per default quelle
+    attive in metriche.py).
+    Con explain=True restituisce anche la matrice dei contributi (k × feature)
+    per feature, per spiegare ogni similarità.
+    In caso di errore restituisce SIMILARITY_ERROR, oppure rilancia
+    l'eccezione con raise_errors=True (la cache dei risultati non salva gli errori).
+    """
     try:
-        # Pesi personalizzati per caratteristiche più importanti
-        weights = {
-            'Densità di popolazione (ab/km²)': 0.15,
-            'Costo della vita (€/mese)': 0.15,
-            'Trasporto pubblico (unità totali)': 0.10,
-            'Temp_Min': 0.10,
-            'Temp_Max': 0.10,
-            'Punti di interesse turistici': 0.10,
-            'Livello di inquinamento (PM2.5)': 0.05,
-            'Età media (anni)': 0.05,
-            'Media eventi annuali': 0.05,
-            'Importanza amministrativa': 0.05,
-            'Primario': 0.02,
-            'Secondario': 0.03,
-            'Terziario': 0.03,
-            'Quaternario': 0.02
-        }
-
-        # Normalizza input
-        new_city_df = pd.DataFrame([new_city_features], columns=numerical_columns)
-        new_city_scaled = scaler.transform(new_city_df)
-
-        # Applica pesi
-        weighted_data = df[numerical_columns].copy()
-        weighted_new_city = new_city_scaled.copy()
-        
-        for i, col in enumerate(numerical_columns):
-            if col in weights:
-                weighted_data[col] *= weights[col]
-                weighted_new_city[0][i] *= weights[col]
-
-        # Calcola similarità usando distanza euclidea inversa
-        distances = pairwise_distances(weighted_data, weighted_new_city)
-        similarities = 100 * (1 - (distances / distances.max()))
-        
-        # Trova top 5
-        top_indices = np.argsort(similarities.flatten())[-5:][::-1]
-        
-        similar_cities = []
-        print("\nDETTAGLI SIMILARITÀ:")
+        if index is None:
+            index = SimilarityIndex(df, scaler, numerical_columns, metric=metric, normalization=normalization)
+
+        # Trova top k
+        top_indices, similarities = index.query(new_city_features, k=k)
         
-        for idx in top_indices:
-            city = df.iloc[idx]['City']
-            similarity = similarities[idx][0]
-            similar_cities.append((city, similarity))
-            print(f"\n{city} - Similarità: {similarity:.2f}%")
-            print("Valori significativi (pesati):")
-            for col in numerical_columns:
-                val = weighted_data.iloc[idx][col]
-                if abs(val) > 0.01:
-                    print(f"  {col}: {val:.4f}")
+        similar_cities = [(index.cities[idx], float(similarity))
+                          for idx, similarity in zip(top_indices, similarities)]
+
+        # I contributi si calcolano solo per le k città trovate e solo se richiesti
+        contributions = None
+        if explain or log.isEnabledFor(logging.DEBUG):
+            contributions = index.contributions(new_city_features, top_indices)
+            for (city, similarity), explanation in zip(
+                    similar_cities, explain_similarity(contributions, index.numerical_columns)):
+                log.debug("%s - Similarità: %.2f%% - differenze principali: %s",
+                          city, similarity, explanation['differenze'])
 
+        if explain:
+            return similar_cities, contributions
         return similar_cities
 
     except Exception as e:
-        print(f"Errore nel calcolo delle similarità: {e}")
-        return [("Errore nell'analisi", 0)]
+        log.exception("Errore nel calcolo delle similarità: %s", e)
+        if raise_errors:
+            raise
+        error = list(SIMILARITY_ERROR)
+        return (error, None) if explain else error
+
+def explain_similarity(contributions, numerical_columns, top=EXPLANATION_TOP):
+    """
+    Spiega le similarità dalla matrice dei contributi (città × feature):
+    per ogni città le caratteristiche con la quota maggiore della distanza
+    (differenze) e quelle quasi identiche (quota sotto CLOSE_SHARE).
+    """
+    contributions = np.asarray(contributions, dtype=np.float64)
+    totals = contributions.sum(axis=-1, keepdims=True)
+    shares = np.divide(contributions, totals, out=np.zeros_like(contributions),
+                       where=totals > IDENTICAL_DISTANCE)
+    order = np.argsort(-shares, axis=-1, kind='stable')[:, :top]
+    close = shares < CLOSE_SHARE
+
+    explanations = []
+    for row_shares, row_order, row_close in zip(shares, order, close):
+        explanations.append({
+            'differenze': [(numerical_columns[j], float(row_shares[j]))
+                           for j in row_order if row_shares[j] >= CLOSE_SHARE],
+            'simili': [col for col, is_close in zip(numerical_columns, row_close) if is_close],
+        })
+    return explanations
 
-def find_best_project(similar_cities, smart_city_scope, duration, progetti_df):
+def format_similarity_explanation(similar_cities, contributions, numerical_columns):
+    """Testo "perché queste città sono simili" per l'interfaccia."""
+    if contributions is None:
+        return ""
+    text = "\nPERCHÉ QUESTE CITTÀ SONO SIMILI:\n"
+    for (city, similarity), explanation in zip(similar_cities,
+                                               explain_similarity(contributions, numerical_columns)):
+        text += f"{city} ({similarity:.2f}%): "
+        if explanation['differenze']:
+            text += "differenze dovute soprattutto a " + ", ".join(
+                f"{col} {share:.0%}" for col, share in explanation['differenze']
+            )
+        else:
+            text += "caratteristiche praticamente identiche"
+        text += f"; quasi identiche in {len(explanation['simili'])} caratteristiche su {len(numerical_columns)}\n"
+    return text
+
+def find_most_similar_cities_batch(features_matrix, df, scaler, numerical_columns,
+                                   index=None, k=5, chunk_size=None, metric=None, normalization=None):
+    """
+    Versione vettorizzata di find_most_similar_cities per molte città.
+    features_matrix ha una riga per città candidata, con le colonne
+    nell'ordine di numerical_columns. Restituisce (indici, similarità),
+    entrambi di forma (N × k); i nomi sono in index.cities[indici].
+    """
+    if index is None:
+        index = SimilarityIndex(df, scaler, numerical_columns, metric=metric, normalization=normalization)
+    if isinstance(features_matrix, pd.DataFrame):
+        features_matrix = features_matrix[index.numerical_columns].to_numpy()
+    return index.query_batch(features_matrix, k=k, chunk_size=chunk_size)
+
+def find_best_project(similar_cities, smart_city_scope, duration, progetti_df, project_index=None,
+                      raise_errors=False):
     """
     Trova il progetto migliore utilizzando i nomi esatti delle colonne del CSV.
+    Se project_index (ProjectIndex) è indicato, progetti_df non viene usato.
+    In caso di errore restituisce PROJECT_ERROR, oppure rilancia l'eccezione
+    con raise_errors=True.
     """
     try:
-        print("\nDEBUG - Parametri ricevuti:")
-        print(f"Smart City Scope: {smart_city_scope}")
-        print(f"Duration: {duration}")
-        print(f"Città simili: {similar_cities}")
-        
-        found_projects = []
-        suggested_projects = []
-        result = []
-        
-        result.append("RICERCA PROGETTI SMART CITY")
-        result.append(f"Ambito richiesto: {smart_city_scope}")
-        result.append(f"Durata richiesta: {duration}\n")
+        log.debug("Parametri ricevuti: ambito=%s, durata=%s, città simili=%s",
+                  smart_city_scope, duration, similar_cities)
         
-        for city, similarity in similar_cities[:5]:
-            print(f"\nDEBUG - Analisi città: {city}")
-            result.append(f"\nANALISI {city} (Similarità: {similarity:.2f}%)")
-            
-            # Verifica se la città è presente
-            if city not in progetti_df['Città'].values:
-                print(f"DEBUG - Città {city} non trovata in progetti_df")
-                result.append(f"⚠ {city} non ha progetti nel database")
-                continue
-            
-            city_projects = progetti_df[progetti_df['Città'] == city]
-            
-            # Analisi progetto 1
-            try:
-                project1_data = {
-                    'nome': city_projects['Nome progetto 1'].iloc[0],
-                    'ambito': city_projects['Ambito progetto 1'].iloc[0],
-                    'durata': city_projects['Tipo di investimento 1'].iloc[0],
-                    'descrizione': city_projects['Descrizione Progetto 1'].iloc[0],
-                    'stato': city_projects['Attivo / Non attivo progetto 1'].iloc[0]
-                }
-                
-                ambito_match1 = project1_data['ambito'] == smart_city_scope
-                durata_match1 = project1_data['durata'] == duration
-                
-                result.append(f"\nProgetto 1: {project1_data['nome']}")
-                result.append(f"Ambito: {project1_data['ambito']} {'✓' if ambito_match1 else '✗'}")
-                result.append(f"Durata: {project1_data['durata']} {'✓' if durata_match1 else '✗'}")
-                result.append(f"Stato: {project1_data['stato']}")
-                
-                project_info1 = {
-                    'Città': city,
-                    'Nome progetto': project1_data['nome'],
-                    'Ambito progetto': project1_data['ambito'],
-                    'Tipo di investimento': project1_data['durata'],
-                    'Descrizione': project1_data['descrizione'],
-                    'Stato': project1_data['stato'],
-                    'Similarità': similarity
-                }
-                
-                if ambito_match1 and durata_match1:
-                    result.append("→ Match perfetto!")
-                    found_projects.append(project_info1)
-                elif ambito_match1 or durata_match1:
-                    result.append("→ Match parziale")
-                    suggested_projects.append(project_info1)
-                
-            except Exception as e:
-                print(f"DEBUG - Errore analisi progetto 1: {str(e)}")
-            
-            # Analisi progetto 2
-            try:
-                project2_data = {
-                    'nome': city_projects['Nome proggetto 2'].iloc[0],
-                    'ambito': city_projects['Ambito progetto 2'].iloc[0],
-                    'durata': city_projects['Tipo di investimento 2'].iloc[0],
-                    'descrizione': city_projects['Descrizione progetto 2'].iloc[0],
-                    'stato': city_projects['Attivo / Non attivo progetto 2'].iloc[0]
-                }
-                
-                ambito_match2 = project2_data['ambito'] == smart_city_scope
-                durata_match2 = project2_data['durata'] == duration
-                
-                result.append(f"\nProgetto 2: {project2_data['nome']}")
-                result.append(f"Ambito: {project2_data['ambito']} {'✓' if ambito_match2 else '✗'}")
-                result.append(f"Durata: {project2_data['durata']} {'✓' if durata_match2 else '✗'}")
-                result.append(f"Stato: {project2_data['stato']}")
-                
-                project_info2 = {
-                    'Città': city,
-                    'Nome progetto': project2_data['nome'],
-                    'Ambito progetto': project2_data['ambito'],
-                    'Tipo di investimento': project2_data['durata'],
-                    'Descrizione': project2_data['descrizione'],
-                    'Stato': project2_data['stato'],
-                    'Similarità': similarity
-                }
-                
-                if ambito_match2 and durata_match2:
-                    result.append("→ Match perfetto!")
-                    found_projects.append(project_info2)
-                elif ambito_match2 or durata_match2:
-                    result.append("→ Match parziale")
-                    suggested_projects.append(project_info2)
-                
-            except Exception as e:
-                print(f"DEBUG - Errore analisi progetto 2: {str(e)}")
+        if project_index is None:
+            project_index = ProjectIndex(progetti_df)
         
-        # Risultati finali
-        result.append("\n" + "="*50 + "\n")
-        result.append("RISULTATI FINALI:")
-        
-        if not found_projects and not suggested_projects:
-            result.append("\n❌ Nessun progetto trovato con i parametri specificati")
-            
-        if found_projects:
-            result.append("\n✅ PROGETTI CON MATCH PERFETTO:")
-            for proj in found_projects:
-                result.extend([
-                    f"\nCittà: {proj['Città']} (Similarità: {proj['Similarità']:.2f}%)",
-                    f"Nome: {proj['Nome progetto']}",
-                    f"Ambito: {proj['Ambito progetto']}",
-                    f"Durata: {proj['Tipo di investimento']}",
-                    f"Stato: {proj['Stato']}",
-                    f"Descrizione: {proj['Descrizione']}"
-                ])
-        
-        if suggested_projects:
-            result.append("\n💡 PROGETTI ALTERNATIVI CONSIGLIATI:")
-            for proj in suggested_projects[:3]:
-                result.extend([
-                    f"\nCittà: {proj['Città']} (Similarità: {proj['Similarità']:.2f}%)",
-                    f"Nome: {proj['Nome progetto']}",
-                    f"Ambito: {proj['Ambito progetto']}",
-                    f"Durata: {proj['Tipo di investimento']}",
-                    f"Stato: {proj['Stato']}",
-                    f"Descrizione: {proj['Descrizione']}"
-                ])
+        # Progetti delle città simili (None se la città non è presente)
+        with stage_timer('match', cities=len(similar_cities[:5])):
+            matches = [
+                (city, similarity, project_index.match(city, smart_city_scope, duration))
+                for city, similarity in similar_cities[:5]
+            ]
         
-        return "\n".join(result)
+        with stage_timer('render'):
+            return _format_project_report(matches, smart_city_scope, duration)
 
     except Exception as e:
-        print(f"DEBUG - Errore principale: {str(e)}")
-        import traceback
-        print(f"DEBUG - Traceback:\n{traceback.format_exc()}")
-        return "⚠ Errore durante la ricerca dei progetti"
+        log.exception("Errore durante la ricerca dei progetti: %s", e)
+        if raise_errors:
+            raise
+        return PROJECT_ERROR
+
+def _format_project_report(matches, smart_city_scope, duration):
+    """Testo del report dei progetti a partire dalle corrispondenze per città."""
+    found_projects = []
+    suggested_projects = []
+    result = []
+    
+    result.append("RICERCA PROGETTI SMART CITY")
+    result.append(f"Ambito richiesto: {smart_city_scope}")
+    result.append(f"Durata richiesta: {duration}\n")
     
-def get_available_funding(provincia, smart_city_scope, finanziamenti_eu_df, categorie_df):
-    """Trova i finanziamenti disponibili per provincia e categoria smart city."""
+    for city, similarity, city_projects in matches:
+        result.append(f"\nANALISI {city} (Similarità: {similarity:.2f}%)")
+
+        # Verifica se la città è presente
+        if city_projects is None:
+            log.debug("Città %s non trovata in progetti_df", city)
+            result.append(f"⚠ {city} non ha progetti nel database")
+            continue
+
+        for project in city_projects:
+            ambito_match = project['ambito_match']
+            durata_match = project['durata_match']
+
+            result.append(f"\nProgetto {project['Numero progetto']}: {project['Nome progetto']}")
+            result.append(f"Ambito: {project['Ambito progetto']} {'✓' if ambito_match else '✗'}")
+            result.append(f"Durata: {project['Tipo di investimento']} {'✓' if durata_match else '✗'}")
+            result.append(f"Stato: {project['Stato']}")
+
+            project_info = {
+                'Città': city,
+                'Nome progetto': project['Nome progetto'],
+                'Ambito progetto': project['Ambito progetto'],
+                'Tipo di investimento': project['Tipo di investimento'],
+                'Descrizione': project['Descrizione'],
+                'Stato': project['Stato'],
+                'Similarità': similarity
+            }
+
+            if ambito_match and durata_match:
+                result.append("→ Match perfetto!")
+                found_projects.append(project_info)
+            elif ambito_match or durata_match:
+                result.append("→ Match parziale")
+                suggested_projects.append(project_info)
+
+    # Risultati finali
+    result.append("\n" + "="*50 + "\n")
+    result.append("RISULTATI FINALI:")
+
+    if not found_projects and not suggested_projects:
+        result.append("\n❌ Nessun progetto trovato con i parametri specificati")
+
+    if found_projects:
+        result.append("\n✅ PROGETTI CON MATCH PERFETTO:")
+        for proj in found_projects:
+            result.extend([
+                f"\nCittà: {proj['Città']} (Similarità: {proj['Similarità']:.2f}%)",
+                f"Nome: {proj['Nome progetto']}",
+                f"Ambito: {proj['Ambito progetto']}",
+                f"Durata: {proj['Tipo di investimento']}",
+                f"Stato: {proj['Stato']}",
+                f"Descrizione: {proj['Descrizione']}"
+            ])
+
+    if suggested_projects:
+        result.append("\n💡 PROGETTI ALTERNATIVI CONSIGLIATI:")
+        for proj in suggested_projects[:3]:
+            result.extend([
+                f"\nCittà: {proj['Città']} (Similarità: {proj['Similarità']:.2f}%)",
+                f"Nome: {proj['Nome progetto']}",
+                f"Ambito: {proj['Ambito progetto']}",
+                f"Durata: {proj['Tipo di investimento']}",
+                f"Stato: {proj['Stato']}",
+                f"Descrizione: {proj['Descrizione']}"
+            ])
+
+    return "\n".join(result)
+
+def find_available_funding(provincia, smart_city_scope, funding_index,
+                           page_size=20, sort_by='Project_EU_Budget', ascending=False, raise_errors=False):
+    """
+    Trova i finanziamenti disponibili per provincia e categoria smart city
+    e li restituisce come FundingResultSet paginato e ordinato per sort_by.
+    In caso di errore il risultato contiene solo il messaggio FUNDING_ERROR,
+    oppure l'eccezione viene rilanciata con raise_errors=True.
+    """
     try:
-        print("\nDEBUG - Analisi finanziamenti:")
-        print(f"Provincia richiesta: {provincia}")
-        print(f"Categoria Smart City originale: {smart_city_scope}")
+        with stage_timer('funding'):
+            # Converti da Smart_Governance a Smart Governance per il confronto
+            smart_city_scope_excel = smart_city_scope.replace('_', ' ')
+            log.debug("Analisi finanziamenti: provincia=%s, categoria=%s (confronto: %s)",
+                      provincia, smart_city_scope, smart_city_scope_excel)
         
-        # Converti da Smart_Governance a Smart Governance per il confronto
-        smart_city_scope_excel = smart_city_scope.replace('_', ' ')
-        print(f"Categoria Smart City convertita per confronto: {smart_city_scope_excel}")
+            # Verifica presenza categoria
+            if not funding_index.has_category(smart_city_scope_excel):
+                log.debug("Categoria %s non trovata tra le %d disponibili",
+                          smart_city_scope_excel, len(funding_index.labels_by_category))
+                return FundingResultSet(message=f"\nNessuna corrispondenza trovata per la categoria {smart_city_scope}")
         
-        # Verifica presenza categoria in categorie_df
-        print(f"\nDEBUG - Categorie disponibili: {categorie_df['Category_Smart'].unique()}")
-        if smart_city_scope_excel not in categorie_df['Category_Smart'].values:
-            print(f"DEBUG - Categoria {smart_city_scope_excel} non trovata in categorie_df")
-            return f"\nNessuna corrispondenza trovata per la categoria {smart_city_scope}"
+            # Verifica presenza provincia
+            if not funding_index.has_province(provincia):
+                log.debug("Provincia %s non trovata tra le %d disponibili",
+                          provincia, len(funding_index.provinces))
+                return FundingResultSet(message=f"\nNessun finanziamento trovato per la provincia {provincia}")
         
-        # Join tra i dataframe per ottenere la corrispondenza categoria
-        categoria_corrispondente = categorie_df[
-            categorie_df['Category_Smart'].str.strip() == smart_city_scope_excel
-        ]['Category_Label'].values
+            # Righe di provincia e categoria dall'indice
+            offsets = funding_index.lookup(provincia, smart_city_scope_excel)
+            log.debug("Finanziamenti trovati: %d", len(offsets))
         
+            if len(offsets) == 0:
+                return FundingResultSet(
+                    message="\nNessun finanziamento disponibile per questa combinazione di provincia e categoria."
+                )
         
-        print(f"\nDEBUG - Categorie corrispondenti trovate: {categoria_corrispondente}")
-        
-        # Verifica presenza provincia
-        print(f"\nDEBUG - Province disponibili: {finanziamenti_eu_df['Region3'].unique()}")
-        if provincia not in finanziamenti_eu_df['Region3'].values:
-            print(f"DEBUG - Provincia {provincia} non trovata in finanziamenti_eu_df")
-            return f"\nNessun finanziamento trovato per la provincia {provincia}"
-        
-        # Filtra i finanziamenti per provincia e categoria
-        finanziamenti_disponibili = finanziamenti_eu_df[
-            (finanziamenti_eu_df['Region3'] == provincia) & 
-            (finanziamenti_eu_df['Category_Label'].isin(categoria_corrispondente))
-        ]
-        
-        print(f"\nDEBUG - Finanziamenti trovati: {len(finanziamenti_disponibili)}")
-        
-        if finanziamenti_disponibili.empty:
-            print("DEBUG - Nessun finanziamento trovato con i criteri specificati")
-            return "\nNessun finanziamento disponibile per questa combinazione di provincia e categoria."
-        
-        # Prepara il testo dei risultati
-        result = f"\nFINANZIAMENTI DISPONIBILI PER LA PROVINCIA {provincia}\n"
-        result += f"CATEGORIA SMART CITY: {smart_city_scope}\n\n"
+            return FundingResultSet(
+                funding_index.funding, offsets, provincia, smart_city_scope,
+                totals=funding_index.summary(provincia, smart_city_scope_excel),
+                page_size=page_size, sort_by=sort_by, ascending=ascending
+            )
+
+    except Exception as e:
+        log.exception("Errore nell'analisi dei finanziamenti: %s", e)
+        if raise_errors:
+            raise
+        return FundingResultSet(message=FUNDING_ERROR)
+
+def get_available_funding(provincia, smart_city_scope, finanziamenti_eu_df, categorie_df, funding_index=None):
+    """
+    Trova i finanziamenti disponibili per provincia e categoria smart city.
+    Se funding_index (FundingIndex) è indicato, i DataFrame non vengono filtrati.
+    Restituisce il report completo nell'ordine del file sorgente.
+    """
+    try:
+        if funding_index is None:
+            funding_index = FundingIndex(finanziamenti_eu_df, categorie_df)
         
-        for idx, finanziamento in finanziamenti_disponibili.iterrows():
-            print(f"\nDEBUG - Elaborazione finanziamento {idx}")
-            try:
-                result += "=" * 50 + "\n"
-                result += f"URL Progetto: {finanziamento['Operation_Unique_Identifier']}\n"
-                result += f"Spesa Totale Ammissibile: {finanziamento['Total_Eligible_Expenditure_amount']:,.2f} €\n"
-                result += f"Budget EU Stanziato: {finanziamento['Project_EU_Budget']:,.2f} €\n"
-            except Exception as e:
-                print(f"DEBUG - Errore nell'elaborazione del finanziamento {idx}: {e}")
-                continue
-            
-        return result
+        results = find_available_funding(provincia, smart_city_scope, funding_index, sort_by=None)
+        return results.to_text()
         
     except Exception as e:
-        print(f"DEBUG - Errore nell'analisi dei finanziamenti: {e}")
-        import traceback
-        print(f"DEBUG - Traceback completo:\n{traceback.format_exc()}")
-        return "Errore nell'analisi dei finanziamenti disponibili"
+        log.exception("Errore nell'analisi dei finanziamenti: %s", e)
+        return FUNDING_ERROR
     
 def validate_fields(entries, budget_entry):
     """Valida i campi input."""